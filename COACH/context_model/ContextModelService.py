@@ -32,6 +32,7 @@ sys.path.append(os.path.join(os.curdir, os.pardir, os.pardir, os.pardir))
 # Coach framework
 from COACH.framework import coach
 from COACH.framework.coach import endpoint
+from COACH.framework import sparql
 
 # Web server framework
 from flask.templating import render_template
@@ -193,7 +194,7 @@ class ContextModelService(coach.Microservice):
         
         result = [{"id": "General", "description": "General information concerning the context in which the decision is made"}]
         for params in query_parameters:
-            query_result = self.get_ontology(db_infos).query(query, initNs={"orion": orion_ns}, initBindings=params)
+            query_result = sparql.query(self.get_ontology(db_infos), "ContextModelService.get_general_context_from_ontology", query, initNs={"orion": orion_ns}, initBindings=params)
             if len(query_result) != 1:
                 raise RuntimeError("There should be exactly one general context in the ontology for the category " + params["context_category"])
             query_result = [e for e in query_result]
@@ -223,8 +224,8 @@ class ContextModelService(coach.Microservice):
                     ORDER BY ?entry_grade_id
         """
         
-        result_query = self.get_ontology(db_infos).query(query, initNs = {"orion": orion_ns}, 
-                                                         initBindings = {"context_category": rdflib.URIRef(context_category)})
+        result_query = sparql.query(self.get_ontology(db_infos), "ContextModelService.get_context_from_ontology", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"context_category": rdflib.URIRef(context_category)})
         
         result = []
         for (entry_ontology_uri, entry_grade_id, entry_description, entry_guideline, entry_type, entry_default_value, entry_min, 
@@ -259,7 +260,7 @@ class ContextModelService(coach.Microservice):
                     }
         """
         
-        query_result = self.get_ontology().query(query, initNs = {"orion": orion_ns}, initBindings = {"entry_ontology_uri": entry_ontology_uri})
+        query_result = sparql.query(self.get_ontology(), "ContextModelService.get_entry_possible_value", query, initNs = {"orion": orion_ns}, initBindings = {"entry_ontology_uri": entry_ontology_uri})
         return [e.toPython() for (e,) in query_result]
     
     def _add_database_value_to_ontology_description(self, context_values, context_description):
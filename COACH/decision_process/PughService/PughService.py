@@ -12,6 +12,7 @@ sys.path.append(os.path.join(os.curdir, os.pardir, os.pardir, os.pardir))
 # Coach framework
 from COACH.framework import coach
 from COACH.framework.coach import endpoint, MicroserviceException
+from COACH.framework import sparql
 
 
 # Web server framework
@@ -91,8 +92,8 @@ class PughService(coach.DecisionProcessService):
         
         result = []
         for class_name in class_name_list:
-            query_result = self._get_ontology(case_db_proxy).query(q, initNs = { "orion": orion_ns }, 
-                                                                   initBindings = { "?class_name": rdflib.URIRef(class_name) })
+            query_result = sparql.query(self._get_ontology(case_db_proxy), "PughService.get_ontology_instances", q, initNs = { "orion": orion_ns }, 
+                                        initBindings = { "?class_name": rdflib.URIRef(class_name) })
             class_result = []
             for line in query_result:
                 if len(returned_information) == 1:
@@ -165,8 +166,8 @@ class PughService(coach.DecisionProcessService):
                     }
         """
         
-        query_result = self._get_ontology(case_db_proxy).query(query, initNs = {"orion": orion_ns}, 
-                                                               initBindings = {"property_ontology_uri": rdflib.URIRef(property_ontology_id)})
+        query_result = sparql.query(self._get_ontology(case_db_proxy), "PughService.get_estimation_methods_name", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"property_ontology_uri": rdflib.URIRef(property_ontology_id)})
         
         result = [e.toPython() for (e,) in query_result]
         property_type = self._get_property_type(property_name)
@@ -199,8 +200,8 @@ class PughService(coach.DecisionProcessService):
                         ?property_ontology_uri orion:type ?property_type .
                     }
         """
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, 
-                                                  initBindings = {"property_name": rdflib.Literal(property_name)})
+        query_result = sparql.query(self._get_ontology(), "PughService.get_property_type", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"property_name": rdflib.Literal(property_name)})
         result = [t.toPython() for (t,) in query_result]
         if len(result) != 1:
             raise RuntimeError("The property " + property_name + " must have exactly 1 type, but " + str(len(result)) + " were found.")
@@ -212,35 +213,46 @@ class PughService(coach.DecisionProcessService):
         return result[0]
     
     
-    def _add_or_replace_criterium(self, db_infos, case_db_proxy, criterium_uri, criterium_name, criterium_weight, criterium_properties_ontology_id_list):
+    def _add_or_replace_criterium(self, db_infos, case_db_proxy, trade_off_method_uri, criterium_uri, criterium_name, criterium_weight, 
+                                  criterium_properties_ontology_id_list):
+        """
+        Creates a criterium if criterium_uri is None, or replaces the name, weight and properties of the criterium otherwise. 
+        All changes are applied with one patch, so that the criterium is left unchanged if one of them fails.
+        A MicroserviceException is raised if one of the properties has not been added to the case.
+        """
         orion_ns = rdflib.Namespace(self.orion_ns)
         
-        try:
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=None, predicate=orion_ns.criterium_property, object_=criterium_uri)
-            for criterium_property_ontology_id in criterium_properties_ontology_id_list:
-                property_uri = case_db_proxy.get_property_uri_from_ontology_id(**db_infos, property_ontology_id=criterium_property_ontology_id)
-                case_db_proxy.add_in_trade_off(**db_infos, subject=property_uri, predicate=orion_ns.criterium_property, object_=criterium_uri)
-    
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.name, object_=None)
-            case_db_proxy.add_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.name, object_=criterium_name, is_object_uri=False)
-            
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.weight, object_=None)
-            case_db_proxy.add_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.weight, object_=criterium_weight, is_object_uri=False)
-        except MicroserviceException:
-            self._delete_criterium(db_infos, case_db_proxy, criterium_uri)
-            raise
+        with case_db_proxy.batch() as batch:
+            properties_uri = [batch.get_property_uri_from_ontology_id(**db_infos, property_ontology_id=criterium_property_ontology_id)
+                              for criterium_property_ontology_id in criterium_properties_ontology_id_list]
+        
+        operations = []
+        if criterium_uri is None:
+            criterium_uri = "_:criterium"
+            operations.append({"operation": "add", "subject": trade_off_method_uri, "predicate": orion_ns.criterium, "object_": criterium_uri})
+        operations.append({"operation": "remove", "subject": None, "predicate": orion_ns.criterium_property, "object_": criterium_uri})
+        for property_uri in properties_uri:
+            operations.append({"operation": "add", "subject": property_uri.value, "predicate": orion_ns.criterium_property, 
+                               "object_": criterium_uri})
+        operations.append({"operation": "set", "subject": criterium_uri, "predicate": orion_ns.name, "object_": criterium_name, 
+                           "is_object_uri": False})
+        operations.append({"operation": "set", "subject": criterium_uri, "predicate": orion_ns.weight, "object_": criterium_weight, 
+                           "is_object_uri": False})
+        case_db_proxy.apply_case_patch(**db_infos, operations=operations)
 
 
     def _delete_criterium(self, db_infos, case_db_proxy, criterium_uri):
         orion_ns = rdflib.Namespace(self.orion_ns)
         
+        operations = []
         criterium_values_list = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.value)
         for criterium_value in criterium_values_list:
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=criterium_value, predicate=None, object_=None)
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=None, predicate=None, object_=criterium_value)
+            operations.append({"operation": "remove", "subject": criterium_value, "predicate": None, "object_": None})
+            operations.append({"operation": "remove", "subject": None, "predicate": None, "object_": criterium_value})
         
-        case_db_proxy.remove_in_trade_off(**db_infos, subject=criterium_uri, predicate=None, object_=None)
-        case_db_proxy.remove_in_trade_off(**db_infos, subject=None, predicate=None, object_=criterium_uri)
+        operations.append({"operation": "remove", "subject": criterium_uri, "predicate": None, "object_": None})
+        operations.append({"operation": "remove", "subject": None, "predicate": None, "object_": criterium_uri})
+        case_db_proxy.apply_case_patch(**db_infos, operations=operations)
 
     def _get_criteria_name_list(self, db_infos, case_db_proxy, trade_off_method_uri):
         orion_ns = rdflib.Namespace(self.orion_ns)
@@ -268,35 +280,51 @@ class PughService(coach.DecisionProcessService):
         result = []
         
         criteria_uri_list = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=trade_off_method_uri, predicate=orion_ns.criterium)
-        for criterium_uri in criteria_uri_list:
-            criterium_name = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.name)[0]
-            criterium_weight = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.weight)[0]
-            criterium_ranking = self._get_criterium_ranking(db_infos, case_db_proxy, criterium_uri, alternatives_uri_to_name_dict)
-            result.append({"criterium_name": criterium_name, "criterium_weight": criterium_weight, "criterium_properties_list": [], 
-                           "ranking": criterium_ranking})
+        
+        # The information of all criteria is fetched in one request
+        with case_db_proxy.batch() as batch:
+            criteria = [{"name": batch.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.name),
+                         "weight": batch.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.weight),
+                         "values": batch.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.value),
+                         "properties": batch.get_subjects_in_trade_off(**db_infos, predicate=orion_ns.criterium_property,
+                                                                       object_=criterium_uri)}
+                        for criterium_uri in criteria_uri_list]
+        criteria_ranking = self._get_criteria_ranking(db_infos, case_db_proxy, [criterium["values"].value for criterium in criteria], 
+                                                      alternatives_uri_to_name_dict)
+        
+        for (criterium, criterium_ranking) in zip(criteria, criteria_ranking):
+            result.append({"criterium_name": criterium["name"].value[0], "criterium_weight": criterium["weight"].value[0], 
+                           "criterium_properties_list": [], "ranking": criterium_ranking})
             
-            criterium_properties_uri_list = case_db_proxy.get_subjects_in_trade_off(**db_infos, predicate=orion_ns.criterium_property,
-                                                                                    object_=criterium_uri)
-            for property_uri in criterium_properties_uri_list:
+            for property_uri in criterium["properties"].value:
                 properties_estimation_method = self._get_properties_estimation_methods(db_infos, case_db_proxy, property_uri, alternatives_list)
                 result[-1]["criterium_properties_list"].append(properties_estimation_method)
         
         return result
     
     
-    def _get_criterium_ranking(self, db_infos, case_db_proxy, criterium_uri, alternatives_uri_to_name_dict):
+    def _get_criteria_ranking(self, db_infos, case_db_proxy, criteria_values_list, alternatives_uri_to_name_dict):
+        """
+        Returns a list with the ranking of each criterium, given the list of the value uris of each criterium.
+        A ranking is a dictionary from alternative names to the value of the criterium for that alternative.
+        """
         orion_ns = rdflib.Namespace(self.orion_ns)
-        criterium_values_list = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.value)
         
-        result = {}
-        for criterium_value_uri in criterium_values_list:
-            criterium_value = case_db_proxy.get_objects_in_trade_off(**db_infos, subject=criterium_value_uri, predicate=orion_ns.value)[0]
-            alternative_uri = case_db_proxy.get_subjects_in_trade_off(**db_infos, predicate=orion_ns.criterium_alternative, 
-                                                                      object_=criterium_value_uri)[0]
-            alternative_name = alternatives_uri_to_name_dict[alternative_uri]
-            
-            result[alternative_name] = criterium_value
-            
+        # The values and alternatives of all criteria are fetched in one request
+        with case_db_proxy.batch() as batch:
+            criteria_values = [[(batch.get_objects_in_trade_off(**db_infos, subject=criterium_value_uri, predicate=orion_ns.value),
+                                 batch.get_subjects_in_trade_off(**db_infos, predicate=orion_ns.criterium_alternative, 
+                                                                 object_=criterium_value_uri))
+                                for criterium_value_uri in criterium_values_list]
+                               for criterium_values_list in criteria_values_list]
+        
+        result = []
+        for criterium_values in criteria_values:
+            result.append({})
+            for (criterium_value, alternative_uri) in criterium_values:
+                alternative_name = alternatives_uri_to_name_dict[alternative_uri.value[0]]
+                result[-1][alternative_name] = criterium_value.value[0]
+        
         return result
             
     def _get_properties_estimation_methods(self, db_infos, case_db_proxy, property_uri, alternatives_list):
@@ -347,11 +375,10 @@ class PughService(coach.DecisionProcessService):
                 return
             
         # A value node for this criterium and alternative does not exist yet, a new one will be created
-        criterium_value_uri = case_db_proxy.add_in_trade_off(**db_infos, subject=criterium_uri, predicate=orion_ns.value, object_=None)
-        case_db_proxy.add_in_trade_off(**db_infos, subject=criterium_value_uri, predicate=orion_ns.value, object_=criterium_value, 
-                                       is_object_uri=False)
-        case_db_proxy.add_in_trade_off(**db_infos, subject=alternative_uri, predicate=orion_ns.criterium_alternative, 
-                                       object_=criterium_value_uri)
+        case_db_proxy.apply_case_patch(**db_infos, operations=[
+            {"operation": "add", "subject": criterium_uri, "predicate": orion_ns.value, "object_": "_:criterium_value"},
+            {"operation": "add", "subject": "_:criterium_value", "predicate": orion_ns.value, "object_": criterium_value, "is_object_uri": False},
+            {"operation": "add", "subject": alternative_uri, "predicate": orion_ns.criterium_alternative, "object_": "_:criterium_value"}])
 
     # Endpoints
 
@@ -389,11 +416,9 @@ class PughService(coach.DecisionProcessService):
         db_infos = {"user_id": user_id, "token": delegate_token, "case_id": case_id}
         case_db_proxy = self.create_proxy(case_db)
         
-        alternative_baseline_list = case_db_proxy.get_subjects_in_trade_off(**db_infos, predicate=orion_ns.baseline, object_=trade_off_method_uri)
-        for alternative_baseline in alternative_baseline_list:
-            case_db_proxy.remove_in_trade_off(**db_infos, subject=alternative_baseline, predicate=orion_ns.baseline, object_=trade_off_method_uri)
-        
-        case_db_proxy.add_in_trade_off(**db_infos, subject=baseline, predicate=orion_ns.baseline, object_=trade_off_method_uri)
+        case_db_proxy.apply_case_patch(**db_infos, operations=[
+            {"operation": "remove", "subject": None, "predicate": orion_ns.baseline, "object_": trade_off_method_uri},
+            {"operation": "add", "subject": baseline, "predicate": orion_ns.baseline, "object_": trade_off_method_uri}])
         return self.matrix_dialogue_transition(user_id, delegate_token, case_db, case_id, trade_off_method_uri)    
     
     
@@ -416,7 +441,6 @@ class PughService(coach.DecisionProcessService):
         and weight which is its weight. The criteria are stored in the case database as a string which represents a Python dictionary on json format,
         assigned to the criteria attribute of the case node. 
         """
-        orion_ns = rdflib.Namespace(self.orion_ns)
         try:
             criterium_properties = dict(request.args)["criterium_properties"]
         except KeyError:
@@ -426,14 +450,11 @@ class PughService(coach.DecisionProcessService):
         case_db_proxy = self.create_proxy(case_db)
         
         
-        criteria_name_list = self._get_criteria_name_list(db_infos, case_db_proxy, trade_off_method_uri)
-        if criterium_name in criteria_name_list:
-            criterium_uri = self._get_criterium_uri_from_name(db_infos, case_db_proxy, trade_off_method_uri, criterium_name)
-        else:
-            criterium_uri = case_db_proxy.add_in_trade_off(**db_infos, subject=trade_off_method_uri, predicate=orion_ns.criterium, object_=None)
-        
+        # If there is no criterium with this name, criterium_uri is None and a new criterium is created
+        criterium_uri = self._get_criterium_uri_from_name(db_infos, case_db_proxy, trade_off_method_uri, criterium_name)
         try:
-            self._add_or_replace_criterium(db_infos, case_db_proxy, criterium_uri, criterium_name, criterium_weight, criterium_properties)
+            self._add_or_replace_criterium(db_infos, case_db_proxy, trade_off_method_uri, criterium_uri, criterium_name, criterium_weight, 
+                                           criterium_properties)
         except MicroserviceException:
             return "Compute an estimation for each property you want to add."
         
@@ -490,7 +511,8 @@ class PughService(coach.DecisionProcessService):
         criterium_uri = self._get_criterium_uri_from_name(db_infos, case_db_proxy, trade_off_method_uri, criterium)
         if action == "Change criterium":
             try:
-                self._add_or_replace_criterium(db_infos, case_db_proxy, criterium_uri, new_name, new_weight, criterium_properties)
+                self._add_or_replace_criterium(db_infos, case_db_proxy, trade_off_method_uri, criterium_uri, new_name, new_weight, 
+                                               criterium_properties)
             except MicroserviceException:
                 return "Compute an estimation for each property you want to add."
             return "Criterium changed!"
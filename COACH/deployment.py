@@ -220,7 +220,9 @@ class AuthenticationService(Service):
                 "logfile": "root.log",
                 "authentication_database": self.authentication,
                 "email": self.email,
-                "secret_data_file_name": "settings/root_secret_data.json"
+                "secret_data_file_name": "settings/root_secret_data.json",
+                "token_lifetime": 43200,
+                "revocation_list": "settings/revoked_tokens.json"
                 }
 
 
@@ -283,7 +285,12 @@ class CaseDatabase(Service):
                 "label": self.label,
                 "authentication_service": configuration.service_url(self.authentication),
                 "secret_data_file_name": "settings/root_secret_data.json",
-                "knowledge_repository": configuration.service_url(self.knowledge_repository)
+                "knowledge_repository": configuration.service_url(self.knowledge_repository),
+                "verbose": False,
+                "id_block_size": 100,
+                "case_cache_max_triples": 200000,
+                "case_store_shards": 1,
+                "token_revocation_poll_interval": 10
                 }
 
 
@@ -469,7 +476,15 @@ class KnowledgeRepositoryService(Service):
                 "port": configuration.service_port(self),
                 "database": self.database,
                 "secret_data_file_name": "../framework/settings/root_secret_data.json",
-                "authentication_service": configuration.service_url(self.authentication_service)
+                "authentication_service": configuration.service_url(self.authentication_service),
+                "feature_store_directory": "feature_store",
+                "similarity_pruning": True,
+                "similarity_workers": 1,
+                "similarity_parallel_threshold": 50000,
+                "similarity_cache_size": 128,
+                "storage_backend": "neo4j",
+                "sqlite_database": "knowledge_repository.db",
+                "token_revocation_poll_interval": 10
                 }
 
     
@@ -757,7 +772,10 @@ class Configuration(object):
                              "description": "Common settings for all classes",
                              "mode": self.mode,
                              "host": self.base_url,
-                             "protocol": self.protocol
+                             "protocol": self.protocol,
+                             "proxy_transport": {"pool_size": 10, "keep_alive": True, "connect_timeout": 10, "read_timeout": 120},
+                             "in_process_calls": True,
+                             "proxy_cache_size": 256
                              }}
         for s in self.services_with_ports.keys():
             result[s.name] = s.settings(self)
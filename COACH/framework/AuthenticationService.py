@@ -12,9 +12,12 @@ import random
 import smtplib
 import string
 import datetime
+import threading
+import time
 
 
 from COACH.framework.coach import Microservice, endpoint
+from COACH.framework import tokens
 
 
 class AuthenticationService(Microservice):
@@ -37,6 +40,8 @@ class AuthenticationService(Microservice):
             fileData = file.read()
         secret_data = json.loads(fileData)
         self.password_hash_salt = secret_data["password_hash_salt"]
+        self.token_secret_key = secret_data["token_secret_key"]
+        self.token_lifetime = self.get_setting("token_lifetime", 12 * 3600)
 
         self.users_filename = self.get_setting("authentication_database")
         self.email_settings = self.get_setting("email")
@@ -51,6 +56,17 @@ class AuthenticationService(Microservice):
             self.users = dict()
             self.save_data()
 
+        # Tokens are self-contained, so logging out or revoking a delegate does not invalidate them by itself.
+        # Instead, the ids of revoked tokens are kept in a revocation list, mapping token id to expiry time, until they expire.
+        # The list is changed and saved under revocation_lock, since requests are served by several threads.
+        self.revocation_list_filename = self.get_setting("revocation_list", "settings/revoked_tokens.json")
+        self.revocation_lock = threading.Lock()
+        try:
+            with open(os.path.join(self.working_directory, self.revocation_list_filename), "r") as file:
+                self.revoked_tokens = json.loads(file.read())
+        except:
+            self.revoked_tokens = dict()
+
 
     def save_data(self):
         """
@@ -70,6 +86,29 @@ class AuthenticationService(Microservice):
             self.users = json.loads(data)
 
 
+    def issue_token(self, user_id, kind, case_id = None):
+        """
+        Returns a new signed token of the given kind ("user" or "delegate") for user_id.
+        """
+        (token, _) = tokens.issue_token(self.token_secret_key, user_id, kind, self.token_lifetime, case_id)
+        return token
+
+
+    def revoke_token(self, token):
+        """
+        Adds the id of token to the revocation list, so that verifiers in other services reject it.
+        Expired entries are removed from the list at the same time.
+        """
+        claims = tokens.decode_token(self.token_secret_key, token)
+        with self.revocation_lock:
+            now = time.time()
+            self.revoked_tokens = {token_id: expiry for (token_id, expiry) in self.revoked_tokens.items() if expiry >= now}
+            if claims:
+                self.revoked_tokens[claims["jti"]] = claims["exp"]
+            with open(os.path.join(self.working_directory, self.revocation_list_filename), "w") as file:
+                file.write(json.dumps(self.revoked_tokens))
+
+
     def get_random_token(self, length):
         """
         Generates a random token, i.e. a string of alphanumeric characters, of the requested length.
@@ -82,7 +121,7 @@ class AuthenticationService(Microservice):
         """
         Returns True if the user's user token matches the provided.
         """
-        return user_id in self.users and self.users[user_id]["user_token"] == user_token
+        return user_id in self.users and self.users[user_id].get("user_token") == user_token
 
 
     def send_email(self, recipient, title, body):
@@ -185,7 +224,7 @@ class AuthenticationService(Microservice):
         If the user_id's user token does not match the provided, None is returned.
         """
         if self.confirm_user_token(user_id, user_token):
-            self.users[user_id].pop("user_token")
+            self.revoke_token(self.users[user_id].pop("user_token"))
             self.save_data()
             return "Ok"
         else:
@@ -222,12 +261,14 @@ class AuthenticationService(Microservice):
     @endpoint("/check_user_password", ["POST"], "application/json")
     def check_user_password(self, user_id, password):
         """
-        Returns a random token if the hash of the given password matches the one stored in the database, 
+        Returns a signed user token if the hash of the given password matches the one stored in the database, 
         and otherwise returns None. The token is also stored in the user database, together with 
-        the date and time of the login.
+        the date and time of the login. A token from a previous login is revoked.
         """
         if user_id in self.users and self.users[user_id]["password_hash"] == self.password_hash(password):
-            user_token = self.get_random_token(20)
+            if "user_token" in self.users[user_id]:
+                self.revoke_token(self.users[user_id]["user_token"])
+            user_token = self.issue_token(user_id, "user")
             self.users[user_id]["user_token"] = user_token
             self.users[user_id]["login_time"] = datetime.datetime.now().isoformat()
             self.save_data()
@@ -326,7 +367,7 @@ class AuthenticationService(Microservice):
 #        return self.users[user_id]["uri"]
 
 
-    @endpoint("/get_user_namespace", ["GET", "POST"], "application/json")
+    @endpoint("/get_user_namespace", ["GET", "POST"], "application/json", pure = True)
     def get_user_namespace(self):
         """
         Returns the namespace for user uri:s.
@@ -337,11 +378,13 @@ class AuthenticationService(Microservice):
     @endpoint("/get_delegate_token", ["POST"], "application/json")
     def get_delegate_token(self, user_id, case_id, user_token):
         """
-        Returns a new delegate token, which is also stored in the user database and associated with a certain case.
+        Returns a new signed delegate token, which is also stored in the user database and associated with a certain case.
         If the user_id's user token does not match the provided, None is returned.
         """
         if self.confirm_user_token(user_id, user_token):
-            delegate_token = self.get_random_token(20)
+            if "delegate" in self.users[user_id]:
+                self.revoke_token(self.users[user_id]["delegate"]["token"])
+            delegate_token = self.issue_token(user_id, "delegate", case_id)
             self.users[user_id]["delegate"] = { "token": delegate_token, "case": case_id }
             self.save_data()
             return delegate_token
@@ -356,7 +399,7 @@ class AuthenticationService(Microservice):
         If the user_id's user token does not match the provided, None is returned.
         """
         if self.confirm_user_token(user_id, user_token):
-            self.users[user_id].pop("delegate")
+            self.revoke_token(self.users[user_id].pop("delegate")["token"])
             self.save_data()
             return "Ok"
         else:
@@ -383,3 +426,15 @@ class AuthenticationService(Microservice):
             return self.users[user_id]["delegate"]["token"] == delegate_token and self.users[user_id]["delegate"]["case"] == case_id
         else:
             return False
+
+
+    @endpoint("/get_revoked_tokens", ["GET", "POST"], "application/json")
+    def get_revoked_tokens(self):
+        """
+        Returns the revocation list, as a list of pairs of token id and expiry time.
+        Services using a TokenVerifier poll this endpoint to learn about tokens revoked before they expire.
+        """
+        with self.revocation_lock:
+            revoked_tokens = list(self.revoked_tokens.items())
+        now = time.time()
+        return [(token_id, expiry) for (token_id, expiry) in revoked_tokens if expiry >= now]
@@ -58,7 +58,7 @@ class DirectoryService(coach.Microservice):
                 file.write(data)
                 
     
-    @endpoint("/get_services", ["GET"], "application/json")
+    @endpoint("/get_services", ["GET"], "application/json", cache_ttl = 60, invalidated_by = ["add_service", "remove_service"])
     def get_services(self, service_type):
         """
         Returns a list of available services of the given type, in json format.
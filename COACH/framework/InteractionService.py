@@ -15,6 +15,7 @@ import subprocess
 # Coach modules
 from COACH.framework import coach
 from COACH.framework.coach import endpoint
+from COACH.framework import sparql
 
 # Web server framework
 from flask import request, session, abort
@@ -261,9 +262,8 @@ class InteractionService(coach.Microservice):
          Get case description
         """  
         activities = {}
-        orion_ns = rdflib.Namespace(self.orion_ns)
-        case_id = session["case_id"]
-        db_infos = {"user_id": session["user_id"], "user_token": session["user_token"], "case_id": case_id}
+        progress = self.case_db_proxy.get_case_progress(user_id = session["user_id"], user_token = session["user_token"], 
+                                                        case_id = session["case_id"])
         
         activities["case_description"] = {
             "link" : "/edit_case_description_dialogue",
@@ -274,10 +274,8 @@ class InteractionService(coach.Microservice):
             "link" : "/add_stakeholder_dialogue",
             "name" : "Add stakeholders",
             "status" : "Not started"}
-        roles_uri = self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.role)
-        # The case owner is always a stakeholder. So we can safely access the first element of the list, as it will never be empty.
-        # Each role node has two link by default: the person who has the role, and a link to say that it is a role
-        if len(roles_uri) > 1 or len(self.case_db_proxy.get_predicate_objects(**db_infos, subject=roles_uri[0])) > 2:
+        # The case owner is always a stakeholder, so the case has at least one role.
+        if progress["roles"] > 1 or progress["roles_details"]:
             activities["stakeholders"]["status"] = "Started"
             
         activities["goal"] = {
@@ -285,21 +283,21 @@ class InteractionService(coach.Microservice):
             "name" : "Describe goal",
             "status" : "Not started"
         }
-        if len(self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.goal)) == 1:
+        if progress["goals"] == 1:
             activities["goal"]["status"] = "Started"
 
         activities["context"] = {
             "link" : "/context_model_request?endpoint=edit_context_dialogue",
             "name" : "Describe context",
             "status" : "Not started"}   
-        if len(self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.context)) == 1:
+        if progress["contexts"] == 1:
             activities["context"]["status"] = "Started"
             
         activities["alternatives"] = {
             "link" : "/add_alternative_dialogue",
             "name" : "Add alternatives",
             "status" : "Not started"}
-        alternatives_number = len(self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.alternative))
+        alternatives_number = progress["alternatives"]
         if alternatives_number > 0:
             activities["alternatives"]["status"] = "Started"
 
@@ -310,7 +308,7 @@ class InteractionService(coach.Microservice):
             "status" : "Not started"}   
         if alternatives_number == 0:
             activities["properties"]["status"] = "Unavailable"
-        elif len(self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.property)) >= 1:
+        elif progress["properties"] >= 1:
             activities["properties"]["status"] = "Started"
 
         activities["tradeoff"] = {
@@ -319,17 +317,17 @@ class InteractionService(coach.Microservice):
             "status" : "Not started"}  
         if alternatives_number < 2:
             activities["tradeoff"]["status"] = "Unavailable"
-        elif len(self.case_db_proxy.get_objects(**db_infos, subject=case_id, predicate=orion_ns.selected_trade_off_method)) == 1:
+        elif progress["selected_trade_off_methods"] == 1:
             activities["tradeoff"]["status"] = "Started"
 
         activities["close"] = {
             "link" : "/close_case_dialogue",
             "name" : "Decide and close case",
             "status" : "Not started"}
-        if self.case_db_proxy.get_value(**db_infos, subject=case_id, predicate=orion_ns.close, object_=None, any_=False):
+        if progress["close"]:
             activities["close"]["status"] = "Started"
 
-        case_title = self.case_db_proxy.get_value(**db_infos, subject=case_id, predicate=orion_ns.title, object_=None, any_=False)
+        case_title = progress["title"]
         if activities["close"]["status"] == "Started":
             status = "Closed"
         else:
@@ -382,8 +380,8 @@ class InteractionService(coach.Microservice):
         
         result = []
         for class_name in class_name_list:
-            query_result = self.get_ontology().query(q, initNs = { "orion": orion_ns }, 
-                                                     initBindings = { "?class_name": rdflib.URIRef(class_name) })
+            query_result = sparql.query(self.get_ontology(), "InteractionService.get_ontology_instances", q, initNs = { "orion": orion_ns }, 
+                                        initBindings = { "?class_name": rdflib.URIRef(class_name) })
             class_result = []
             for line in query_result:
                 class_result.append([line[index].toPython() for index in returned_information])
@@ -428,7 +426,7 @@ class InteractionService(coach.Microservice):
         }
         ORDER BY ?role_title
         """
-        role_categories = self.get_ontology().query(q, initNs = { "orion": orion_ns, "owl": rdflib.OWL })
+        role_categories = sparql.query(self.get_ontology(), "InteractionService.add_stakeholder_dialogue_transition", q, initNs = { "orion": orion_ns, "owl": rdflib.OWL })
         role_categories = [(rc[0].toPython(), rc[1].toPython(), rc[2].toPython().lower().replace(" ", "_")) for rc in role_categories]
         
         
@@ -571,8 +569,7 @@ class InteractionService(coach.Microservice):
         db_infos = {"user_id": session["user_id"], "user_token": session["user_token"], "case_id": case_id}
         
         if not self.case_db_proxy.is_case_in_database(**db_infos):
-            case_graph_description = self.knowledge_repository_proxy.import_case(case_uri=case_id, format_="n3")
-            self.case_db_proxy.import_case(**db_infos, graph_description=case_graph_description, format_="n3")
+            self.case_db_proxy.import_case_from_knowledge_repository(**db_infos)
         
         return self.case_status_dialogue_transition()
     
@@ -679,14 +676,16 @@ class InteractionService(coach.Microservice):
 
     @endpoint("/user_profile_dialogue", ["GET"], "text/html")
     def user_profile_dialogue_transition(self):
-        # Create links to the user's profile
-        user_profile = {'user_name': self.authentication_service_proxy.get_user_name(user_id = session["user_id"]),
-                        'email': self.authentication_service_proxy.get_user_email(user_id = session["user_id"]),
-                        'company_name': self.authentication_service_proxy.get_company_name(user_id = session["user_id"]),
-                        'skype_id': self.authentication_service_proxy.get_skype_id(user_id = session["user_id"]),
-                        'user_phone': self.authentication_service_proxy.get_user_phone(user_id = session["user_id"]),
-                        'location': self.authentication_service_proxy.get_user_location(user_id = session["user_id"]),
-                        'user_bio': self.authentication_service_proxy.get_user_bio(user_id = session["user_id"])}
+        # Create links to the user's profile, fetching all the information in one request
+        with self.authentication_service_proxy.batch() as batch:
+            user_profile = {'user_name': batch.get_user_name(user_id = session["user_id"]),
+                            'email': batch.get_user_email(user_id = session["user_id"]),
+                            'company_name': batch.get_company_name(user_id = session["user_id"]),
+                            'skype_id': batch.get_skype_id(user_id = session["user_id"]),
+                            'user_phone': batch.get_user_phone(user_id = session["user_id"]),
+                            'location': batch.get_user_location(user_id = session["user_id"]),
+                            'user_bio': batch.get_user_bio(user_id = session["user_id"])}
+        user_profile = {key: result.value for (key, result) in user_profile.items()}
         dialogue = render_template("user_profile_dialogue.html", user_profile = user_profile)
         return self.main_menu_transition(main_dialogue = dialogue)
 
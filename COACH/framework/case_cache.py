@@ -0,0 +1,402 @@
+"""
+Created on 17 okt. 2026
+
+The module case_cache contains the in-memory cache of case graphs used by the CaseDatabase.
+
+The triples of each cached case are kept in an InternedStore: every term of the case is stored once, and triples are tuples of
+integer term ids, indexed by subject, predicate and object. Reads, including SPARQL queries, are thereby served from memory.
+
+The stores held by the cache are shared by all requests, and are never changed. Each request gets its own graph for a case, which
+reads from the shared store until the request writes to it, at which point the graph makes a private copy of the store. Writes go
+through to the graph of the case in the triple store before being applied to the private copy, so that the triple store is always
+up to date. The private copy is published in the cache only once the writes of the request have been committed, so that other
+requests never read uncommitted data.
+
+Each case has a version, which is increased when a new content of the case is published, or when the case is changed without going
+through the cache. A store loaded from the triple store, or written by a request, is only published if the version of the case has
+not changed since it was read, and otherwise the case is dropped from the cache, to be reread from the triple store.
+
+The cache is bounded by the total number of cached triples, and the least recently used cases are evicted first. It assumes that
+the cases are only changed by the process holding the cache.
+"""
+
+# Standard libraries
+from collections import OrderedDict
+import threading
+
+# Semantic web framework
+import rdflib
+from rdflib.store import Store
+
+
+class InternedStore(Store):
+
+    """
+    An rdflib store for the triples of one graph, where terms are replaced by integer ids. Each term is counted by the number of
+    triples using it, and released when it is no longer used. The store is not thread safe: it must not be changed once it is
+    shared between threads.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self):
+        super().__init__()
+        # ids maps terms to ids, terms maps ids back to terms, and counts gives the number of triples using each id
+        self.ids = {}
+        self.terms = []
+        self.counts = []
+        self.free_ids = []
+        # indexes contains, for the subject, predicate and object positions, a dictionary from term ids to sets of triples
+        self.triple_set = set()
+        self.indexes = ({}, {}, {})
+
+
+    def copy(self):
+        """
+        Returns a new store with the same triples.
+        """
+        store = InternedStore()
+        store.ids = dict(self.ids)
+        store.terms = list(self.terms)
+        store.counts = list(self.counts)
+        store.free_ids = list(self.free_ids)
+        store.triple_set = set(self.triple_set)
+        store.indexes = tuple({term_id: set(triples) for (term_id, triples) in index.items()} for index in self.indexes)
+        return store
+
+
+    def _intern(self, term):
+        term_id = self.ids.get(term)
+        if term_id is None:
+            if self.free_ids:
+                term_id = self.free_ids.pop()
+                self.terms[term_id] = term
+            else:
+                term_id = len(self.terms)
+                self.terms.append(term)
+                self.counts.append(0)
+            self.ids[term] = term_id
+        self.counts[term_id] += 1
+        return term_id
+
+
+    def _release(self, term_id):
+        self.counts[term_id] -= 1
+        if self.counts[term_id] == 0:
+            del self.ids[self.terms[term_id]]
+            self.terms[term_id] = None
+            self.free_ids.append(term_id)
+
+
+    def _match(self, triple_pattern):
+        """
+        Returns the list of the triples of ids matching triple_pattern, where None matches any term.
+        """
+        pattern = []
+        for term in triple_pattern:
+            if term is None:
+                pattern.append(None)
+            elif term in self.ids:
+                pattern.append(self.ids[term])
+            else:
+                return []
+        # The smallest index set of the bound positions is filtered by the other positions
+        candidates = self.triple_set
+        for (index, term_id) in zip(self.indexes, pattern):
+            if term_id is not None:
+                indexed = index.get(term_id, ())
+                if len(indexed) < len(candidates):
+                    candidates = indexed
+        return [triple for triple in candidates
+                if all(term_id is None or term_id == triple_id for (term_id, triple_id) in zip(pattern, triple))]
+
+
+    def add(self, triple, context, quoted = False):
+        if not self._match(triple):
+            triple_ids = tuple(self._intern(term) for term in triple)
+            self.triple_set.add(triple_ids)
+            for (index, term_id) in zip(self.indexes, triple_ids):
+                index.setdefault(term_id, set()).add(triple_ids)
+        super().add(triple, context, quoted)
+
+
+    def remove(self, triple_pattern, context = None):
+        for triple_ids in self._match(triple_pattern):
+            self.triple_set.discard(triple_ids)
+            for (index, term_id) in zip(self.indexes, triple_ids):
+                index[term_id].discard(triple_ids)
+                if not index[term_id]:
+                    del index[term_id]
+            for term_id in triple_ids:
+                self._release(term_id)
+        super().remove(triple_pattern, context)
+
+
+    def triples(self, triple_pattern, context = None):
+        for triple_ids in self._match(triple_pattern):
+            yield (tuple(self.terms[term_id] for term_id in triple_ids), iter(()))
+
+
+    def __len__(self, context = None):
+        return len(self.triple_set)
+
+
+    def contexts(self, triple = None):
+        return iter(())
+
+
+
+class CopyOnWriteStore(Store):
+
+    """
+    An rdflib store reading from a shared InternedStore, which is copied on the first write. Namespace bindings are kept in the
+    store itself, so that they are never shared.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self.is_private = False
+        self.namespace_prefixes = {}
+        self.prefix_namespaces = {}
+
+
+    def _private_store(self):
+        if not self.is_private:
+            self.store = self.store.copy()
+            self.is_private = True
+        return self.store
+
+
+    def add(self, triple, context, quoted = False):
+        self._private_store().add(triple, context, quoted)
+
+
+    def remove(self, triple_pattern, context = None):
+        self._private_store().remove(triple_pattern, context)
+
+
+    def triples(self, triple_pattern, context = None):
+        # The matches are listed first, since a private store may be changed while they are iterated over
+        return iter(list(self.store.triples(triple_pattern, context)))
+
+
+    def __len__(self, context = None):
+        return len(self.store)
+
+
+    def contexts(self, triple = None):
+        return iter(())
+
+
+    def bind(self, prefix, namespace, override = True):
+        if override or prefix not in self.namespace_prefixes.values():
+            self.prefix_namespaces.pop(self.namespace_prefixes.get(namespace), None)
+            self.namespace_prefixes[namespace] = prefix
+            self.prefix_namespaces[prefix] = namespace
+
+
+    def namespace(self, prefix):
+        return self.prefix_namespaces.get(prefix)
+
+
+    def prefix(self, namespace):
+        return self.namespace_prefixes.get(namespace)
+
+
+    def namespaces(self):
+        return iter(list(self.prefix_namespaces.items()))
+
+
+
+class CachedCaseGraph(rdflib.Graph):
+
+    """
+    The in-memory graph of a case, reading from store, the shared store of the case read at version. Writes are first made to
+    store_graph, the graph of the case in the triple store.
+    """
+
+    def __init__(self, cache, store_graph, store, version):
+        super().__init__(store = CopyOnWriteStore(store), identifier = store_graph.identifier)
+        self.cache = cache
+        self.store_graph = store_graph
+        self.version = version
+
+
+    def add(self, triple):
+        self.store_graph.add(triple)
+        super().add(triple)
+        self.cache.written(self)
+        return self
+
+
+    def addN(self, quads):
+        triples = [(s, p, o) for (s, p, o, c) in quads if c is self]
+        self.store_graph.addN((s, p, o, self.store_graph) for (s, p, o) in triples)
+        super().addN((s, p, o, self) for (s, p, o) in triples)
+        self.cache.written(self)
+        return self
+
+
+    def remove(self, triple):
+        self.store_graph.remove(triple)
+        super().remove(triple)
+        self.cache.written(self)
+        return self
+
+
+    def commit(self):
+        self.store_graph.commit()
+        return self
+
+
+
+class CaseGraphCache():
+
+    """
+    A bounded cache of case graphs, indexed by case id. The graphs of the cases are read from the triple store, where each case
+    is a context, through store_graph, which returns the graph of the store for a case identifier. When the cached graphs contain
+    more than max_triples triples, the least recently used are dropped. If max_triples is 0, the cache is disabled, and the graphs
+    of the triple store are returned.
+
+    Within a request, started by begin_request and ended by end_request, the same graph is returned for a case each time, and the
+    changes of the request are published when the request ends. Outside requests, changes are published at once.
+    """
+
+    def __init__(self, store_graph, max_triples):
+        self.store_graph = store_graph
+        self.max_triples = max_triples
+        # stores maps case identifiers to their shared stores, and versions maps case identifiers to their versions
+        self.stores = OrderedDict()
+        self.versions = {}
+        self.lock = threading.RLock()
+        # local.graphs maps case identifiers to the graphs used by the current request, and local.invalidated is the set of the
+        # cases changed by the request without going through the cache
+        self.local = threading.local()
+
+
+    def _graphs(self):
+        return getattr(self.local, "graphs", None)
+
+
+    def get(self, case_id):
+        """
+        Returns the graph of the case with case_id.
+        """
+        identifier = rdflib.URIRef(case_id)
+        if self.max_triples <= 0:
+            return self.store_graph(identifier)
+        graphs = self._graphs()
+        if graphs is not None and identifier in graphs:
+            return graphs[identifier]
+        with self.lock:
+            store = None if graphs is not None and identifier in self.local.invalidated else self.stores.get(identifier)
+            version = self.versions.get(identifier, 0)
+            if store is not None:
+                self.stores.move_to_end(identifier)
+        store_graph = self.store_graph(identifier)
+        if store is None:
+            # The case is read outside the lock, and only published if its version is unchanged
+            store = InternedStore()
+            for triple in store_graph:
+                store.add(triple, None)
+            if graphs is None:
+                with self.lock:
+                    self._publish(identifier, store, version, False)
+        case_graph = CachedCaseGraph(self, store_graph, store, version)
+        if graphs is not None:
+            graphs[identifier] = case_graph
+        return case_graph
+
+
+    def _publish(self, identifier, store, version, is_written):
+        """
+        Makes store the shared store of identifier, if the version of identifier is still version. Otherwise, if store has been
+        written, the shared store is dropped, since it may be out of date. Returns the new version of identifier. Must be called
+        with the lock.
+        """
+        if self.versions.get(identifier, 0) == version:
+            self.stores[identifier] = store
+            self.stores.move_to_end(identifier)
+            if is_written:
+                self.versions[identifier] = version + 1
+            self._evict()
+        elif is_written:
+            self.stores.pop(identifier, None)
+            self.versions[identifier] = self.versions.get(identifier, 0) + 1
+        return self.versions.get(identifier, 0)
+
+
+    def _evict(self):
+        """
+        Drops the least recently used stores until the cache holds at most max_triples triples. The last used store is kept.
+        """
+        total = sum(len(store) for store in self.stores.values())
+        while total > self.max_triples and len(self.stores) > 1:
+            (_, store) = self.stores.popitem(last = False)
+            total -= len(store)
+
+
+    def written(self, case_graph):
+        """
+        Called when case_graph has been changed. Outside requests, the change is published at once, and the graph reads from the
+        published store until its next write.
+        """
+        graphs = self._graphs()
+        if graphs is None or graphs.get(case_graph.identifier) is not case_graph:
+            cow_store = case_graph.store
+            with self.lock:
+                case_graph.version = self._publish(case_graph.identifier, cow_store.store, case_graph.version, True)
+            cow_store.is_private = False
+
+
+    def begin_request(self):
+        """
+        Starts a request in the current thread.
+        """
+        self.local.graphs = {}
+        self.local.invalidated = set()
+
+
+    def end_request(self, rolled_back):
+        """
+        Ends the request of the current thread, and returns the list of the ids of the cases it changed. If the writes of the request
+        have been committed, the cases read and written by the request are published. Otherwise, they are discarded.
+        """
+        graphs = self._graphs() or {}
+        invalidated = getattr(self.local, "invalidated", None) or set()
+        self.local.graphs = None
+        self.local.invalidated = None
+        written = [identifier for (identifier, case_graph) in graphs.items() if case_graph.store.is_private]
+        with self.lock:
+            for identifier in invalidated:
+                self.stores.pop(identifier, None)
+                self.versions[identifier] = self.versions.get(identifier, 0) + 1
+            if not rolled_back:
+                for (identifier, case_graph) in graphs.items():
+                    if identifier not in invalidated:
+                        case_graph.version = self._publish(identifier, case_graph.store.store, case_graph.version,
+                                                           case_graph.store.is_private)
+                        case_graph.store.is_private = False
+        return [str(identifier) for identifier in set(written) | invalidated]
+
+
+    def invalidate(self, case_id):
+        """
+        Drops the graph of the case with case_id, which has been changed without going through the cache.
+        """
+        identifier = rdflib.URIRef(case_id)
+        graphs = self._graphs()
+        if graphs is not None:
+            graphs.pop(identifier, None)
+            self.local.invalidated.add(identifier)
+        else:
+            with self.lock:
+                self.stores.pop(identifier, None)
+                self.versions[identifier] = self.versions.get(identifier, 0) + 1
@@ -0,0 +1,190 @@
+"""
+Created on 17 okt. 2026
+
+The module case_catalog contains the placement of the cases of the case database in shards, and the catalog of the cases.
+
+The case database may spread the graphs of the cases over several store files, called shards. A new case is placed in the shard
+given by a stable hash of its uri. The first shard is the file of the main store, which also holds the ontology.
+
+The catalog records, for each case, its shard, title, whether it is closed, and its stakeholders. It is used for the queries over
+all cases, which would otherwise need to query every shard, and to find the shard of a case, which may differ from the one given
+by the hash if the number of shards has been changed since the case was placed. It is kept in an SQLite file of its own.
+
+The catalog also holds the counter of the ids of new resources, which are reserved in blocks (see IdAllocator). A reservation is
+committed at once, in a transaction of its own, so that it is kept even if the request needing it is rolled back. It is not written
+to the main store, since a request which has written to the store holds the write lock of its file until the request ends, so that
+a separate connection could not write to it in the meantime.
+"""
+
+# Standard libraries
+import hashlib
+import sqlite3
+import threading
+
+# Semantic web framework
+import rdflib
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cases (case_id TEXT PRIMARY KEY, shard INTEGER NOT NULL, title TEXT, closed INTEGER NOT NULL)
+        WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS stakeholders (case_id TEXT NOT NULL, user_uri TEXT NOT NULL, PRIMARY KEY (case_id, user_uri))
+        WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS stakeholders_user ON stakeholders (user_uri, case_id);
+    CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID;
+"""
+
+
+def hash_shard(case_id, number_of_shards):
+    """
+    Returns the shard of case_id among number_of_shards, given by a hash of its uri which does not change between runs.
+    """
+    return int(hashlib.sha256(str(case_id).encode("utf-8")).hexdigest(), 16) % number_of_shards
+
+
+def shard_file_name(shard):
+    """
+    Returns the name of the store file of shard. The first shard is the file of the main store.
+    """
+    return "coach_case_db.db" if shard == 0 else "coach_case_db_" + str(shard) + ".db"
+
+
+def find_cases(graph, orion_ns):
+    """
+    Returns the list of the ids of the cases in graph, the conjunctive graph of a store, where each case is a context.
+    """
+    orion_ns = rdflib.Namespace(orion_ns)
+    return sorted({str(context.identifier) for (case_id, _, _, context) in graph.quads((None, rdflib.RDF.type, orion_ns.Case, None))
+                   if context is not None and context.identifier == case_id})
+
+
+
+class CaseCatalog():
+
+    """
+    The catalog of the cases of the case database. The connection is shared by all request threads, and used under a lock.
+    """
+
+    def __init__(self, path, orion_ns):
+        self.orion_ns = rdflib.Namespace(orion_ns)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM cases LIMIT 1").fetchone() is None
+
+
+    def shard(self, case_id):
+        """
+        Returns the shard of case_id, or None if it is not in the catalog.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT shard FROM cases WHERE case_id = ?", (str(case_id),)).fetchone()
+        return row[0] if row else None
+
+
+    def largest_shard(self):
+        """
+        Returns the largest shard holding a case, or -1 if the catalog is empty.
+        """
+        with self.lock:
+            return self.connection.execute("SELECT COALESCE(MAX(shard), -1) FROM cases").fetchone()[0]
+
+
+    def contains(self, case_id):
+        return self.shard(case_id) is not None
+
+
+    def update(self, case_id, shard, case_graph):
+        """
+        Records case_id, stored in shard, from its graph case_graph. If the graph no longer describes a case, the case is removed.
+        """
+        case_uri = rdflib.URIRef(case_id)
+        if (case_uri, rdflib.RDF.type, self.orion_ns.Case) not in case_graph:
+            self.remove(case_id)
+            return
+        title = case_graph.value(case_uri, self.orion_ns.title, any = False)
+        closed = bool(case_graph.value(case_uri, self.orion_ns.close, any = False))
+        stakeholders = {str(user_uri) for role in case_graph.objects(case_uri, self.orion_ns.role)
+                        for user_uri in case_graph.objects(role, self.orion_ns.person)}
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO cases (case_id, shard, title, closed) VALUES (?, ?, ?, ?)",
+                                    (str(case_id), shard, None if title is None else str(title), int(closed)))
+            self.connection.execute("DELETE FROM stakeholders WHERE case_id = ?", (str(case_id),))
+            self.connection.executemany("INSERT INTO stakeholders (case_id, user_uri) VALUES (?, ?)",
+                                        [(str(case_id), user_uri) for user_uri in stakeholders])
+
+
+    def remove(self, case_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM cases WHERE case_id = ?", (str(case_id),))
+            self.connection.execute("DELETE FROM stakeholders WHERE case_id = ?", (str(case_id),))
+
+
+    def user_cases(self, user_uri):
+        """
+        Returns the list of the cases having user_uri as stakeholder, as triples (case_id, title, closed).
+        """
+        with self.lock:
+            return [(case_id, title, bool(closed)) for (case_id, title, closed) in self.connection.execute(
+                """ SELECT cases.case_id, cases.title, cases.closed FROM stakeholders JOIN cases ON cases.case_id = stakeholders.case_id
+                    WHERE stakeholders.user_uri = ? AND cases.title IS NOT NULL
+                """, (str(user_uri),))]
+
+
+    def cases(self):
+        """
+        Returns the list of the cases in the catalog, as pairs (case_id, shard).
+        """
+        with self.lock:
+            return self.connection.execute("SELECT case_id, shard FROM cases ORDER BY case_id").fetchall()
+
+
+    def reserve(self, name, count, initial = 0):
+        """
+        Increases the counter name by count, in a transaction of its own, and returns its value before the increase. A counter
+        which has not been used before starts at initial.
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+            start = initial if row is None else max(row[0], initial)
+            self.connection.execute("INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", (name, start + count))
+        return start
+
+
+
+class IdAllocator():
+
+    """
+    Hands out the ids of new resources. The ids are reserved in blocks of block_size ids from the counter "id_counter" of catalog,
+    and handed out from memory. Since each reservation is committed at once, the ids of a block are never handed out again, even if
+    the request reserving it is rolled back, and the unused ids of a block are skipped after a restart. The counter starts at
+    initial, the id counter formerly kept in the main store.
+    """
+
+    def __init__(self, catalog, block_size, initial = 0):
+        self.catalog = catalog
+        self.block_size = max(1, block_size)
+        self.initial = initial
+        self.lock = threading.Lock()
+        self.next_id = 0
+        self.reserved_id_end = 0
+
+
+    def new_id(self):
+        with self.lock:
+            if self.next_id >= self.reserved_id_end:
+                self.next_id = self.catalog.reserve("id_counter", self.block_size, self.initial)
+                self.reserved_id_end = self.next_id + self.block_size
+            resource_id = self.next_id
+            self.next_id += 1
+        return resource_id
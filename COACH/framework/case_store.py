@@ -0,0 +1,215 @@
+"""
+Created on 17 okt. 2026
+
+The module case_store contains the triple store of the case database, an rdflib_sqlalchemy store on a SQLite file.
+
+The database is run in WAL mode, so that readers never wait for the writer, and see the last committed state of the database.
+Each request of the case database is given its own connection, between begin_request and end_request. Reads use the connection
+directly, while the first write of a request starts a transaction, which lasts until the store is rolled back, or until the end
+of the request, where it is committed if the request succeeded. Committing the store (through commit on a graph) does nothing, so
+that the writes of a failing request, including the endpoints it calls in the same thread, are rolled back as a whole.
+
+SQLite allows only one writer at a time, so the writes are serialized by write_lock, which is held during each write transaction.
+Outside requests, for instance when the service starts, each write is its own transaction, as with the rdflib_sqlalchemy store.
+"""
+
+# Standard libraries
+import contextlib
+import os
+import threading
+
+# Semantic web framework
+import rdflib
+import sqlalchemy
+from rdflib_sqlalchemy.store import SQLAlchemy
+
+
+def _configure_connection(dbapi_connection, connection_record):
+    """
+    Sets up each new SQLite connection of the engine for WAL mode.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    # In WAL mode, synchronous NORMAL is safe against corruption, and only syncs the log at checkpoints
+    cursor.execute("PRAGMA synchronous = NORMAL")
+    cursor.close()
+
+
+
+def open_case_store(path, identifier = rdflib.URIRef("coach_case_db")):
+    """
+    Opens a CaseStore on the SQLite file path, which is created if it does not exist, and returns a pair with the store and
+    its conjunctive graph.
+    """
+    store = CaseStore(identifier = identifier)
+    graph = rdflib.ConjunctiveGraph(store = store, identifier = identifier)
+    store.open(rdflib.Literal("sqlite:///" + path), create = not os.path.isfile(path))
+    return (store, graph)
+
+
+
+class RequestConnection():
+
+    """
+    The connection of a request to the store. It stands for the engine of the store in the methods of SQLAlchemy, so that they
+    use this connection rather than a new one, and do not commit their writes.
+    """
+
+    def __init__(self, engine):
+        self.name = engine.name
+        self.engine = engine
+        self.connection = None
+        self.transaction = None
+
+
+    def get_connection(self):
+        if self.connection is None:
+            self.connection = self.engine.connect()
+        return self.connection
+
+
+    def connect(self):
+        return contextlib.nullcontext(self.get_connection())
+
+
+    def begin(self):
+        return contextlib.nullcontext(self.get_connection())
+
+
+
+class CaseStore(SQLAlchemy):
+
+    """
+    The store of the case database. It is shared by all request threads of the service.
+    """
+
+    def __init__(self, identifier, timeout = 30, pool_size = 8):
+        self.local = threading.local()
+        super().__init__(identifier = identifier)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.write_lock = threading.RLock()
+
+
+    @property
+    def engine(self):
+        # Within a request, the methods of SQLAlchemy use the connection of the request
+        request = getattr(self.local, "request", None)
+        return request if request is not None else self.store_engine
+
+
+    @engine.setter
+    def engine(self, engine):
+        self.store_engine = engine
+
+
+    def open(self, configuration, create = True):
+        """
+        Opens the SQLite database with url configuration, using WAL mode. The connections are pooled, so that they are not reopened
+        for each request, and may therefore be used by several threads, one at a time.
+        """
+        result = super().open({"url": str(configuration),
+                               "connect_args": {"check_same_thread": False, "timeout": self.timeout},
+                               "poolclass": sqlalchemy.pool.QueuePool, "pool_size": self.pool_size, "max_overflow": -1}, create)
+        sqlalchemy.event.listen(self.store_engine, "connect", _configure_connection)
+        # The connections made when opening the store are not configured, so they are closed
+        self.store_engine.dispose()
+        return result
+
+
+    def in_request(self):
+        """
+        Returns True if the current thread is in a request.
+        """
+        return getattr(self.local, "request", None) is not None
+
+
+    def begin_request(self):
+        """
+        Gives the current thread its own connection, until end_request is called.
+        """
+        self.local.request = RequestConnection(self.store_engine)
+
+
+    def end_request(self, commit):
+        """
+        Ends the current request, and closes its connection. The pending writes are committed if commit is True, and rolled back
+        otherwise. Returns True if writes were rolled back.
+        """
+        request = self.local.request
+        rolled_back = request.transaction is not None and not commit
+        try:
+            self._end_transaction(commit)
+        finally:
+            self.local.request = None
+            if request.connection is not None:
+                request.connection.close()
+        return rolled_back
+
+
+    @contextlib.contextmanager
+    def writing(self):
+        """
+        Context manager for the writes to the store. Within a request, the first write takes the write lock, and starts the
+        transaction of the request. Otherwise, the write lock is held during the write.
+        """
+        request = getattr(self.local, "request", None)
+        if request is None:
+            with self.write_lock:
+                yield
+        else:
+            if request.transaction is None:
+                self.write_lock.acquire()
+                try:
+                    request.transaction = request.get_connection().begin()
+                except:
+                    self.write_lock.release()
+                    raise
+            yield
+
+
+    def _end_transaction(self, commit):
+        request = getattr(self.local, "request", None)
+        if request is not None and request.transaction is not None:
+            try:
+                if commit:
+                    request.transaction.commit()
+                else:
+                    request.transaction.rollback()
+            finally:
+                request.transaction = None
+                self.write_lock.release()
+
+
+    def commit(self):
+        # Within a request, the writes are committed when the request ends. Outside requests, each write is already committed.
+        pass
+
+
+    def rollback(self):
+        self._end_transaction(False)
+
+
+    def add(self, triple, context = None, quoted = False):
+        with self.writing():
+            super().add(triple, context, quoted)
+
+
+    def addN(self, quads):
+        with self.writing():
+            super().addN(quads)
+
+
+    def remove(self, triple, context):
+        with self.writing():
+            super().remove(triple, context)
+
+
+    def _remove_context(self, context):
+        with self.writing():
+            super()._remove_context(context)
+
+
+    def bind(self, prefix, namespace, override = True):
+        with self.writing():
+            super().bind(prefix, namespace)
@@ -12,16 +12,20 @@ sys.path.append(os.path.join(os.curdir, os.pardir, os.pardir, os.pardir))
 # Coach framework
 from COACH.framework import coach
 from COACH.framework.coach import endpoint
+from COACH.framework import sparql
+from COACH.framework.case_cache import CaseGraphCache
+from COACH.framework.case_store import CaseStore, open_case_store
+from COACH.framework.case_catalog import CaseCatalog, IdAllocator, hash_shard, shard_file_name, find_cases
 
 # Standard libraries
+import hashlib
+import threading
 
 # Semantic web framework
 import rdflib
 from rdflib.namespace import split_uri
-import sqlalchemy
-from rdflib_sqlalchemy.store import SQLAlchemy
 
-from flask import request
+from flask import request, g, has_request_context
 
 from collections import defaultdict
 
@@ -49,7 +53,8 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # See http://docs.sqlalchemy.org/en/latest/dialects/sqlite.html#module-sqlalchemy.dialects.sqlite.pysqlite, under Connect strings
         self.db_uri = "sqlite:///" + filepath
-        self.store = SQLAlchemy(identifier = ident, engine = sqlalchemy.create_engine(self.db_uri))
+        # The store gives each request its own connection, and serializes the writes (see COACH.framework.case_store)
+        self.store = CaseStore(identifier = ident)
         self.graph = rdflib.ConjunctiveGraph(store = self.store, identifier = ident)
         
         # Store case database connection, using user_id and user_token as default parameters to all endpoint calls.
@@ -73,68 +78,249 @@ class CaseDatabase(coach.GraphDatabaseService):
         data_ns = rdflib.Namespace(self.data_ns)
 
         ontology_context = orion_ns.ontology_context
-
-        print("Contexts = " + str([c.identifier for c in self.graph.contexts()]))
-        print("Ontology context = " + str(self.graph.get_context(ontology_context)))
-        print("Number of statements in the database: " + str(len(self.graph)))
-        #print("Namespaces in database: " + str([ns for ns in self.graph.namespaces()]))
-
-        # Remove the ontology data, and reload it to ensure that it is updated to latest version
+        
+        # Diagnostics which scan the whole store are only printed if the verbose setting is true, since they take time on large stores
+        self.verbose = self.get_setting("verbose", False)
+        if self.verbose:
+            print("Contexts = " + str([c.identifier for c in self.graph.contexts()]))
+            print("Number of statements in the database: " + str(len(self.graph)))
+            #print("Namespaces in database: " + str([ns for ns in self.graph.namespaces()]))
+
+        # The ontology is reloaded if Ontology.ttl has changed since it was loaded into the store. This is detected by comparing
+        # a hash of the file contents to the one stored in the ontology context when it was loaded.
+        ontology_path = os.path.join(self.working_directory, os.pardir, "Ontology.ttl")
+        with open(ontology_path, "rb") as file:
+            ontology_fingerprint = rdflib.Literal(hashlib.sha256(file.read()).hexdigest())
         self.ontology = self.graph.get_context(ontology_context)
-        if self.ontology:
+        stored_fingerprint = self.ontology.value(ontology_context, orion_ns.ontology_fingerprint)
+        
+        if stored_fingerprint == ontology_fingerprint:
+            print("Ontology unchanged since it was loaded, fingerprint " + str(ontology_fingerprint))
+        else:
+            # Remove the ontology data, and reload it to ensure that it is updated to latest version
             print("Removing context triples from ontology")
             self.ontology.remove((None, None, None))
-            print("Number of statements in the database after removing ontology: " + str(len(self.graph)))
-            #print("Namespaces in database after removing ontology: " + str([ns for ns in self.graph.namespaces()]))
-        else:
-            print("Creating new ontology")
-            self.ontology = rdflib.Graph(store = self.store, identifier = ontology_context)
-
-        print("Loading new ontology data")
-        ontology_path = os.path.join(self.working_directory, os.pardir, "Ontology.ttl")
-        #print("Namespaces in ontology: " + str([ns for ns in self.ontology.namespaces()]))
-        # An error message is produced when parsing, but the data is still read.
-        # It appears to relate to the binding of namespaces in the ontology.
-        # It could possibly be the addition of a default namespace when one already exists.
-        self.ontology.parse(source = ontology_path, format = "ttl")
-        print("Number of statements in the database after (re)loading ontology: " + str(len(self.graph)))
-        #print("Namespaces in ontology after (re)loading: " + str([ns for ns in self.ontology.namespaces()]))
-
+            if self.verbose:
+                print("Number of statements in the database after removing ontology: " + str(len(self.graph)))
+                #print("Namespaces in database after removing ontology: " + str([ns for ns in self.graph.namespaces()]))
+    
+            print("Loading new ontology data")
+            #print("Namespaces in ontology: " + str([ns for ns in self.ontology.namespaces()]))
+            # An error message is produced when parsing, but the data is still read.
+            # It appears to relate to the binding of namespaces in the ontology.
+            # It could possibly be the addition of a default namespace when one already exists.
+            self.ontology.parse(source = ontology_path, format = "ttl")
+            # The fingerprint is stored last, so that an interrupted load is redone at the next startup
+            self.ontology.add((ontology_context, orion_ns.ontology_fingerprint, ontology_fingerprint))
+            if self.verbose:
+                print("Number of statements in the database after (re)loading ontology: " + str(len(self.graph)))
+                #print("Namespaces in ontology after (re)loading: " + str([ns for ns in self.ontology.namespaces()]))
+            print("Loaded " + self.orion_ns + " ontology with " + str(len(self.ontology)) + " statements")
         
         self.ontology.bind("data", data_ns, override = True)
         self.ontology.bind("orion", orion_ns, override = True)
+
+        if self.verbose:
+            q = """SELECT ?c WHERE { ?c a orion:Case . }"""
+            print("Sample query: Get all the cases in the database")
+            qres = self.graph.query(q)
+            for (a,) in qres:
+                print(a)
+
+        # The stakeholder index maps each case id to the set of uris of its stakeholders. It is kept in memory,
+        # so that authorization checks do not need to query the store. The stakeholders of a case are read on first use,
+        # and updated by the endpoints changing stakeholders. The version of a case is increased by each update, so that a
+        # read on first use which overlaps an update does not replace the updated entry with the stakeholders it read before.
+        self.stakeholder_index_lock = threading.Lock()
+        self.stakeholder_index = dict()
+        self.stakeholder_versions = dict()
         
+        # The graphs of recently used cases are kept in memory, up to case_cache_max_triples triples in total, so that reads do not
+        # query the store. Writes to these graphs go through to the store.
+        self.case_graph_cache = CaseGraphCache(self.case_store_graph, self.get_setting("case_cache_max_triples", 200000))
+
+        # The cases are spread over case_store_shards store files, the first of which is the main store. The other shards are opened 
+        # here. The case catalog records the shard of each case, and is used for the queries over all cases (see COACH.framework.case_catalog).
+        self.number_of_shards = max(1, self.get_setting("case_store_shards", 1))
+        self.case_stores = [self.store]
+        self.case_store_graphs = [self.graph]
+        for shard in range(1, self.number_of_shards):
+            (shard_store, shard_graph) = open_case_store(os.path.join(os.path.dirname(filepath), shard_file_name(shard)), ident)
+            self.case_stores.append(shard_store)
+            self.case_store_graphs.append(shard_graph)
+        catalog_path = os.path.join(os.path.dirname(filepath), "coach_case_catalog.db")
+        is_catalog_new = not os.path.isfile(catalog_path)
+        self.case_catalog = CaseCatalog(catalog_path, self.orion_ns)
+        if is_catalog_new:
+            # The catalog of an existing store is built from the cases found in the shards
+            for (shard, shard_graph) in enumerate(self.case_store_graphs):
+                for case_id in find_cases(shard_graph, self.orion_ns):
+                    self.case_catalog.update(case_id, shard, shard_graph.get_context(rdflib.URIRef(case_id)))
+        if self.case_catalog.largest_shard() >= self.number_of_shards:
+            raise RuntimeError("The case database has cases in shard {0}, but case_store_shards is {1}. Run rebalance_case_shards.py first."
+                               .format(self.case_catalog.largest_shard(), self.number_of_shards))
+
+        # The ids of new resources are reserved in blocks of id_block_size in the case catalog, and handed out from memory. The counting 
+        # continues from the id counter which was formerly kept in the main store.
+        id_counter = self.graph.value(rdflib.URIRef(self.data_ns + "case_db"), rdflib.URIRef(self.data_ns + "id_counter"), None, "0")
+        self.id_allocator = IdAllocator(self.case_catalog, self.get_setting("id_block_size", 100), int(id_counter))
+
+
+    def endpoint_wrapper(self, m, content):
+        """
+        Runs each request in its own connection to each shard of the store. The writes of the request are committed if it succeeds, 
+        and rolled back otherwise. Each shard is committed separately. The cases changed by the request are published in the case 
+        graph cache after the commit. If the request is rolled back, or if some shard fails to commit, they are instead dropped from
+        the cache and reread into the stakeholder index and the case catalog. Endpoints called by other endpoints in the same 
+        thread are part of the calling request.
+        """
+        wrapping = super().endpoint_wrapper(m, content)
+        
+        def request_wrapping():
+            if self.store.in_request():
+                return wrapping()
+            for store in self.case_stores:
+                store.begin_request()
+            self.case_graph_cache.begin_request()
+            response = None
+            # The request counts as rolled back unless all shards have been ended as requested
+            rolled_back = True
+            try:
+                try:
+                    response = wrapping()
+                finally:
+                    try:
+                        commit = response is not None and response.status_code == 200
+                        rolled_back = False
+                        for store in self.case_stores:
+                            rolled_back = store.end_request(commit) or rolled_back
+                    except:
+                        rolled_back = True
+                        raise
+                    finally:
+                        # A failing commit must not leave the other shards in the request
+                        for store in self.case_stores:
+                            if store.in_request():
+                                store.end_request(False)
+            finally:
+                case_ids = self.case_graph_cache.end_request(rolled_back)
+                if rolled_back:
+                    # The cases are reread from the store, since a failing commit may have left some shards committed
+                    for case_id in case_ids:
+                        self.case_graph_cache.invalidate(case_id)
+                        self.update_case_catalog(case_id)
+            return response
+        
+        return request_wrapping
+
+
+    def case_shard(self, case_id):
+        """
+        Returns the shard storing case_id. A case which is not in the case catalog is placed by the hash of its uri.
+        """
+        shard = self.case_catalog.shard(case_id)
+        return hash_shard(case_id, self.number_of_shards) if shard is None else shard
+
+
+    def case_store_graph(self, case_id):
+        """
+        Returns the graph of case_id in the store of its shard, bypassing the case graph cache.
+        """
+        return self.case_store_graphs[self.case_shard(case_id)].get_context(rdflib.URIRef(case_id))
+
+
+    def get_case_graph(self, case_id):
+        """
+        Returns the graph of case_id, from the case graph cache.
+        """
+        return self.case_graph_cache.get(case_id)
 
-        print("Loaded " + self.orion_ns + " ontology with " + str(len(self.ontology)) + " statements")
 
-        q = """SELECT ?c WHERE { ?c a orion:Case . }"""
-        print("Sample query: Get all the cases in the database")
-        qres = self.graph.query(q)
-        for (a,) in qres:
-            print(a)
+    def read_stakeholders(self, case_id):
+        """
+        Returns the set of the uris of the stakeholders of case_id, read from the store.
+        """
+        q = "SELECT ?user_uri WHERE { ?case_id orion:role ?r . ?r orion:person ?user_uri . }"
+        case_graph = self.get_case_graph(case_id)
+        result = sparql.query(case_graph, "CaseDatabase.read_stakeholders", q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                              initBindings = { "case_id": rdflib.URIRef(case_id) })
+        return {str(user_uri) for (user_uri,) in result}
+
+
+    def update_stakeholder_index(self, case_id):
+        """
+        Rereads the stakeholders of case_id from the store into the stakeholder index, after they have been changed.
+        """
+        stakeholders = self.read_stakeholders(case_id)
+        with self.stakeholder_index_lock:
+            # The entry is kept even if it is empty, so that a case with no stakeholders left is not read again on first use
+            self.stakeholder_index[str(case_id)] = stakeholders
+            self.stakeholder_versions[str(case_id)] = self.stakeholder_versions.get(str(case_id), 0) + 1
+
+
+    def update_case_catalog(self, case_id):
+        """
+        Rereads case_id into the stakeholder index and the case catalog, after it has been changed.
+        """
+        self.update_stakeholder_index(case_id)
+        self.case_catalog.update(case_id, self.case_shard(case_id), self.get_case_graph(case_id))
+
+
+    def request_memo(self, key, compute):
+        """
+        Returns the value of compute(), memoized under key for the lifetime of the current request.
+        Outside of a request, compute() is always called.
+        """
+        if not has_request_context():
+            return compute()
+        if "authorization_memo" not in g:
+            g.authorization_memo = dict()
+        if key not in g.authorization_memo:
+            g.authorization_memo[key] = compute()
+        return g.authorization_memo[key]
+
+
+    def check_user_token(self, user_id, user_token):
+        """
+        Returns True if user_token is a valid user token for user_id. The result is memoized for the current request.
+        """
+        return self.request_memo(("user_token", user_id, user_token), 
+                                 lambda: self.token_verifier.check_user_token(user_id, user_token))
+
+
+    def check_delegate_token(self, user_id, delegate_token, case_id):
+        """
+        Returns True if delegate_token is a valid delegate token for user_id and case_id. The result is memoized for the current request.
+        """
+        return self.request_memo(("delegate_token", user_id, delegate_token, str(case_id)), 
+                                 lambda: self.token_verifier.check_delegate_token(user_id, delegate_token, case_id))
+
     
     def is_stakeholder(self, user_id, case_id):
         """
         Returns true if user_id is a stakeholder in case_id.
         """
-        q = "ASK WHERE { ?case_id orion:role ?r . ?r orion:person ?user_id . }"
-        case_graph = self.graph.get_context(rdflib.URIRef(case_id))
-        result = case_graph.query(q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                  initBindings = { "case_id": rdflib.URIRef(case_id),
-                                                  "user_id": rdflib.URIRef(self.authentication_service_proxy.get_user_uri(user_id = user_id)) })
-        return next(r for r in result)
+        with self.stakeholder_index_lock:
+            stakeholders = self.stakeholder_index.get(str(case_id))
+            version = self.stakeholder_versions.get(str(case_id), 0)
+        if stakeholders is None:
+            stakeholders = self.read_stakeholders(case_id)
+            # The stakeholders read are only added if the case has not been updated in the meantime
+            with self.stakeholder_index_lock:
+                if stakeholders and str(case_id) not in self.stakeholder_index and self.stakeholder_versions.get(str(case_id), 0) == version:
+                    self.stakeholder_index[str(case_id)] = stakeholders
+        return self.token_verifier.user_uri(user_id) in stakeholders
 
 
     def is_stakeholder_in_alternative(self, user_id, case_id, alternative):
         """
         Returns true if alternative is linked to a case where the user_id is a stakeholder.
         """
-        q = "ASK WHERE { ?case_id orion:role ?r . ?r orion:person ?user_id . ?case_id orion:alternative ?alternative . }"
-        user_id = rdflib.URIRef(self.authentication_service_proxy.get_user_uri(user_id = user_id))
-        case_graph = self.graph.get_context(rdflib.URIRef(case_id))
-        result = case_graph.query(q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                  initBindings = {"case_id": rdflib.URIRef(case_id), "user_id": user_id, "alternative": rdflib.URIRef(alternative)})
-        return result
+        if not self.is_stakeholder(user_id, case_id):
+            return False
+        orion_ns = rdflib.Namespace(self.orion_ns)
+        case_graph = self.get_case_graph(case_id)
+        return (rdflib.URIRef(case_id), orion_ns.alternative, rdflib.URIRef(alternative)) in case_graph
 
 
     @endpoint("/user_ids", ["POST"], "application/json")
@@ -142,7 +328,7 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Queries the case database and returns an iterable of all user ids (the name the user uses to log in).
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.check_user_token(user_id, user_token):
             # When using rdflib, the user is identified with an uri which consists of the authentication service url + user_id.
             return self.authentication_service_proxy.get_users()
         else:
@@ -155,26 +341,16 @@ class CaseDatabase(coach.GraphDatabaseService):
         user_cases queries the case database and returns a list of the cases connected to the user.
         Each case is represented by a pair indicating case id and case title.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
-            orion_ns = rdflib.Namespace(self.orion_ns)
-            user_id = self.authentication_service_proxy.get_user_uri(user_id = user_id)
-            q = """ SELECT ?case_id ?case_title 
-                    WHERE { 
-                        ?case_id orion:role ?role . 
-                        ?role orion:person ?user_uri . 
-                        ?case_id orion:title ?case_title .
-                    }
-                """
-            result = list(self.graph.query(q, initNs = {"orion": orion_ns}, initBindings = {"user_uri": user_id}))
-            
+        if self.check_user_token(user_id, user_token):
+            user_uri = self.token_verifier.user_uri(user_id)
+            # The cases are found in the case catalog, since they may be in different shards
             opened_cases = []
             closed_cases = []
-            for (case_id, case_title) in result:
-                is_case_open = not self.graph.value(case_id, orion_ns.close, any=False)
-                if is_case_open:
-                    opened_cases.append((case_id, case_title))
-                else:
+            for (case_id, case_title, is_case_closed) in self.case_catalog.user_cases(user_uri):
+                if is_case_closed:
                     closed_cases.append((case_id, case_title))
+                else:
+                    opened_cases.append((case_id, case_title))
             return {"opened_cases": opened_cases, "closed_cases": closed_cases}
         else:
             raise RuntimeError("Invalid user token")
@@ -185,11 +361,11 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns a list of ids of the users who are currently stakeholders in the case with case_id.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.check_user_token(user_id, user_token):
             q = "SELECT ?user_id WHERE { ?case_id orion:role ?r . ?r orion:person ?user_id . }"
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
-            result = case_graph.query(q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                      initBindings = { "case_id": case_id })
+            case_graph = self.get_case_graph(case_id)
+            result = sparql.query(case_graph, "CaseDatabase.case_users", q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                                  initBindings = { "case_id": case_id })
             return [u.toPython() for (u,) in result]
         else:
             raise RuntimeError("Invalid user token")        
@@ -201,14 +377,14 @@ class CaseDatabase(coach.GraphDatabaseService):
         It returns the database id of the new case.
         """
 
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.check_user_token(user_id, user_token):
             # Generate a new uri for the new case by finding the largest current uri and adding 1 to it
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = self.new_uri()
             role = self.new_uri()
 
             # Create a new graph for this case, with the uri as its context identifier
-            case_graph = rdflib.Graph(store = self.store, identifier = rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
 
             # Add title and description
             case_graph.add((case_id, orion_ns.title, rdflib.Literal(title)))
@@ -219,8 +395,9 @@ class CaseDatabase(coach.GraphDatabaseService):
             # Create the relationships to an initial role with initiator as the person
             case_graph.add((case_id, orion_ns.role, role))
             case_graph.add((role, rdflib.RDF.type, orion_ns.Role))
-            case_graph.add((role, orion_ns.person, rdflib.URIRef(self.authentication_service_proxy.get_user_uri(user_id = user_id))))
+            case_graph.add((role, orion_ns.person, rdflib.URIRef(self.token_verifier.user_uri(user_id))))
             case_graph.commit()
+            self.update_case_catalog(case_id)
             return str(case_id)
         else:
             raise RuntimeError("Invalid user token")        
@@ -230,13 +407,14 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Changes the title and description fields of the case with case_id.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             case_graph.set((case_id, orion_ns.title, rdflib.Literal(title)))
             case_graph.set((case_id, orion_ns.description, rdflib.Literal(description)))
             case_graph.commit()
+            self.update_case_catalog(case_id)
             return "Ok"
         else:
             raise RuntimeError("Invalid user token")
@@ -247,15 +425,58 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns a tuple containing the case title and description for the case with case_id.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             title = case_graph.value(case_id, orion_ns.title, None, "")
             description = case_graph.value(case_id, orion_ns.description, None, "")
             return (title, description)
         else:
             raise RuntimeError("Invalid user token")
+
+
+    @endpoint("/get_case_progress", ["GET"], "application/json")
+    def get_case_progress(self, user_id, user_token, case_id):
+        """
+        Returns a summary of the progress of the case with case_id, used for the case status dialogue. It is a dictionary with 
+        the case title, whether the case is closed, the number of roles, goals, contexts, alternatives, properties and selected 
+        trade-off methods, and whether any role has more information than the person holding it.
+        """
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            orion_ns = rdflib.Namespace(self.orion_ns)
+            case_id = rdflib.URIRef(case_id)
+            case_graph = self.get_case_graph(case_id)
+            
+            query = """SELECT ?predicate (COUNT(?object) AS ?count) (SAMPLE(?object) AS ?value)
+                        WHERE {
+                            ?case_id ?predicate ?object .
+                            FILTER (?predicate IN (orion:title, orion:close, orion:role, orion:goal, orion:context, 
+                                                   orion:alternative, orion:property, orion:selected_trade_off_method))
+                        }
+                        GROUP BY ?predicate
+                    """
+            query_result = sparql.query(case_graph, "CaseDatabase.get_case_progress", query, initNs = { "orion": orion_ns }, initBindings = { "case_id": case_id })
+            counts = defaultdict(int)
+            values = {}
+            for (predicate, count, value) in query_result:
+                counts[predicate] = count.toPython()
+                values[predicate] = value.toPython()
+            
+            # Each role node has two links by default: the person who has the role, and a link to say that it is a role
+            roles_details = any(len(list(case_graph.predicate_objects(role))) > 2 for role in case_graph.objects(case_id, orion_ns.role))
+            
+            return {"title": values.get(orion_ns.title), 
+                    "close": bool(values.get(orion_ns.close, False)),
+                    "roles": counts[orion_ns.role],
+                    "roles_details": roles_details,
+                    "goals": counts[orion_ns.goal],
+                    "contexts": counts[orion_ns.context],
+                    "alternatives": counts[orion_ns.alternative],
+                    "properties": counts[orion_ns.property],
+                    "selected_trade_off_methods": counts[orion_ns.selected_trade_off_method]}
+        else:
+            raise RuntimeError("Invalid user token")
         
 
     @endpoint("/add_stakeholder", ["POST"], "application/json")
@@ -264,17 +485,18 @@ class CaseDatabase(coach.GraphDatabaseService):
         Adds a user as a stakeholder to the case. 
         """
         #TODO: Implements "if the user is already a stakeholder, nothing is changed" ?
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
             role = self.new_uri()
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
 
             # Create the relationships to an initial role with initiator as the person
             case_graph.add((case_id, orion_ns.role, role))
             case_graph.add((role, rdflib.RDF.type, orion_ns.Role))
             case_graph.add((role, orion_ns.person, rdflib.URIRef(stakeholder)))
             case_graph.commit()
+            self.update_case_catalog(case_id)
 
             return "Ok"
         else:
@@ -282,9 +504,9 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/change_stakeholder", ["POST"], "application/json")
     def change_stakeholder(self, user_id, user_token, case_id, role_property, stakeholder, values_list):  
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             orion_ns = rdflib.Namespace(self.orion_ns)
             
             query = """\
@@ -294,8 +516,8 @@ class CaseDatabase(coach.GraphDatabaseService):
                 ?role_uri orion:person ?stakeholder_uri .
             }
             """
-            query_result = case_graph.query(query, initNs={"orion": orion_ns},
-                                            initBindings={"case_id": case_id, "stakeholder_uri": rdflib.URIRef(stakeholder)})
+            query_result = sparql.query(case_graph, "CaseDatabase.change_stakeholder", query, initNs={"orion": orion_ns},
+                                        initBindings={"case_id": case_id, "stakeholder_uri": rdflib.URIRef(stakeholder)})
             if len(query_result) > 1 or len(query_result) == 0:
                 raise RuntimeError("There must be exactly one role for the person " + str(stakeholder) + " but " +
                                    str(len(query_result)) + " were found.")
@@ -305,15 +527,16 @@ class CaseDatabase(coach.GraphDatabaseService):
             case_graph.remove((role_uri, role_property, None))
             for value in values_list:
                 case_graph.add((role_uri, role_property, rdflib.URIRef(value)))
+            self.update_case_catalog(case_id)
         else:
             raise RuntimeError("Invalid user token")
         
     @endpoint("/get_stakeholder", ["GET"], "application/json")
     def get_stakeholder(self, user_id, user_token, case_id, role_properties_list):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):              
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):              
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             query = """\
             SELECT ?person_uri ?person_role
@@ -325,8 +548,8 @@ class CaseDatabase(coach.GraphDatabaseService):
             """
             result = defaultdict(lambda: defaultdict(list))
             for role_property in role_properties_list:
-                query_result = case_graph.query(query, initNs={"orion": orion_ns},
-                                                initBindings={"case_id": case_id, "role_property": rdflib.URIRef(role_property)})
+                query_result = sparql.query(case_graph, "CaseDatabase.get_stakeholder", query, initNs={"orion": orion_ns},
+                                            initBindings={"case_id": case_id, "role_property": rdflib.URIRef(role_property)})
                 
                 for (person_uri, person_role) in query_result:
                     result[person_uri.toPython()][role_property].append(person_role.toPython())
@@ -337,10 +560,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/add_case_decision", ["POST"], "application/json")
     def add_case_decision(self, user_id, user_token, case_id, selected_alternative_uri, comments):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             case_id = rdflib.URIRef(case_id)
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             case_graph.set((case_id, orion_ns.comments, rdflib.Literal(comments)))
             case_graph.remove((case_id, orion_ns.selected_alternative, None))
@@ -355,14 +578,14 @@ class CaseDatabase(coach.GraphDatabaseService):
         Adds a decision alternative and links it to the case.
         """
 
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             query = " ASK WHERE {?case_id orion:alternative ?alternative_uri . ?alternative_uri orion:title ?alternative_name . }"
-            query_result = case_graph.query(query, initNs={"orion": orion_ns},
-                                            initBindings={"case_id": case_id, "alternative_name": rdflib.Literal(title)})
+            query_result = sparql.query(case_graph, "CaseDatabase.add_alternative", query, initNs={"orion": orion_ns},
+                                        initBindings={"case_id": case_id, "alternative_name": rdflib.Literal(title)})
             if query_result.askAnswer:
                 raise RuntimeError("An alternative with the name {0} already exists in the database".format(title))
             
@@ -383,10 +606,10 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/add_property", ["POST"], "application/json")
     def add_property(self, user_id, user_token, case_id, alternative_uri, property_ontology_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             #property_ontology_id = rdflib.Literal(property_ontology_id)
             
             property_uri = case_graph.value(None, orion_ns.ontology_id, property_ontology_id, None, False)
@@ -407,10 +630,10 @@ class CaseDatabase(coach.GraphDatabaseService):
     def add_estimation(self, user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id, value,
                        estimation_parameters, used_properties_to_estimation_method_ontology_id):
         #TODO: Make of this method a single transaction (included sub methods call), with rollback if an error occurred.
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):              
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):              
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             #Check whether an estimation has already been computed
             estimation_uri = self.get_estimation_uri(user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id)
@@ -435,7 +658,7 @@ class CaseDatabase(coach.GraphDatabaseService):
     def _add_estimation_parameters(self, case_id, estimation_uri, parameter_name_to_value_dict):
         case_id = rdflib.URIRef(case_id)
         estimation_uri = rdflib.URIRef(estimation_uri)
-        case_graph = self.graph.get_context(case_id)
+        case_graph = self.get_case_graph(case_id)
         orion_ns = rdflib.Namespace(self.orion_ns)
 
         query = """SELECT ?parameter ?parameter_name
@@ -445,8 +668,8 @@ class CaseDatabase(coach.GraphDatabaseService):
             ?parameter orion:name ?parameter_name
         }
         """
-        result = case_graph.query(query, initNs = {"orion": orion_ns},
-                                  initBindings = {"case_id": case_id, "estimation": estimation_uri})
+        result = sparql.query(case_graph, "CaseDatabase.add_estimation_parameters", query, initNs = {"orion": orion_ns},
+                              initBindings = {"case_id": case_id, "estimation": estimation_uri})
         
         parameter_name_to_uri_dict = {}
         for parameter_uri, parameter_name in result:
@@ -476,7 +699,7 @@ class CaseDatabase(coach.GraphDatabaseService):
         
         self.remove_datatype_property(user_id, user_token, case_id, estimation_uri, orion_ns.use_estimation)
         
-        case_graph = self.graph.get_context(case_id)
+        case_graph = self.get_case_graph(case_id)
         for property_uri in used_properties_to_estimation_method_ontology_id:
             used_estimation_uri = self.get_estimation_uri(user_id, user_token, case_id, alternative_uri, property_uri,
                                                           used_properties_to_estimation_method_ontology_id[property_uri])
@@ -484,7 +707,7 @@ class CaseDatabase(coach.GraphDatabaseService):
             
     @endpoint("/remove_estimation", ["POST"], "application/json")
     def remove_estimation(self, user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             estimation_uri = self.get_estimation_uri(user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id)
             if estimation_uri is None:
                 return
@@ -498,7 +721,7 @@ class CaseDatabase(coach.GraphDatabaseService):
     def _remove_estimation_parameters(self, user_id, user_token, case_id, estimation_uri):
         case_id = rdflib.URIRef(case_id)
         estimation_uri = rdflib.URIRef(estimation_uri)
-        case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        case_graph = self.get_case_graph(case_id)
 
         query_parameters = """  SELECT ?parameter_uri
                                     WHERE {
@@ -506,15 +729,15 @@ class CaseDatabase(coach.GraphDatabaseService):
                                         ?case_id orion:parameter ?parameter_uri .
                                     }
                                 """
-        parameter_uri_list = list(case_graph.query(query_parameters, initNs = {"orion": rdflib.Namespace(self.orion_ns)},
-                                                   initBindings = {"case_id": case_id, "estimation_uri": rdflib.URIRef(estimation_uri)}))
+        parameter_uri_list = list(sparql.query(case_graph, "CaseDatabase.remove_estimation_parameters", query_parameters, initNs = {"orion": rdflib.Namespace(self.orion_ns)},
+                                               initBindings = {"case_id": case_id, "estimation_uri": rdflib.URIRef(estimation_uri)}))
         for (parameter_uri,) in parameter_uri_list:
             self.remove_resource(user_id, user_token, case_id, parameter_uri)
             
     
     def _manage_estimation_up_to_date_property(self, case_id, estimation_uri):
         orion_ns = rdflib.Namespace(self.orion_ns)
-        case_graph = self.graph.get_context(case_id)
+        case_graph = self.get_case_graph(case_id)
         
         dependents_estimation_uri_list = case_graph.subjects(orion_ns.use_estimation, estimation_uri)
         for dependent_estimation_uri in dependents_estimation_uri_list:
@@ -523,11 +746,11 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/get_alternative_from_property_ontology_id", ["GET"], "application/json")
     def get_alternative_from_property_ontology_id(self, user_id, token, case_id, property_ontology_id):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
 
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
 
             query = """SELECT ?alternative 
                         WHERE {
@@ -536,8 +759,8 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?property orion:ontology_id ?property_ontology_id
                         } 
                     """
-            result = case_graph.query(query, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                         initBindings = { "property_ontology_id": property_ontology_id })
+            result = sparql.query(case_graph, "CaseDatabase.get_alternative_from_property_ontology_id", query, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                                     initBindings = { "property_ontology_id": property_ontology_id })
             result = [e.toPython() for (e,) in result]
             return result
         else:
@@ -545,35 +768,35 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/get_alternative_from_property_uri", ["GET"], "application/json")
     def get_alternative_from_property_uri(self, user_id, token, case_id, property_uri):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             return list(case_graph.objects(property_uri, orion_ns.belong_to))
         else:
             raise RuntimeError("Invalid user or delegate token")
         
     @endpoint("/get_property_ontology_id_from_uri", ["GET"], "application/json")
     def get_property_ontology_id_from_uri(self, user_id, token, case_id, property_uri):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             return case_graph.value(rdflib.URIRef(property_uri), orion_ns.ontology_id, any=False).toPython()
         else:
             raise RuntimeError("Invalid user or delegate token")
         
     @endpoint("/get_estimation_uri", ["GET"], "application/json")
     def get_estimation_uri(self, user_id, token, case_id, alternative_uri, property_uri, estimation_method_ontology_id):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if property_uri is None:
                 return None
             
             alternative_uri = rdflib.URIRef(alternative_uri)
             property_uri = rdflib.URIRef(property_uri)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             query = """SELECT ?estimation 
                         WHERE {
@@ -583,10 +806,10 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?estimation orion:ontology_id ?estimation_method_ontology_id
                         } 
                     """
-            result = list(case_graph.query(query, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                           initBindings = { "alternative_uri": alternative_uri, "property": property_uri, 
-                                                           "estimation_method_ontology_id": estimation_method_ontology_id, 
-                                                           "case_id": case_id }))
+            result = list(sparql.query(case_graph, "CaseDatabase.get_estimation_uri", query, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                                       initBindings = { "alternative_uri": alternative_uri, "property": property_uri, 
+                                                       "estimation_method_ontology_id": estimation_method_ontology_id, 
+                                                       "case_id": case_id }))
             if len(result) > 1:
                 raise RuntimeError("At most one estimation should point to (alternative: " + str(alternative_uri) + ", property: " + 
                                    str(property_uri) + ", estimation method ontology id" + str(estimation_method_ontology_id) + 
@@ -610,20 +833,67 @@ class CaseDatabase(coach.GraphDatabaseService):
             "up_to_date". If no estimation are found, return None.
         """
         
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             estimation_uri = self.get_estimation_uri(user_id, token, case_id, alternative_uri, property_uri, estimation_method_ontology_id)
             if estimation_uri is None:
                 return None
             
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             
             estimation_value = case_graph.value(estimation_uri, orion_ns.value, any=False).toPython()
             estimation_up_to_date = case_graph.value(estimation_uri, orion_ns.up_to_date, any=False).toPython()
             return {"value": estimation_value, "up_to_date": estimation_up_to_date}
         else:
             raise RuntimeError("Invalid user or delegate token")
+
+    @endpoint("/get_estimation_matrix", ["GET"], "application/json")
+    def get_estimation_matrix(self, user_id, token, case_id):
+        """
+        OUTPUT:
+            All the estimations of the case, retrieved with a single query. The result is a dictionary, in which the keys are the 
+            ontology ids of the properties added to at least one alternative of the case. Each value is a dictionary with the keys
+            "alternatives", the list of uris of the alternatives the property has been added to, and "estimations", a dictionary 
+            mapping alternative uris to dictionaries, which map estimation method ontology ids to the same kind of dictionary as 
+            returned by get_estimation_value.
+        """
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
+            case_id = rdflib.URIRef(case_id)
+            case_graph = self.get_case_graph(case_id)
+            
+            query = """SELECT ?property_ontology_id ?alternative ?estimation_method_ontology_id ?value ?up_to_date
+                        WHERE {
+                            ?case_id orion:alternative ?alternative .
+                            ?property orion:belong_to ?alternative .
+                            ?property orion:ontology_id ?property_ontology_id .
+                            OPTIONAL {
+                                ?case_id orion:estimation ?estimation .
+                                ?estimation orion:belong_to_alternative ?alternative .
+                                ?estimation orion:belong_to_property ?property .
+                                ?estimation orion:ontology_id ?estimation_method_ontology_id .
+                                ?estimation orion:value ?value .
+                                ?estimation orion:up_to_date ?up_to_date
+                            }
+                        } 
+                    """
+            query_result = sparql.query(case_graph, "CaseDatabase.get_estimation_matrix", query, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                                        initBindings = { "case_id": case_id })
+            
+            result = {}
+            for (property_ontology_id, alternative, estimation_method_ontology_id, value, up_to_date) in query_result:
+                property_entry = result.setdefault(property_ontology_id.toPython(), {"alternatives": [], "estimations": {}})
+                alternative = alternative.toPython()
+                if alternative not in property_entry["alternatives"]:
+                    property_entry["alternatives"].append(alternative)
+                if estimation_method_ontology_id is not None:
+                    estimations = property_entry["estimations"].setdefault(alternative, {})
+                    estimations[estimation_method_ontology_id.toPython()] = {"value": value.toPython(), 
+                                                                             "up_to_date": up_to_date.toPython()}
+            return result
+        else:
+            raise RuntimeError("Invalid user or delegate token")
     
     @endpoint("/get_estimation_parameters", ["GET"], "application/json")
     def get_estimation_parameters(self, user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id):
@@ -638,13 +908,13 @@ class CaseDatabase(coach.GraphDatabaseService):
             Return an empty dictionary if no estimation was found for the triplet (alternative, property, estimation method's id)
             or if no parameters exist for this estimation.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             estimation_uri = self.get_estimation_uri(user_id, user_token, case_id, alternative_uri, property_uri, estimation_method_ontology_id)
             if estimation_uri is None:
                 return {}
             
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             
             query = """SELECT ?parameter_name ?parameter_value
                         WHERE {
@@ -653,7 +923,7 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?parameter orion:name ?parameter_name .
                         }
             """
-            query_result = case_graph.query(query, initNs = {"orion": orion_ns}, initBindings = {"estimation_uri": estimation_uri})
+            query_result = sparql.query(case_graph, "CaseDatabase.get_estimation_parameters", query, initNs = {"orion": orion_ns}, initBindings = {"estimation_uri": estimation_uri})
             
             return {parameter_name.toPython(): parameter_value.toPython() for (parameter_name, parameter_value) in query_result}
         else:
@@ -669,12 +939,12 @@ class CaseDatabase(coach.GraphDatabaseService):
             The dictionary is from the property ontology's id to the estimation method ontology's id. 
             If the provided estimation_uri is None, return an empty dictionary.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             if estimation_uri is None:
                 return {}
             
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             
             query = """SELECT ?property_ontology_id ?estimation_method_ontology_id
                         WHERE {
@@ -684,7 +954,7 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?property_uri orion:ontology_id ?property_ontology_id
                         }
             """
-            query_result = case_graph.query(query, initNs = {"orion": orion_ns}, initBindings = {"estimation_uri": estimation_uri})
+            query_result = sparql.query(case_graph, "CaseDatabase.get_estimation_used_properties", query, initNs = {"orion": orion_ns}, initBindings = {"estimation_uri": estimation_uri})
             
             result = {}
             for (property_ontology_id, estimation_method_ontology_id) in query_result:
@@ -696,11 +966,11 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/get_property_uri_from_ontology_id", ["GET"], "application/json")
     def get_property_uri_from_ontology_id(self, user_id, token, case_id, property_ontology_id):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             query = """ SELECT ?property_uri
                         WHERE {
@@ -708,7 +978,7 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?property_uri orion:ontology_id ?property_ontology_id .
                         }
             """
-            query_result = list(case_graph.query(query, initNs={"orion": orion_ns}, initBindings={"property_ontology_id": property_ontology_id}))
+            query_result = list(sparql.query(case_graph, "CaseDatabase.get_property_uri_from_ontology_id", query, initNs={"orion": orion_ns}, initBindings={"property_ontology_id": property_ontology_id}))
             
             if len(query_result) > 1:
                 raise RuntimeError("There must be at most one property with the ontology id {0}, but {1} were found."
@@ -721,10 +991,10 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/get_properties_ontology_id_from_uri", ["GET"], "application/json")
     def get_properties_ontology_id_from_uri(self, user_id, token, case_id, properties_uri_list):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             
             
             return [case_graph.value(rdflib.URIRef(property_uri), orion_ns.ontology_id, None, None, False) for property_uri in properties_uri_list]
@@ -737,10 +1007,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns the trade off method url of the case, or None if no trade off method has been selected.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             selected_trade_off_method = case_graph.value(case_id, orion_ns.selected_trade_off_method)
             if selected_trade_off_method is None:
@@ -754,10 +1024,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Changes the trade off method url associated with a case.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             microservice_url = rdflib.Literal(microservice_url)
             
             case_graph.remove((case_id, orion_ns.selected_trade_off_method, None))
@@ -767,8 +1037,8 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?trade_off_method_uri orion:microservice_url ?microservice_url .
                         }
             """
-            query_result = list(case_graph.query(query, initNs={"orion": orion_ns},
-                                                 initBindings={"case_id": case_id, "microservice_url": microservice_url}))
+            query_result = list(sparql.query(case_graph, "CaseDatabase.change_selected_trade_off_method", query, initNs={"orion": orion_ns},
+                                             initBindings={"case_id": case_id, "microservice_url": microservice_url}))
             
             if len(query_result) > 1:
                 raise RuntimeError("There must be a unique trade off method with the microservice url {0}.".format(microservice_url))
@@ -790,7 +1060,11 @@ class CaseDatabase(coach.GraphDatabaseService):
             raise RuntimeError("Invalid user token")
         
     
-    def _is_child(self, case_id, parent, child):
+    def _is_child(self, case_id, parent, child, case_graph = None):
+        """
+        Returns True if child can be reached from parent in the graph of the case. If case_graph is provided, it is used
+        instead of the graph of the case in the store.
+        """
         if not isinstance(parent, rdflib.term.URIRef) and not isinstance(child, (rdflib.term.Literal, rdflib.term.URIRef)):
             raise RuntimeError("parent must be a URIRef, child must either be a URIRef or a Literal, but they are {0}, {1}."
                                .format(parent.__class__, child.__class__))
@@ -798,31 +1072,33 @@ class CaseDatabase(coach.GraphDatabaseService):
         if isinstance(child, rdflib.term.Literal):
             return False
             
-        case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if case_graph is None:
+            case_graph = self.get_case_graph(case_id)
         query = """ ASK WHERE {
                     ?parent (<>|!<>)* ?child .
                 }
         """
-        query_result = case_graph.query(query, initBindings={"parent": parent, "child": child})
+        query_result = sparql.query(case_graph, "CaseDatabase.is_child", query, initBindings={"parent": parent, "child": child})
         return query_result.askAnswer
     
     
-    def _is_modification_by_trade_off_method_allowed(self, case_id, subject, object_):
+    def _is_modification_by_trade_off_method_allowed(self, case_id, subject, object_, case_graph = None):
         orion_ns = rdflib.Namespace(self.orion_ns)
         case_id = rdflib.URIRef(case_id)
-        case_graph = self.graph.get_context(case_id)
+        if case_graph is None:
+            case_graph = self.get_case_graph(case_id)
             
         current_trade_off_method = case_graph.value(case_id, orion_ns.selected_trade_off_method)
         if current_trade_off_method is None:
             raise RuntimeError("No trade off method selected")
         
-        if object_ is not None and self._is_child(case_id, case_id, object_):
-            if not self._is_child(case_id, current_trade_off_method, object_):
+        if object_ is not None and self._is_child(case_id, case_id, object_, case_graph):
+            if not self._is_child(case_id, current_trade_off_method, object_, case_graph):
                 raise RuntimeError("The object of the triplet must either be a new uri or a child of the trade-off method.")
             
             return True
         else: # object_ is not a child of case_id => it is a new uri or a literal, so the subject need to be a child of the trade-off method
-            if not self._is_child(case_id, current_trade_off_method, subject):
+            if not self._is_child(case_id, current_trade_off_method, subject, case_graph):
                 raise RuntimeError("The subject of the triplet must be a child of the trade-off method when the object is not in the graph.")
             
             return True
@@ -830,12 +1106,12 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/add_in_trade_off", ["POST"], "application/json")
     def add_in_trade_off(self, user_id, token, case_id, subject, predicate, object_, is_object_uri=True):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if subject is None or predicate is None:
                 raise TypeError("Can not add a triplet with a None subject or predicate")
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             subject = rdflib.URIRef(subject)
             predicate = rdflib.URIRef(predicate)
             if object_ is None:
@@ -853,10 +1129,10 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/remove_in_trade_off", ["POST"], "application/json")
     def remove_in_trade_off(self, user_id, token, case_id, subject, predicate, object_, is_object_uri=True):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             if subject is not None:
                 subject = rdflib.URIRef(subject)
             if predicate is not None:
@@ -864,33 +1140,39 @@ class CaseDatabase(coach.GraphDatabaseService):
             if object_ is not None:
                 object_ = rdflib.URIRef(object_) if is_object_uri else rdflib.Literal(object_)
                 
-            # Create a list as a generator can be iterated only one time
-            triples = list(case_graph.triples((subject, predicate, object_)))
-            
-            # Check that each triples can be safely removed with the delegate token. Perform this check for each triple before
-            # removing any, as if the first triple removed is the link from the trade-off method to an element of these triples,
-            # the following removals will fail as this element will no longer be a child of the trade-off method.
-            for (triple_subject, triple_predicate, triple_object) in triples:
-                # Raise an error if the modification is not allowed
-                self._is_modification_by_trade_off_method_allowed(case_id, triple_subject, triple_object)
-                    
-                
-            # TODO: add transaction
-            # Remove triplet one by one to ensure that they can be removed with the delegate token.
-            for (triple_subject, triple_predicate, triple_object) in triples:
-                case_graph.remove((triple_subject, triple_predicate, triple_object))
+            self._remove_in_trade_off(case_id, case_graph, subject, predicate, object_)
         else:
             raise RuntimeError("Invalid user or delegate token")
         
+        
+    def _remove_in_trade_off(self, case_id, case_graph, subject, predicate, object_):
+        """
+        Removes the triples of case_graph matching (subject, predicate, object_), where None matches any term, if the trade-off
+        method is allowed to remove all of them.
+        """
+        # Create a list as a generator can be iterated only one time
+        triples = list(case_graph.triples((subject, predicate, object_)))
+        
+        # Check that each triples can be safely removed with the delegate token. Perform this check for each triple before
+        # removing any, as if the first triple removed is the link from the trade-off method to an element of these triples,
+        # the following removals will fail as this element will no longer be a child of the trade-off method.
+        for (triple_subject, triple_predicate, triple_object) in triples:
+            # Raise an error if the modification is not allowed
+            self._is_modification_by_trade_off_method_allowed(case_id, triple_subject, triple_object, case_graph)
+                
+        # Remove triplet one by one to ensure that they can be removed with the delegate token.
+        for (triple_subject, triple_predicate, triple_object) in triples:
+            case_graph.remove((triple_subject, triple_predicate, triple_object))
+        
     
     @endpoint("/set_in_trade_off", ["POST"], "application/json")
     def set_in_trade_off(self, user_id, token, case_id, subject, predicate, object_, is_object_uri=True):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if subject is None or predicate is None or object_ is None:
                 raise TypeError("Subject, predicate and object_ must not be None")
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             subject = rdflib.URIRef(subject)
             predicate = rdflib.URIRef(predicate)
             object_ = rdflib.URIRef(object_) if is_object_uri else rdflib.Literal(object_)
@@ -902,14 +1184,74 @@ class CaseDatabase(coach.GraphDatabaseService):
             raise RuntimeError("Invalid user or delegate token")
     
     
+    @endpoint("/apply_case_patch", ["POST"], "application/json")
+    def apply_case_patch(self, user_id, token, case_id, operations):
+        """
+        Applies a list of operations to the graph of a case, in the given order, and with the same checks as add_in_trade_off, 
+        remove_in_trade_off and set_in_trade_off. Each operation is a dictionary with the keys "operation", which is "add", 
+        "remove" or "set", "subject", "predicate", "object_", and optionally "is_object_uri", which is True by default.
+        As in remove_in_trade_off, None matches any term in a remove operation.
+        A uri starting with "_:" is a placeholder for a new uri, which is created when the placeholder is first used, so that 
+        new resources can be created and linked in the same patch. The patch returns a dictionary from placeholders to the new uris.
+        The operations are first applied to a copy of the case graph, and the store is only changed if all of them are allowed,
+        with one write for the added triples and one commit.
+        """
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
+            case_graph = self.get_case_graph(case_id)
+            original_triples = set(case_graph)
+            patched_graph = rdflib.Graph()
+            for triple in original_triples:
+                patched_graph.add(triple)
+            
+            new_uris = {}
+            def term(value, is_uri = True):
+                if value is None:
+                    return None
+                if not is_uri:
+                    return rdflib.Literal(value)
+                if value.startswith("_:"):
+                    if value not in new_uris:
+                        new_uris[value] = self.new_uri()
+                    return new_uris[value]
+                return rdflib.URIRef(value)
+            
+            for operation in operations:
+                subject = term(operation.get("subject"))
+                predicate = term(operation.get("predicate"))
+                object_ = term(operation.get("object_"), operation.get("is_object_uri", True))
+                if operation["operation"] in ["add", "set"]:
+                    if subject is None or predicate is None or object_ is None:
+                        raise TypeError("Subject, predicate and object_ must not be None")
+                    # Raise an error if the modification is not allowed
+                    self._is_modification_by_trade_off_method_allowed(case_id, subject, object_, patched_graph)
+                    if operation["operation"] == "set":
+                        self._remove_in_trade_off(case_id, patched_graph, subject, predicate, None)
+                    patched_graph.add((subject, predicate, object_))
+                elif operation["operation"] == "remove":
+                    self._remove_in_trade_off(case_id, patched_graph, subject, predicate, object_)
+                else:
+                    raise RuntimeError("Unknown operation {0}. Allowed operations are 'add', 'remove' and 'set'."
+                                       .format(operation["operation"]))
+            
+            patched_triples = set(patched_graph)
+            for triple in original_triples - patched_triples:
+                case_graph.remove(triple)
+            case_graph.addN((s, p, o, case_graph) for (s, p, o) in patched_triples - original_triples)
+            case_graph.commit()
+            return {placeholder: str(uri) for (placeholder, uri) in new_uris.items()}
+        else:
+            raise RuntimeError("Invalid user or delegate token")
+    
+    
     @endpoint("/get_subjects_in_trade_off", ["POST"], "application/json")
     def get_subjects_in_trade_off(self, user_id, token, case_id, predicate, object_, is_object_uri=True):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if predicate is None or object_ is None:
                 raise TypeError("Predicate and object_ must not be None")
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             predicate = rdflib.URIRef(predicate)
             object_ = rdflib.URIRef(object_) if is_object_uri else rdflib.Literal(object_)
             
@@ -921,12 +1263,12 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/get_predicates_in_trade_off", ["POST"], "application/json")
     def get_predicates_in_trade_off(self, user_id, token, case_id, subject, object_, is_object_uri=True):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if subject is None or object_ is None:
                 raise TypeError("Subject and object_ must not be None")
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             subject = rdflib.URIRef(subject)
             object_ = rdflib.URIRef(object_) if is_object_uri else rdflib.Literal(object_)
             
@@ -938,12 +1280,12 @@ class CaseDatabase(coach.GraphDatabaseService):
 
     @endpoint("/get_objects_in_trade_off", ["POST"], "application/json")
     def get_objects_in_trade_off(self, user_id, token, case_id, subject, predicate):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             if subject is None or predicate is None:
                 raise TypeError("Subject and predicate must not be None")
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             subject = rdflib.URIRef(subject)
             predicate = rdflib.URIRef(predicate)
             
@@ -955,11 +1297,11 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/get_criteria_pugh_analysis", ["GET"], "application/json")
     def get_criteria_pugh_analysis(self, user_id, token, case_id):
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             query = """ SELECT ?criteria_name ?criteria_weight
                         WHERE {
@@ -969,7 +1311,7 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?criteria_uri orion:weight ?criteria_weight .
                         }
             """
-            query_result = case_graph.query(query, initNs={"orion": orion_ns}, initBindings={"case_id": case_id})
+            query_result = sparql.query(case_graph, "CaseDatabase.get_criteria_pugh_analysis", query, initNs={"orion": orion_ns}, initBindings={"case_id": case_id})
             return {criteria_name.toPython(): criteria_weight.toPython() for (criteria_name, criteria_weight) in query_result}
         else:
             raise RuntimeError("Invalid user or delegate token")
@@ -980,10 +1322,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Changes the property name of the case_id node to become value.
         """
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             case_graph.set((case_id, rdflib.URIRef(name), rdflib.Literal(value)))
             case_graph.commit()
             return "Ok"
@@ -996,10 +1338,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Gets the value of the property name of the case_id node, or None if it does not exist.
         """
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             value = case_graph.value(case_id, rdflib.URIRef(name), None, None)
             return value
         else:
@@ -1007,9 +1349,9 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/get_general_context", ["GET"], "application/json")
     def get_general_context(self, user_id, user_token, case_id):
-        if self.is_stakeholder(user_id, case_id) and self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.is_stakeholder(user_id, case_id) and self.check_user_token(user_id, user_token):
             orion_ns = rdflib.Namespace(self.orion_ns)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             general_context_uri = case_graph.value(case_id, orion_ns.context, None, None)
             if general_context_uri is None:
@@ -1036,10 +1378,10 @@ class CaseDatabase(coach.GraphDatabaseService):
                 """
                 
             for category in categories:
-                query_result = case_graph.query(query, initNs={"orion": orion_ns}, 
-                                                initBindings={"general_context_uri": general_context_uri,
-                                                              "predicate": orion_ns[category["name"]], 
-                                                              "general_id": orion_ns[category["general_id"]]})
+                query_result = sparql.query(case_graph, "CaseDatabase.get_general_context", query, initNs={"orion": orion_ns}, 
+                                            initBindings={"general_context_uri": general_context_uri,
+                                                          "predicate": orion_ns[category["name"]], 
+                                                          "general_id": orion_ns[category["general_id"]]})
                 query_result = [e for e in query_result]
 
                 if len(query_result) > 1:
@@ -1055,10 +1397,10 @@ class CaseDatabase(coach.GraphDatabaseService):
     
     @endpoint("/save_general_context", ["POST"], "application/json")
     def save_general_context(self, user_id, user_token, case_id, general_context_list):
-        if self.is_stakeholder(user_id, case_id) and self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.is_stakeholder(user_id, case_id) and self.check_user_token(user_id, user_token):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             general_context_uri = case_graph.value(case_id, orion_ns.context, None, None)
             if general_context_uri is None:
@@ -1091,9 +1433,9 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/save_context", ["POST"], "application/json")
     def save_context(self, user_id, user_token, case_id, context_predicate, context_values_dict):
-        if self.is_stakeholder(user_id, case_id) and self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.is_stakeholder(user_id, case_id) and self.check_user_token(user_id, user_token):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
 
             orion_ns = rdflib.Namespace(self.orion_ns)
             general_context_uri = case_graph.value(case_id, orion_ns.context, None, None)
@@ -1121,9 +1463,9 @@ class CaseDatabase(coach.GraphDatabaseService):
 
     @endpoint("/get_context", ["GET"], "application/json")
     def get_context(self, user_id, user_token, case_id, context_predicate):
-        if self.is_stakeholder(user_id, case_id) and self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.is_stakeholder(user_id, case_id) and self.check_user_token(user_id, user_token):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             orion_ns = rdflib.Namespace(self.orion_ns)
 
             query = """ SELECT ?entry_id ?entry_value
@@ -1134,8 +1476,8 @@ class CaseDatabase(coach.GraphDatabaseService):
                             ?entry_uri orion:value ?entry_value .
                         }
             """
-            result_query = case_graph.query(query, initNs = {"orion": orion_ns}, 
-                                            initBindings = {"case_id": case_id, "context_predicate": context_predicate})
+            result_query = sparql.query(case_graph, "CaseDatabase.get_context", query, initNs = {"orion": orion_ns}, 
+                                        initBindings = {"case_id": case_id, "context_predicate": context_predicate})
 
             result = defaultdict(list)
             for (entry_id, entry_value) in result_query:
@@ -1150,13 +1492,13 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Gets the list of decision alternatives associated with the case_id node, returning both title and id.
         """
-        if self.is_stakeholder(user_id, case_id) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                      self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder(user_id, case_id) and (self.check_user_token(user_id, token) or 
+                                                      self.check_delegate_token(user_id, token, case_id)):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             q = "SELECT ?title ?a WHERE { ?case_id orion:alternative ?a . ?a orion:title ?title . } ORDER BY ?a"
-            result = case_graph.query(q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
-                                      initBindings = { "case_id": case_id })
+            result = sparql.query(case_graph, "CaseDatabase.get_decision_alternatives", q, initNs = { "orion": rdflib.Namespace(self.orion_ns)},
+                                  initBindings = { "case_id": case_id })
             return list(result)
         else:
             raise RuntimeError("Invalid user or delegate token")
@@ -1166,11 +1508,11 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Changes the property name of the alternative node to become value.
         """
-        if self.is_stakeholder_in_alternative(user_id, case_id, alternative) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                                                  self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder_in_alternative(user_id, case_id, alternative) and (self.check_user_token(user_id, token) or 
+                                                                                  self.check_delegate_token(user_id, token, case_id)):
             case_id = rdflib.URIRef(case_id)
             alternative = rdflib.URIRef(alternative)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             case_graph.set((alternative, rdflib.URIRef(name), rdflib.Literal(value)))
             case_graph.commit()
             return "Ok"
@@ -1183,18 +1525,18 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Gets the value of the property name of the alternative node, or None if it does not exist.
         """
-        if self.is_stakeholder_in_alternative(user_id, case_id, alternative) and (self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = token) or 
-                                                                                  self.authentication_service_proxy.check_delegate_token(user_id = user_id, delegate_token = token, case_id = case_id)):
+        if self.is_stakeholder_in_alternative(user_id, case_id, alternative) and (self.check_user_token(user_id, token) or 
+                                                                                  self.check_delegate_token(user_id, token, case_id)):
             case_id = rdflib.URIRef(case_id)
             alternative = rdflib.URIRef(alternative)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             value = case_graph.value(alternative, rdflib.URIRef(name), None, None)
             return value
         else:
             raise RuntimeError("Invalid user or delegate token")
         
         
-    @endpoint("/get_ontology", ["GET", "POST"], "text/plain")
+    @endpoint("/get_ontology", ["GET", "POST"], "text/plain", cache_ttl = 300)
     def get_ontology(self, format_):
         """
         Returns the base OWL ontology used by this case database. The base ontology may be extended by services.
@@ -1214,58 +1556,90 @@ class CaseDatabase(coach.GraphDatabaseService):
         TODO: It should be possible to set the level of detail on what gets exported.
         """
 
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             return case_graph.serialize(format = format_).decode("utf-8")
         else:
             raise RuntimeError("Invalid user token")
     
     @endpoint("/is_case_in_database", ["GET"], "application/json")
     def is_case_in_database(self, user_id, user_token, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
-            query = " ASK WHERE { ?case_uri a orion:Case .} "
-            query_result = self.graph.query(query, initNs={"orion": rdflib.Namespace(self.orion_ns)},
-                                            initBindings={"case_uri": case_id})
-            return query_result.askAnswer
+        if self.check_user_token(user_id, user_token):
+            return self.case_catalog.contains(case_id)
         else:
             raise RuntimeError("Invalid user token")
         
     @endpoint("/import_case", ["POST"], "application/json")
     def import_case(self, user_id, user_token, graph_description, format_, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
-            case_graph = rdflib.Graph(store = self.store, identifier = rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token):
+            case_graph = self.case_store_graph(case_id)
             case_graph.parse(data=graph_description, format=format_)
+            self.case_graph_cache.invalidate(case_id)
+            self.update_case_catalog(case_id)
         else:
             raise RuntimeError("Invalid user token")
         
+    @endpoint("/import_case_from_knowledge_repository", ["POST"], "application/json")
+    def import_case_from_knowledge_repository(self, user_id, user_token, case_id):
+        """
+        Loads a case from the knowledge repository into the case database. The triples of the case are streamed from the knowledge 
+        repository in N-Triples format, and added to the store in chunks, so that the case description is never held as a whole.
+        """
+        if self.check_user_token(user_id, user_token):
+            case_graph = self.get_case_graph(case_id)
+            chunk_size = 1000
+            lines = []
+            for line in self.kr_db_proxy.stream("import_case_triples", case_uri = case_id):
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    self.add_triples(case_graph, lines)
+                    lines = []
+            self.add_triples(case_graph, lines)
+            self.update_case_catalog(case_id)
+        else:
+            raise RuntimeError("Invalid user token")
+        
+        
+    def add_triples(self, graph, lines):
+        """
+        Adds the triples in lines, a list of lines in N-Triples format, to graph, with one write to the store.
+        """
+        if lines:
+            chunk_graph = rdflib.Graph()
+            chunk_graph.parse(data = "\n".join(lines), format = "nt")
+            graph.addN((s, p, o, graph) for (s, p, o) in chunk_graph)
+        
     @endpoint("/open_case", ["GET"], "application/json")
     def open_case(self, user_id, user_token, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             case_graph.set((case_id, orion_ns.close, rdflib.Literal(False)))
+            self.update_case_catalog(case_id)
         else:
             raise RuntimeError("Invalid user token")
         
     @endpoint("/close_case", ["GET"], "application/json")
     def close_case(self, user_id, user_token, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             orion_ns = rdflib.Namespace(self.orion_ns)
             case_id = rdflib.URIRef(case_id)
-            case_graph = self.graph.get_context(case_id)
+            case_graph = self.get_case_graph(case_id)
             
             case_graph.set((case_id, orion_ns.close, rdflib.Literal(True)))
+            self.update_case_catalog(case_id)
         else:
             raise RuntimeError("Invalid user token")
         
     @endpoint("/remove_case", ["GET", "POST"], "application/json")
     def remove_case(self, user_id, user_token, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(case_id)
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             case_graph.remove((None, None, None))
+            self.update_case_catalog(case_id)
         else:
             raise RuntimeError("Invalid user token")
     
@@ -1293,16 +1667,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns a new uri in the database namespace.
         """
-        # Get the first free id and use it for the new uri, while increasing the id counter by one.
-        case_db_term = rdflib.URIRef(self.data_ns + "case_db")
-        id_counter_term = rdflib.URIRef(self.data_ns + "id_counter")
-        id_counter = int(self.graph.value(case_db_term, id_counter_term, None, "0"))
-        self.graph.set((case_db_term, id_counter_term, rdflib.Literal(id_counter + 1)))
-        self.graph.commit()
-        return rdflib.URIRef(self.data_ns + str(id_counter))
+        return rdflib.URIRef(self.data_ns + str(self.id_allocator.new_id()))
     
     
-    @endpoint("/get_data_namespace", ["GET", "POST"], "application/json")
+    @endpoint("/get_data_namespace", ["GET", "POST"], "application/json", pure = True)
     def get_data_namespace(self):
         """
         Returns the namespace used for data in this case database.
@@ -1321,10 +1689,10 @@ class CaseDatabase(coach.GraphDatabaseService):
         # A resource is stored in Neo4j as a node with the resource_class as a label.
         # The database id is used as the last part of the returned URI.
         
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token):
+        if self.check_user_token(user_id, user_token):
             orion_ns = rdflib.Namespace(self.orion_ns)
             uri = self.new_uri()
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             case_graph.add((uri, rdflib.RDF.type, orion_ns[resource_class]))
             case_graph.commit()
             return uri
@@ -1339,9 +1707,9 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # TODO: Add ontology and stakeholder checks.
         
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             resource = rdflib.URIRef(resource)
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             case_graph.remove((resource, None, None))
             case_graph.remove((None, None, resource))
             case_graph.commit()
@@ -1358,9 +1726,9 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # TODO: Add ontology and stakeholder checks.
         
-#        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+#        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             case_graph.add((rdflib.URIRef(resource), rdflib.URIRef(property_name), rdflib.Literal(value)))
             case_graph.commit()
             return "Ok"
@@ -1376,9 +1744,9 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # TODO: Add ontology and stakeholder checks.
         
-#        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+#        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             case_graph.add((rdflib.URIRef(resource1), rdflib.URIRef(property_name), rdflib.URIRef(resource2)))
             case_graph.commit()
             return "Ok"
@@ -1390,8 +1758,8 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns the subjects of all triples where the predicate and object_ are as provided.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             result = case_graph.subjects(rdflib.URIRef(predicate), rdflib.URIRef(object_))
             return list(result)
         else:
@@ -1403,8 +1771,8 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns the predicates of all triples where the subject and object are as provided.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             result = case_graph.predicates(rdflib.URIRef(subject), rdflib.URIRef(object_))
             return list(result)
         else:
@@ -1416,8 +1784,8 @@ class CaseDatabase(coach.GraphDatabaseService):
         """
         Returns the objects of all triples where the subject and predicate are as provided.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             result = case_graph.objects(rdflib.URIRef(subject), rdflib.URIRef(predicate))
             return list(result)
         else:
@@ -1425,8 +1793,8 @@ class CaseDatabase(coach.GraphDatabaseService):
         
     @endpoint("/get_predicate_objects", ["GET"], "application/json")
     def get_predicate_objects(self, user_id, user_token, case_id, subject):
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             result = case_graph.predicate_objects(rdflib.URIRef(subject))
             return [(p.toPython(), o.toPython()) for (p, o) in result]
         else:
@@ -1454,9 +1822,9 @@ class CaseDatabase(coach.GraphDatabaseService):
             Raise an error if subject, predicate and object_ are all defined. 
             :rtype:
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
             
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+            case_graph = self.get_case_graph(case_id)
             if subject is not None:
                 subject = rdflib.URIRef(subject)
             if predicate is not None:
@@ -1489,8 +1857,8 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # TODO: Add ontology and stakeholder checks.
         
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             case_graph.remove((rdflib.URIRef(resource), rdflib.URIRef(property_name), None))
             case_graph.commit()
             return "Ok"
@@ -1506,8 +1874,8 @@ class CaseDatabase(coach.GraphDatabaseService):
 
         # TODO: Add ontology and stakeholder checks.
         
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             case_graph.remove((rdflib.URIRef(resource1), rdflib.URIRef(property_name), rdflib.URIRef(resource2)))
             case_graph.remove((rdflib.URIRef(resource1), rdflib.URIRef(property_name), rdflib.Literal(resource2)))
             case_graph.commit()
@@ -1522,8 +1890,8 @@ class CaseDatabase(coach.GraphDatabaseService):
         If the triple (resource1, property_name, resource2) exists, it is deleted and False is returned. 
         Otherwise, it is added, and True is returned. The result thus reflects if the triple exists after the call.
         """
-        if self.authentication_service_proxy.check_user_token(user_id = user_id, user_token = user_token) and self.is_stakeholder(user_id, case_id):
-            case_graph = self.graph.get_context(rdflib.URIRef(case_id))
+        if self.check_user_token(user_id, user_token) and self.is_stakeholder(user_id, case_id):
+            case_graph = self.get_case_graph(case_id)
             resource1 = rdflib.URIRef(resource1)
             predicate = rdflib.URIRef(property_name)
             resource2 = rdflib.URIRef(resource2)
@@ -7,6 +7,8 @@ The module coach contains the framework for developing components for COACH in P
 """
 
 # Standard libraries
+from collections import OrderedDict
+import copy
 import inspect
 import json
 import logging
@@ -14,17 +16,30 @@ import os
 from string import Template
 import sys
 import threading
+import time
 import traceback
 
 # Web server framework
 from flask import Flask, Response, request
+from werkzeug.test import EnvironBuilder
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
 
 # Database connection
 from neo4j.v1 import GraphDatabase, basic_auth
 
+# Token verification
+from COACH.framework.tokens import TokenVerifier
+
+# Sentinel used by Microservice.get_setting to tell a missing default from a default of None
+_no_default = object()
+
+# The microservices created in this process, indexed by their url, to which proxies can make calls without http
+local_services = {}
+
 # Auxiliary functions        
-def endpoint(url_path = None, http_methods = ["POST", "GET"], content = "text/plain"):
+def endpoint(url_path = None, http_methods = ["POST", "GET"], content = "text/plain", cache_ttl = None, pure = False, invalidated_by = []):
     """
     endpoint is intended to be used as a decorator for the methods of a service class that should be used
     as endpoints. The function takes two arguments, a url path and a list of methods to be used with it.
@@ -34,6 +49,11 @@ def endpoint(url_path = None, http_methods = ["POST", "GET"], content = "text/pl
     If the url_path argument is not provided, the path is set to "/" + the function mane.
     If the http_methods are not provided, the default is ["POST", "GET"].
     If the content argument is not provided, it is set to "text/plain".
+    
+    The remaining arguments tell proxies whether they may cache the results of the endpoint. If pure is True, the result
+    only depends on the arguments, and can be kept for as long as the service runs. If cache_ttl is provided, the result can be 
+    kept for that number of seconds. invalidated_by is a list of names of endpoints of the same service which change the result, 
+    and a proxy drops its cached results of the endpoint when it calls any of them. By default, results are not cached.
     """
 
     def decorator(f):
@@ -43,6 +63,8 @@ def endpoint(url_path = None, http_methods = ["POST", "GET"], content = "text/pl
             f.endpoint_url_path = "/" + f.__name__
         f.endpoint_http_methods = http_methods
         f.endpoint_content = content
+        if pure or cache_ttl:
+            f.endpoint_cache = {"ttl": None if pure else cache_ttl, "pure": pure, "invalidated_by": list(invalidated_by)}
         return f
     
     return decorator
@@ -53,7 +75,9 @@ def endpoint(url_path = None, http_methods = ["POST", "GET"], content = "text/pl
 endpoint_content_conversion = {
     "text/plain" : (lambda x: x, lambda x: x),
     "text/html" : (lambda x: x, lambda x: x),
-    "application/json" : (json.dumps, json.loads)
+    "application/json" : (json.dumps, json.loads),
+    # N-Triples results may be returned as an iterable of lines, which is then streamed to the client
+    "application/n-triples" : (lambda x: x, lambda x: x)
     }
 
 
@@ -82,6 +106,11 @@ class Microservice:
 #        self.load_settings(settings_file_name)
         self.load_settings()
 
+        # The transport is shared by all proxies created by this microservice
+        self.transport = HttpTransport(**self.get_setting("proxy_transport", {}))
+        # The maximum number of endpoint results kept by each proxy
+        self.proxy_cache_size = self.get_setting("proxy_cache_size", 256)
+
         self.name = self.get_setting("name")
         self.host = self.get_setting("host")
         self.port = self.get_setting("port")
@@ -101,6 +130,11 @@ class Microservice:
 
         # Initialize the endpoints, as defined in concrete subclasses
         self.create_endpoints()
+        
+        # Register the microservice, so that proxies in the same process can call it directly
+        self.in_process_calls = self.get_setting("in_process_calls", True)
+        if self.in_process_calls:
+            local_services[self.get_setting("protocol") + "://" + self.host + ":" + str(self.port)] = self
             
 
     def coach_top_directory(self):
@@ -151,9 +185,10 @@ class Microservice:
         self.settings = json.loads(fileData)
 
 
-    def get_setting(self, key):
+    def get_setting(self, key, default = _no_default):
         """
         Returns the settings value for the provided key, or an exception if it does not exist.
+        If a default value is provided, it is returned instead of raising an exception.
         The settings file should be organized as a dictionary, where each entry has a class name as a key,
         and another dictionary as its value.
         The settings for a particular object is found by looking up the first class name in its class hierarchy,
@@ -169,7 +204,9 @@ class Microservice:
             except:
                 pass
         # If the key is not defined for any specific class, look if it is defined on the global level.
-        return self.settings[key]
+        if default is _no_default or key in self.settings:
+            return self.settings[key]
+        return default
 
 
     def run(self):
@@ -199,6 +236,8 @@ class Microservice:
         It automatically creates endpoints for methods decorated with the @endpoint decorator.
         Override this method in subclasses to add service endpoints manually.
         """
+        # The endpoint methods are also stored by their name in the api, for use by the batch endpoint.
+        self.endpoint_methods = {}
         # Get a list of all methods for this class.
         print("Creating endpoints for " + self.__class__.__name__ + "(" + self.host + ":" + str(self.port) + ")")
         for (_, m) in inspect.getmembers(self):
@@ -207,6 +246,7 @@ class Microservice:
             if hasattr(m, "endpoint_url_path"):
                 self.ms.add_url_rule(m.endpoint_url_path, view_func = self.endpoint_wrapper(m, m.endpoint_content), endpoint = m.__name__,
                                      methods = m.endpoint_http_methods)
+                self.endpoint_methods[m.endpoint_url_path[1:]] = m
                 print("   - " + m.__name__ + " created")
 
 
@@ -214,6 +254,61 @@ class Microservice:
     trace = True
     trace_indent = 0
 
+    def endpoint_arguments(self, m, request_args):
+        """
+        Returns the list of arguments for calling the endpoint method m, taking the value of each parameter from request_args,
+        or the parameter's default value. Raises a RuntimeError if a parameter without default value is missing.
+        """
+        args = []
+        for (param_name, param) in inspect.signature(m).parameters.items():
+            try:
+                args.append(request_args[param_name])
+            except KeyError:
+                if param.default == inspect.Parameter.empty:
+                    raise RuntimeError("Try to call the method {0} without the parameter {1}".format(m.__name__, param_name))
+                args.append(param.default)
+        return args
+    
+    
+    def endpoint_error_message(self, m, args):
+        """
+        Returns the message describing the exception currently handled, raised by a call to the endpoint method m.
+        """
+        message = "An error occurred while processing the endpoint " + m.__name__ + ":\n"
+        message += "Service: " + self.__class__.__name__ + " running at " + self.host + ":" + str(self.port) + "\n"
+        message += "Arguments: " + str(args) + "\n"
+        message += traceback.format_exc() + "\n\n"
+        return message
+        
+
+    def call_in_process(self, name, http_method, kwargs_json):
+        """
+        Calls the endpoint name from a proxy in the same process, without going through http. The endpoint method is called 
+        in a request context of the microservice, as if the json encoded arguments had been sent in an http request, so the 
+        arguments, result conversion and error handling are the same as for an http call. 
+        Returns a triple with the status code, content type and text of the response.
+        
+        The call is made in the thread of the caller, so it shares the thread-local state of the calling request, unlike an http 
+        call. This includes flask.g, which belongs to the application context of the caller if the caller is a service of the same 
+        Flask application, and the state that services keep per request thread. For instance, a CaseDatabase endpoint called in 
+        process from another CaseDatabase endpoint is part of the calling request: it uses the store connection and write lock of
+        that request, and its writes are committed or rolled back with it.
+        """
+        m = self.endpoint_methods[name]
+        builder = EnvironBuilder(path = "/" + name, method = http_method, data = kwargs_json)
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+        with self.ms.request_context(environ):
+            try:
+                response = self.endpoint_wrapper(m, m.endpoint_content)()
+            except Exception:
+                # Errors in the argument handling are reported as by the web server
+                return (500, "text/plain", traceback.format_exc())
+        return (response.status_code, response.headers.get("Content-Type"), response.get_data(as_text = True))
+    
+
     def endpoint_wrapper(self, m, content):
         
         def highlight_text(s):
@@ -232,14 +327,7 @@ class Microservice:
             if not request_args:
                 request_args = request.values
 
-            args = []
-            for (param_name, param) in inspect.signature(m).parameters.items():
-                try:
-                    args.append(request_args[param_name])
-                except KeyError:
-                    if param.default == inspect.Parameter.empty:
-                        raise RuntimeError("Try to call the method {0} without the parameter {1}".format(m.__name__, param_name))
-                    args.append(param.default)
+            args = self.endpoint_arguments(m, request_args)
                     
             if self.trace: 
                 print(highlight_text(self.trace_indent * "    " + m.__name__ + "(" + str(args) + ")"))
@@ -251,11 +339,7 @@ class Microservice:
                     print(highlight_text(self.trace_indent * "    " + "result from " + m.__name__ + ": " + (str(result).split("\n", 1)[0])))
                 response = Response(endpoint_content_conversion[content][0](result), status = 200, content_type = content)
             except Exception:
-                message = "An error occurred while processing the endpoint " + m.__name__ + ":\n"
-                message += "Service: " + self.__class__.__name__ + " running at " + self.host + ":" + str(self.port) + "\n"
-                message += "Arguments: " + str(args) + "\n"
-                message += traceback.format_exc() + "\n\n"
-                response = Response(message, status = 500, content_type = "text/plain")
+                response = Response(self.endpoint_error_message(m, args), status = 500, content_type = "text/plain")
 
             return response
         
@@ -290,7 +374,7 @@ class Microservice:
         return result
     
     
-    @endpoint("/get_api", ["GET", "POST"], "application/json")
+    @endpoint("/get_api", ["GET", "POST"], "application/json", pure = True)
     def get_api(self):
         """
         Returns the API of the Microservice as json data.
@@ -304,10 +388,46 @@ class Microservice:
                 record["methods"] = m.endpoint_http_methods
                 record["description"] = m.__doc__
                 record["params"] = [p.name for (_, p) in inspect.signature(m).parameters.items()]
+                record["cache"] = getattr(m, "endpoint_cache", None)
                 result[m.endpoint_url_path[1:]] = record
         return result
     
     
+    @endpoint("/batch", ["POST"], "application/json")
+    def batch(self, calls):
+        """
+        Runs a list of endpoint calls in one request, and returns the list of their results, in the same order.
+        Each call is a dictionary with the keys "endpoint", the name of an endpoint in the api returning application/json, and "args", 
+        a dictionary of arguments. Each result is a dictionary with the key "status", which is 200, and the key "result" with the 
+        returned value. The calls are checked before any of them is run. If a call fails, the following ones are not run, and the 
+        batch fails as a whole, so that services running each request in a transaction roll back the writes of the whole batch.
+        """
+        if not isinstance(calls, list):
+            raise RuntimeError("The calls of a batch must be a list")
+        methods = []
+        for call in calls:
+            if not isinstance(call, dict) or not isinstance(call.get("endpoint"), str) or not isinstance(call.get("args", {}), dict):
+                raise RuntimeError("Each call of a batch must be a dictionary with an endpoint name and a dictionary of args: " + 
+                                   str(call))
+            m = self.endpoint_methods.get(call["endpoint"])
+            if m is None or m.endpoint_url_path == "/batch":
+                raise RuntimeError("The service " + self.__class__.__name__ + " has no endpoint " + call["endpoint"] + 
+                                   " which can be called in a batch")
+            if m.endpoint_content != "application/json":
+                raise RuntimeError("The endpoint " + call["endpoint"] + " returns " + m.endpoint_content + 
+                                   ", and can not be called in a batch")
+            methods.append(m)
+        results = []
+        for (call, m) in zip(calls, methods):
+            args = call.get("args", {})
+            try:
+                args = self.endpoint_arguments(m, args)
+                results.append({"status": 200, "result": m(*args)})
+            except Exception:
+                raise RuntimeError("Call " + str(len(results) + 1) + " of the batch failed.\n" + self.endpoint_error_message(m, args))
+        return results
+    
+    
     def create_proxy(self, url, method_preference = ["POST", "GET"], cache = True, **kwargs):
         """
         Returns a Proxy object representing the given url, and with method preferences as provided.
@@ -319,15 +439,137 @@ class Microservice:
         """
         if cache:
             if url not in self.proxies:
-                self.proxies[url] = Proxy(url, method_preference, **kwargs)
+                self.proxies[url] = Proxy(url, method_preference, transport = self.transport, in_process = self.in_process_calls, 
+                                          cache_size = self.proxy_cache_size, **kwargs)
             return self.proxies[url]
         else:
-            return Proxy(url, method_preference, **kwargs)
+            return Proxy(url, method_preference, transport = self.transport, in_process = self.in_process_calls, 
+                         cache_size = self.proxy_cache_size, **kwargs)
 
 
 class MicroserviceException(Exception): pass
 
 
+class HttpTransport():
+    
+    """
+    The transport used by proxies to make http requests. Connections are pooled per host, and the pools are shared by all
+    threads and proxies using the transport, so that calls reuse warm connections. The requests sessions, which hold cookies and
+    headers, are not shared: each proxy has its own session in each thread, into which the shared pools are mounted.
+    The arguments correspond to the "proxy_transport" setting: pool_size is the maximum number of connections kept per host, 
+    keep_alive tells whether connections are kept open between requests, and the timeouts are given in seconds.
+    """
+    
+    def __init__(self, pool_size = 10, keep_alive = True, connect_timeout = 10, read_timeout = 120):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = (connect_timeout, read_timeout)
+        
+        # Connection pools, in the form of requests adapters, indexed by scheme and host
+        self.adapters = {}
+        self.lock = threading.Lock()
+        
+        
+    def get_adapter(self, host_url):
+        """
+        Returns the adapter holding the connection pool for host_url, creating it on first use.
+        """
+        with self.lock:
+            if host_url not in self.adapters:
+                self.adapters[host_url] = HTTPAdapter(pool_connections = 1, pool_maxsize = self.pool_size)
+            return self.adapters[host_url]
+        
+        
+    def new_session(self):
+        """
+        Returns a new session for making requests through the transport.
+        """
+        session = requests.Session()
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+    
+    
+    def request(self, session, http_method, url, **kwargs):
+        """
+        Makes an http request in session, which must have been created by new_session, using the connection pool of the host 
+        of url, and returns the response.
+        """
+        parts = urlsplit(url)
+        host_url = parts.scheme + "://" + parts.netloc + "/"
+        if host_url not in session.adapters:
+            session.mount(host_url, self.get_adapter(host_url))
+        return session.request(http_method, url, timeout = self.timeout, **kwargs)
+
+
+# The transport used by proxies that are not created through a microservice
+default_transport = HttpTransport()
+
+
+class ResultCache():
+    
+    """
+    A bounded cache of endpoint results, used by a proxy for the endpoints that its service declares as cacheable. 
+    Results are indexed by the endpoint name and the arguments of the call. When the cache is full, the least recently used 
+    result is dropped. The cache can be used from several request threads at the same time.
+    """
+    
+    def __init__(self, size = 256):
+        self.size = size
+        # Maps (endpoint name, json encoded arguments) to (expiry time or None, result)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        
+        
+    def key(self, name, kwargs):
+        """
+        Returns the key for a call to the endpoint name with the arguments in kwargs.
+        """
+        return (name, json.dumps(kwargs, sort_keys = True))
+    
+    
+    def get(self, key):
+        """
+        Returns a pair (found, result), where found is True if an unexpired result is stored for key.
+        A copy of the result is returned, so that the caller may modify it.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return (False, None)
+            (expiry, result) = entry
+            if expiry is not None and expiry < time.time():
+                del self.entries[key]
+                return (False, None)
+            self.entries.move_to_end(key)
+        return (True, copy.deepcopy(result))
+    
+    
+    def put(self, key, result, cache):
+        """
+        Stores a copy of result for key, where cache is the cacheability metadata of the endpoint, as provided in the api.
+        """
+        if self.size <= 0:
+            return
+        expiry = None if cache["pure"] else time.time() + cache["ttl"]
+        with self.lock:
+            self.entries[key] = (expiry, copy.deepcopy(result))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last = False)
+                
+                
+    def invalidate(self, names):
+        """
+        Drops all results of the endpoints in names.
+        """
+        names = set(names)
+        if names:
+            with self.lock:
+                for key in [key for key in self.entries if key[0] in names]:
+                    del self.entries[key]
+
+
 class Proxy():
     
     """
@@ -335,22 +577,185 @@ class Proxy():
     instance of the object. It is recommended that Proxy objects are created through the create_proxy method in Microservice.
     """
     
-    def __init__(self, url, method_preference, **kwargs):
+    def __init__(self, url, method_preference, transport = None, in_process = False, cache_size = 256, **kwargs):
         """
         Creates the proxy object. The url argument is the service which it acts as a proxy for. The method preferences is used in case
         a service endpoint accepts several methods, in which case the first applicable in the list is used.
+        The transport is used for making the http requests. If it is not provided, a transport shared by the process is used.
+        If in_process is True and the service runs in the same process, calls are made directly to it instead of through http.
+        Results of endpoints that the service declares as cacheable are kept in a cache holding at most cache_size results.
         """
         self.url = url
         self.method_preference = method_preference
+        self.transport = transport or default_transport
+        self.in_process = in_process
 
         # The api of the service is fetched when the first endpoint call is made, to allow for asynchronous initiations of services.
         self.api = None
+        self.api_lock = threading.Lock()
+        
+        # Cached endpoint results, and for each endpoint, the cacheable endpoints whose results it invalidates.
+        # The latter is derived from the api when it is fetched.
+        self.cache = ResultCache(cache_size)
+        self.invalidates = {}
+
+        # Service http call results and sessions are stored per thread, to allow inspection during testing.
+        self.local = threading.local()
+        
+    
+    @property
+    def result(self):
+        """
+        The response of the last service call made by the current thread, or None.
+        """
+        return getattr(self.local, "result", None)
+    
+    
+    @property
+    def local_service(self):
+        """
+        The microservice the proxy makes in-process calls to, or None if calls are made through http.
+        """
+        if self.in_process:
+            return local_services.get(self.url.rstrip("/"))
+        return None
+    
+    
+    @property
+    def session(self):
+        """
+        The session used by the current thread, which allows setting of e.g. cookies for testing purposes. The session is only
+        used by this proxy, so its cookies and headers are not sent to other services.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.transport.new_session()
+            self.local.session = session
+        return session
+        
 
-        # A session is stored and reused to improve performance and also allow setting of e.g. cookies for testing purposes.
-        self.session = None
+    def batch(self):
+        """
+        Returns a ProxyBatch, a context manager which queues the endpoint calls made through it, and sends them to the service 
+        in one request to its batch endpoint when the with block is left:
+        
+            with proxy.batch() as batch:
+                name = batch.get_user_name(user_id = user_id)
+                email = batch.get_user_email(user_id = user_id)
+            print(name.value, email.value)
+        """
+        return ProxyBatch(self)
+    
+
+    def stream(self, name, **kwargs):
+        """
+        Calls the endpoint name of the service with the arguments in kwargs, and returns an iterator over the lines of the result,
+        without the line ends. Over http, the lines are received while the service produces them, so that large text results
+        never need to be held in memory as a whole.
+        """
+        http_method = self._check_call(name, kwargs)
+        kwargs_json = json.dumps(kwargs)
+        local_service = self.local_service
+        if local_service:
+            self.local.result = None
+            (status_code, _, text) = local_service.call_in_process(name, http_method, kwargs_json)
+            if status_code != 200:
+                raise MicroserviceException(self._error_message(name, kwargs) + text)
+            return iter(text.splitlines())
+        
+        result = self.transport.request(self.session, http_method, self.url + "/" + name, data = kwargs_json, stream = True)
+        self.local.result = result
+        if result.status_code != 200:
+            raise MicroserviceException(self._error_message(name, kwargs) + result.text)
+        result.encoding = "utf-8"
+        return result.iter_lines(decode_unicode = True)
+    
 
-        # Service http call results are stored, to allow inspection during testing.
-        self.result = None
+    def _check_call(self, name, kwargs):
+        """
+        Checks that name is an endpoint of the service, accepting the parameters in kwargs, and returns the http method to use for it.
+        On the first call, the api of the service is fetched.
+        """
+        # On first service request, get the api of the service.
+        if not self.api:
+            with self.api_lock:
+                if not self.api:
+                    if self.local_service:
+                        api = self.local_service.get_api()
+                    else:
+                        api = self.transport.request(self.session, "GET", self.url + "/get_api").json()
+                    for (endpoint_name, record) in api.items():
+                        for invalidating_name in (record.get("cache") or {}).get("invalidated_by", []):
+                            self.invalidates.setdefault(invalidating_name, []).append(endpoint_name)
+                    self.api = api
+
+        # Check if the endpoint exists, otherwise raise error
+        if name not in self.api:
+            raise AttributeError("Proxy has determined that service " + self.url + " does not provide endpoint for " + name)
+
+        # Check that the parameter names used are in the api
+        for p in kwargs:
+            if p not in self.api[name]["params"]:
+                raise TypeError("Parameter " + p + " is not defined for proxy method " + name + ". " +
+                                "Allowed parameters are " + ", ".join(self.api[name]["params"]) + ".")
+
+        # Determine what http method to use, taking the first of the preferred method that the service supports.
+        return next(m for m in self.method_preference if m in self.api[name]["methods"])
+    
+    
+    def _call(self, name, kwargs):
+        """
+        Calls the endpoint name of the service with the arguments in kwargs, and returns the result.
+        """
+        http_method = self._check_call(name, kwargs)
+        
+        # If the endpoint is cacheable, and the result of the same call is cached, it is returned without calling the service
+        cache = self.api[name].get("cache")
+        if cache:
+            cache_key = self.cache.key(name, kwargs)
+            (found, value) = self.cache.get(cache_key)
+            if found:
+                return value
+
+        # The arguments are send in json to handle complex structure (nested dictionary, list...). 
+        # However, this will fail if an argument is not serializable in json.
+        kwargs_json = json.dumps(kwargs)
+        # Make the endpoint request
+        # TODO: change "data = kwargs_json" to "json = kwargs" ?
+        local_service = self.local_service
+        if local_service:
+            self.local.result = None
+            (status_code, content_type, text) = local_service.call_in_process(name, http_method, kwargs_json)
+        else:
+            result = self.transport.request(self.session, http_method, self.url + "/" + name, data = kwargs_json)
+            self.local.result = result
+            (status_code, content_type, text) = (result.status_code, result.headers.get("Content-Type"), result.text)
+        
+        # The call may have changed the results of other endpoints, even if it failed
+        self.cache.invalidate(self.invalidates.get(name, []))
+
+        # If there was an error in the response, raise an exception
+        if status_code != 200:
+            raise MicroserviceException(self._error_message(name, kwargs) + text)
+        
+        # Convert result to a Python object, depending on the content type
+        if content_type:
+            value = endpoint_content_conversion[content_type][1](text)
+        else:
+            value = text
+        if cache:
+            self.cache.put(cache_key, value, cache)
+        return value
+        
+        
+    def _error_message(self, name, kwargs):
+        """
+        Returns the beginning of the message of a MicroserviceException raised by a call to the endpoint name.
+        """
+        message = "An error occurred while processing the endpoint " + name + ":\n"
+        message += "Service: " + self.url + "\n"
+        message += "Arguments: " + str(kwargs) + "\n\n"
+        return message
         
 
     def __getattr__(self, name):
@@ -363,48 +768,100 @@ class Proxy():
             # Check if the right parameters are used
             if args:
                 raise TypeError("Proxies can only be called with keyword parameters, position arguments are not yet supported")
-
-            # On first service request, get the api of the service and create a session.
-            if not self.api:
-                self.api = requests.get(self.url + "/get_api").json()
-                self.session = requests.Session()
-
-            # Check if the endpoint exists, otherwise raise error
-            if name in self.api:
-                # Determine what http method to use, taking the first of the preferred method that the service supports.
-                http_method = next(m for m in self.method_preference if m in self.api[name]["methods"])
-
-                # Check that the parameter names used are in the api
-                for p in kwargs:
-                    if p not in self.api[name]["params"]:
-                        raise TypeError("Parameter " + p + " is not defined for proxy method " + name + ". " +
-                                        "Allowed parameters are " + ", ".join(self.api[name]["params"]) + ".")
-
-                # The arguments are send in json to handle complex structure (nested dictionary, list...). 
-                # However, this will fail if an argument is not serializable in json.
-                kwargs_json = json.dumps(kwargs)
-                # Make the endpoint request
-                # TODO: change "data = kwargs_json" to "json = kwargs" ?
-                self.result = self.session.request(http_method, self.url + "/" + name, data = kwargs_json)
-
-                # If there was an error in the response, raise an exception
-                if self.result.status_code != 200:
-                    message = "An error occurred while processing the endpoint " + name + ":\n"
-                    message += "Service: " + self.url + "\n"
-                    message += "Arguments: " + str(kwargs) + "\n\n"
-                    raise MicroserviceException(message + self.result.text)
-                
-                # Convert result to a Python object, depending on the content type
-                if "Content-Type" in self.result.headers:
-                    return endpoint_content_conversion[self.result.headers["Content-Type"]][1](self.result.text)
-                else:
-                    return self.result.text
-            else:
-                raise AttributeError("Proxy has determined that service " + self.url + " does not provide endpoint for " + name)
+            return self._call(name, kwargs)
 
         return service_call
     
     
+class ProxyBatch():
+    
+    """
+    A ProxyBatch queues endpoint calls to the service of a proxy, and sends them in one request to the batch endpoint of the service.
+    Calls are made in the same way as on the proxy, but return a BatchResult whose value is available once the batch has been sent.
+    The batch is sent when leaving a with block, or by calling send. If a call fails, the whole batch fails, and send raises a
+    MicroserviceException. Only endpoints returning application/json can be called in a batch.
+    """
+    
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.calls = []
+        self.results = []
+        
+        
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        # If the with block raised an exception, the queued calls are not sent
+        if exc_type is None:
+            self.send()
+        return False
+    
+    
+    def send(self):
+        """
+        Sends the queued calls to the service, and stores the responses in their results.
+        """
+        if self.calls:
+            (calls, results) = (self.calls, self.results)
+            (self.calls, self.results) = ([], [])
+            invalidated = set(name for call in calls for name in self.proxy.invalidates.get(call["endpoint"], []))
+            try:
+                responses = self.proxy._call("batch", {"calls": calls})
+            except MicroserviceException as e:
+                # The batch fails as a whole, so each of its calls has failed
+                for result in results:
+                    result.response = {"status": 500, "error": str(e)}
+                raise
+            finally:
+                self.proxy.cache.invalidate(invalidated)
+            for (result, response) in zip(results, responses):
+                result.response = response
+                # Results of cacheable endpoints are cached, unless the batch also contains a call that may have changed them
+                cache = self.proxy.api[result.name].get("cache")
+                if cache and response["status"] == 200 and result.name not in invalidated:
+                    self.proxy.cache.put(self.proxy.cache.key(result.name, result.kwargs), response["result"], cache)
+        
+        
+    def __getattr__(self, name):
+        def queue_call(*args, **kwargs):
+            # Check if the right parameters are used
+            if args:
+                raise TypeError("Proxies can only be called with keyword parameters, position arguments are not yet supported")
+            self.proxy._check_call(name, kwargs)
+            self.calls.append({"endpoint": name, "args": kwargs})
+            self.results.append(BatchResult(self.proxy, name, kwargs))
+            return self.results[-1]
+        
+        return queue_call
+    
+
+class BatchResult():
+    
+    """
+    The result of an endpoint call queued in a ProxyBatch.
+    """
+    
+    def __init__(self, proxy, name, kwargs):
+        self.proxy = proxy
+        self.name = name
+        self.kwargs = kwargs
+        self.response = None
+        
+        
+    @property
+    def value(self):
+        """
+        The value returned by the endpoint. Raises a MicroserviceException if the call failed, in the same way as a proxy call.
+        """
+        if self.response is None:
+            raise RuntimeError("The batch containing the call to " + self.name + " has not been sent")
+        if self.response["status"] != 200:
+            raise MicroserviceException(self.proxy._error_message(self.name, self.kwargs) + self.response["error"])
+        return self.response["result"]
+    
+    
 class GraphDatabaseService(Microservice):
     
     """
@@ -433,6 +890,10 @@ class GraphDatabaseService(Microservice):
         # Store authentication service connection
         self.authentication_service_proxy = self.create_proxy(self.get_setting("authentication_service"))
 
+        # User and delegate tokens are verified locally, only polling the authentication service for revoked tokens
+        self.token_verifier = TokenVerifier(secret_data["token_secret_key"], self.authentication_service_proxy, 
+                                            self.get_setting("token_revocation_poll_interval", 10))
+
         # Initiate neo4j
         try:
             self._db = GraphDatabase.driver("bolt://localhost", 
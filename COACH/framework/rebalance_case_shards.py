@@ -0,0 +1,71 @@
+"""
+Created on 17 okt. 2026
+
+Tool which moves the cases of the case database to the shards given by the hash of their uris, for a number of shards. It is used
+when the setting case_store_shards of the CaseDatabase is changed, and must be run while the case database service is stopped.
+
+The case catalog is first rebuilt from the cases found in the store files. Each case which is not in its shard is then copied to
+it, recorded in the catalog, and removed from its old shard, in that order, so that an interrupted run can be run again without
+losing data. Store files of shards beyond the new number of shards are left in place, and can be deleted once they are empty.
+
+Usage: python rebalance_case_shards.py settings_directory number_of_shards
+"""
+
+# Set python import path to include COACH top directory
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+
+import rdflib
+
+from COACH.framework.case_store import open_case_store
+from COACH.framework.case_catalog import CaseCatalog, hash_shard, shard_file_name, find_cases
+
+
+ORION_NS = "http://www.orion-research.se/ontology#"
+
+
+def rebalance(directory, number_of_shards):
+    """
+    Moves the cases in the store files of directory to their shards among number_of_shards. Returns the number of moved cases.
+    """
+    # All existing store files are opened, as well as the ones of the new shards
+    graphs = []
+    while len(graphs) < number_of_shards or os.path.isfile(os.path.join(directory, shard_file_name(len(graphs)))):
+        graphs.append(open_case_store(os.path.join(directory, shard_file_name(len(graphs))))[1])
+
+    catalog = CaseCatalog(os.path.join(directory, "coach_case_catalog.db"), ORION_NS)
+    for (case_id, _) in catalog.cases():
+        catalog.remove(case_id)
+    for (shard, graph) in enumerate(graphs):
+        for case_id in find_cases(graph, ORION_NS):
+            catalog.update(case_id, shard, graph.get_context(rdflib.URIRef(case_id)))
+
+    moved = 0
+    for (case_id, shard) in catalog.cases():
+        new_shard = hash_shard(case_id, number_of_shards)
+        if shard != new_shard:
+            source = graphs[shard].get_context(rdflib.URIRef(case_id))
+            target = graphs[new_shard].get_context(rdflib.URIRef(case_id))
+            # Triples left in the target by an interrupted run are replaced
+            target.remove((None, None, None))
+            target.addN((s, p, o, target) for (s, p, o) in source)
+            catalog.update(case_id, new_shard, target)
+            source.remove((None, None, None))
+            moved += 1
+            print("Moved " + case_id + " from shard " + str(shard) + " to shard " + str(new_shard))
+
+    for (shard, graph) in enumerate(graphs[number_of_shards:], number_of_shards):
+        print("The store file " + shard_file_name(shard) + " is no longer used" +
+              (", and can be deleted" if len(graph) == 0 else ", but still contains data outside cases"))
+    for graph in graphs:
+        graph.store.close()
+    catalog.close()
+    return moved
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python rebalance_case_shards.py settings_directory number_of_shards")
+        sys.exit(1)
+    print("Moved " + str(rebalance(sys.argv[1], int(sys.argv[2]))) + " cases")
@@ -0,0 +1,63 @@
+"""
+Created on 17 okt. 2026
+
+The module sparql contains a registry of prepared SPARQL queries, shared by the services using rdflib.
+
+rdflib parses and translates a query string to its algebra each time graph.query is called with a string. For the static
+queries of COACH, this work is done once instead: the first time a query is executed, it is compiled with prepareQuery and
+stored under its name. Later executions only evaluate the compiled query with the provided bindings.
+"""
+
+# Standard libraries
+import threading
+
+# Semantic web framework
+from rdflib.plugins.sparql import prepareQuery
+
+
+class PreparedQueries():
+
+    """
+    A registry of compiled SPARQL queries, indexed by name. It can be used from several request threads at the same time.
+    """
+
+    def __init__(self):
+        self.queries = dict()
+        self.lock = threading.Lock()
+
+
+    def prepare(self, name, text, initNs = None):
+        """
+        Returns the compiled query stored under name, compiling text with the namespaces in initNs if it is not already stored.
+        Raises a RuntimeError if a different query text has already been stored under the same name.
+        """
+        try:
+            (stored_text, compiled_query) = self.queries[name]
+        except KeyError:
+            compiled_query = prepareQuery(text, initNs = initNs or {})
+            with self.lock:
+                (stored_text, compiled_query) = self.queries.setdefault(name, (text, compiled_query))
+        if stored_text != text:
+            raise RuntimeError("The query name " + name + " is already used for another query")
+        return compiled_query
+
+
+    def query(self, graph, name, text, initNs = None, initBindings = None):
+        """
+        Executes the static query text, registered as name, on graph with the provided bindings, and returns the result.
+        As for graph.query, the namespaces bound in graph are used if initNs is not provided.
+        """
+        if initNs is None:
+            initNs = dict(graph.namespaces())
+        return graph.query(self.prepare(name, text, initNs), initBindings = initBindings or {})
+
+
+# The registry shared by all services running in the same process
+prepared_queries = PreparedQueries()
+
+
+def query(graph, name, text, initNs = None, initBindings = None):
+    """
+    Executes the static query text on graph using the shared registry. See PreparedQueries.query.
+    """
+    return prepared_queries.query(graph, name, text, initNs, initBindings)
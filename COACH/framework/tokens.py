@@ -0,0 +1,175 @@
+"""
+Created on 17 okt. 2026
+
+The module tokens contains the functionality for issuing and verifying the self-contained user and delegate tokens of COACH.
+
+A token consists of a json payload and an HMAC signature of that payload, both encoded with urlsafe base64 and separated by a dot.
+The payload contains the user id, the kind of token ("user" or "delegate"), a unique token id, an expiry time, and, for delegate tokens,
+the case the token is valid for. Since the signature can be checked by any service knowing the secret key, services do not have to
+ask the AuthenticationService for each request. Revoked tokens are instead distributed through a small revocation list, which the
+TokenVerifier polls from the AuthenticationService.
+"""
+
+# Standard libraries
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import string
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(data):
+    """
+    Returns data (bytes) as an unpadded urlsafe base64 string.
+    """
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _decode(text):
+    """
+    Inverse of _encode.
+    """
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _signature(secret_key, payload):
+    """
+    Returns the HMAC-SHA256 signature of payload, which is an encoded string.
+    """
+    return _encode(hmac.new(secret_key.encode("utf-8"), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def new_token_id(length = 16):
+    """
+    Returns a random string which is used to identify a token, e.g. in the revocation list.
+    """
+    return "".join([random.SystemRandom().choice(string.ascii_letters + string.digits) for _ in range(0, length)])
+
+
+def issue_token(secret_key, user_id, kind, lifetime, case_id = None):
+    """
+    Returns a pair (token, claims), where token is a new signed token for user_id, valid for lifetime seconds,
+    and claims is the dictionary stored in it. kind is either "user" or "delegate". Delegate tokens are bound to case_id.
+    """
+    claims = {"sub": user_id, "kind": kind, "jti": new_token_id(), "exp": int(time.time() + lifetime)}
+    if case_id is not None:
+        claims["case"] = str(case_id)
+    payload = _encode(json.dumps(claims, separators = (",", ":"), sort_keys = True).encode("utf-8"))
+    return (payload + "." + _signature(secret_key, payload), claims)
+
+
+def decode_token(secret_key, token):
+    """
+    Returns the claims of token if its signature is valid and it has not expired. Otherwise, None is returned.
+    Revocation is not checked by this function, see TokenVerifier.
+    """
+    try:
+        (payload, signature) = token.split(".")
+        if not hmac.compare_digest(_signature(secret_key, payload), signature):
+            return None
+        claims = json.loads(_decode(payload).decode("utf-8"))
+    except (AttributeError, ValueError, TypeError):
+        # Not a string, not two parts, or not valid base64/json
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims
+
+
+class TokenVerifier():
+
+    """
+    A TokenVerifier checks user and delegate tokens in-process, without calling the AuthenticationService for every request.
+    The list of revoked token ids is fetched from the AuthenticationService, at most once every revocation_poll_interval seconds.
+    It also resolves user uris locally, using the user namespace of the AuthenticationService, which is fetched once.
+    The object is shared by all request threads of a service.
+    """
+
+    def __init__(self, secret_key, authentication_service_proxy, revocation_poll_interval = 10):
+        self.secret_key = secret_key
+        self.authentication_service_proxy = authentication_service_proxy
+        self.revocation_poll_interval = revocation_poll_interval
+
+        # The revocation list maps token ids to their expiry time. It is replaced as a whole when polled.
+        self.revoked = {}
+        self.revocation_poll_time = 0
+        self.is_fetching = False
+        self.lock = threading.Lock()
+
+        self.user_namespace = None
+
+
+    def refresh_revocations(self, force = False):
+        """
+        Fetches the revocation list from the AuthenticationService, if it is older than the poll interval or if force is True.
+        If the AuthenticationService cannot be reached, the previous list is kept, and a new attempt is made at the next call.
+        """
+        # Only one thread fetches the list, outside the lock. The other threads keep using the current list meanwhile.
+        with self.lock:
+            now = time.time()
+            if self.is_fetching or (not force and now - self.revocation_poll_time < self.revocation_poll_interval):
+                return
+            self.is_fetching = True
+        try:
+            revoked = dict(self.authentication_service_proxy.get_revoked_tokens())
+        except Exception:
+            logger.exception("Could not fetch the token revocation list")
+            revoked = None
+        with self.lock:
+            self.is_fetching = False
+            if revoked is not None:
+                self.revoked = revoked
+                self.revocation_poll_time = now
+
+
+    def verify(self, token):
+        """
+        Returns the claims of token if it is correctly signed, has not expired, and has not been revoked. Otherwise, None is returned.
+        """
+        claims = decode_token(self.secret_key, token)
+        if claims is None:
+            return None
+        self.refresh_revocations()
+        if claims["jti"] in self.revoked:
+            return None
+        return claims
+
+
+    def check_user_token(self, user_id, user_token):
+        """
+        Returns True if user_token is a valid user token for user_id.
+        """
+        claims = self.verify(user_token)
+        return claims is not None and claims["kind"] == "user" and claims["sub"] == user_id
+
+
+    def check_delegate_token(self, user_id, delegate_token, case_id):
+        """
+        Returns True if delegate_token is a valid delegate token for user_id, issued for the case case_id.
+        """
+        claims = self.verify(delegate_token)
+        return (claims is not None and claims["kind"] == "delegate" and claims["sub"] == user_id
+                and claims.get("case") == str(case_id))
+
+
+    def check_token(self, user_id, token, case_id):
+        """
+        Returns True if token is either a valid user token for user_id, or a valid delegate token for user_id and case_id.
+        """
+        return self.check_user_token(user_id, token) or self.check_delegate_token(user_id, token, case_id)
+
+
+    def user_uri(self, user_id):
+        """
+        Returns the uri of user_id. The user namespace is fetched from the AuthenticationService on the first call.
+        """
+        if self.user_namespace is None:
+            self.user_namespace = self.authentication_service_proxy.get_user_namespace()
+        return self.user_namespace + user_id
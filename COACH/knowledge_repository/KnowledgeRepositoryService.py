@@ -10,22 +10,26 @@ Knowledge repository for storing data about finished decision cases to use for g
 import json
 import os
 import sys
-from collections import defaultdict
 import heapq
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 sys.path.append(os.path.join(os.curdir, os.pardir, os.pardir, os.pardir))
 
 
 from COACH.framework.coach import Microservice
 from COACH.framework.coach import endpoint
+from COACH.framework.coach import ResultCache
+from COACH.framework.tokens import TokenVerifier
+from COACH.framework import sparql
+from COACH.knowledge_repository.feature_store import FeatureStore
+from COACH.knowledge_repository import similarity
+from COACH.knowledge_repository.storage import group_case_triples
 
 from flask import request
 
-# Database connection
-from neo4j.v1 import GraphDatabase, basic_auth
-
 # Semantic web framework
 import rdflib
-from rdflib.namespace import split_uri
 import sqlalchemy
 from rdflib_sqlalchemy.store import SQLAlchemy
     
@@ -44,15 +48,46 @@ class KnowledgeRepositoryService(Microservice):
             fileData = file_.read()
         secret_data = json.loads(fileData)
 
-        # Initialize the graph database
-        self._db = GraphDatabase.driver("bolt://localhost", auth=basic_auth(secret_data["neo4j_user_name"], secret_data["neo4j_password"]))
+        # Initialize the storage of the cases, either in a Neo4j server or in an embedded SQLite database
+        storage_backend = self.get_setting("storage_backend", "neo4j")
+        if storage_backend == "neo4j":
+            from COACH.knowledge_repository.neo4j_storage import Neo4jStorage
+            self.storage = Neo4jStorage("bolt://localhost", secret_data["neo4j_user_name"], secret_data["neo4j_password"])
+        elif storage_backend == "sqlite":
+            from COACH.knowledge_repository.sqlite_storage import SQLiteStorage
+            self.storage = SQLiteStorage(os.path.join(self.working_directory, self.get_setting("sqlite_database", "knowledge_repository.db")))
+        else:
+            raise RuntimeError("Unknown storage backend {0}. Allowed backends are 'neo4j' and 'sqlite'.".format(storage_backend))
         self.orion_ns = "http://www.orion-research.se/ontology#"
         
         # Initialize proxies
         self.authentication_proxy = self.create_proxy(self.get_setting("authentication_service"))
+        self.token_verifier = TokenVerifier(secret_data["token_secret_key"], self.authentication_proxy, 
+                                            self.get_setting("token_revocation_poll_interval", 10))
         
         self.ontology = None
         
+        # The feature vectors of the stored cases, used by the similarity search
+        self.feature_store = FeatureStore(os.path.join(self.working_directory, self.get_setting("feature_store_directory", "feature_store")))
+        # If similarity_pruning is false, the similarity search scores all cases instead of using the inverted index of the feature store
+        self.similarity_pruning = self.get_setting("similarity_pruning", True)
+        # If similarity_workers is more than 1, and there are at least similarity_parallel_threshold cases to score, the cases are
+        # split in shards scored by a pool of similarity_workers processes. The pool is created here, with processes started by
+        # spawn rather than fork, since a forked process would copy the locks and threads of the service in their current state.
+        self.similarity_workers = self.get_setting("similarity_workers", 1)
+        self.similarity_parallel_threshold = self.get_setting("similarity_parallel_threshold", 50000)
+        self.similarity_pool = None
+        if self.similarity_workers > 1:
+            self.similarity_pool = ProcessPoolExecutor(self.similarity_workers, mp_context = multiprocessing.get_context("spawn"))
+            # Each task submitted while no worker is idle starts a worker, so this starts all workers before the first search
+            for future in [self.similarity_pool.submit(int) for _ in range(self.similarity_workers)]:
+                future.result()
+        
+        # The results of similarity searches are cached, with the generation of the repository in their key. The generation is
+        # increased, and the cache emptied, whenever a case is stored or deleted.
+        self.generation = 0
+        self.similarity_cache = ResultCache(self.get_setting("similarity_cache_size", 128))
+        
 
     def _get_ontology(self, case_db_proxy = None):
         """
@@ -124,8 +159,8 @@ class KnowledgeRepositoryService(Microservice):
             if not isinstance(class_name, rdflib.term.URIRef):
                 class_name = orion_ns[class_name]
             
-            query_result = self._get_ontology(case_db_proxy).query(q, initNs = {"orion": orion_ns}, 
-                                                                   initBindings = {"?class_name": rdflib.URIRef(class_name)})
+            query_result = sparql.query(self._get_ontology(case_db_proxy), "KnowledgeRepositoryService.get_ontology_instances", q, initNs = {"orion": orion_ns}, 
+                                        initBindings = {"?class_name": rdflib.URIRef(class_name)})
             class_result = []
             for line in query_result:
                 if len(returned_information) == 1:
@@ -194,54 +229,40 @@ class KnowledgeRepositoryService(Microservice):
         raise KeyError("Dictionary with the property " + key_name + " equals to " + value + " not found.")
     
             
-    def open_session(self):
-        """
-        Creates a database session and returns it.
-        """    
-        return self._db.session()
-    
-    def close_session(self, s):
+    def delete_case(self, case_uri):
         """
-        Closes a database session.
+        Deletes the relations of the case, and the nodes reachable from it which are not related to other nodes after that.
+        Nodes which are shared with other cases are kept. Only the nodes of the case are visited, so the cost does not depend
+        on the size of the knowledge repository. Orphan nodes left by other means are removed by collect_garbage.
         """
-        s.close()
+        self.storage.delete_case(case_uri)
+        self.feature_store.remove(case_uri)
+        self._repository_changed()
         
-    def query(self, query, context = {}, session = None):
+        
+    def _repository_changed(self):
         """
-        Function encapsulating the query interface to the database.
-        q is the query string, and context is an optional dictionary containing variables to be substituted into q.
-        If a session is provided, the query is executed in that session. Otherwise, a session is created, used
-        for the query, and then closed again.
+        Increases the generation of the repository, and drops the cached similarity results, which may no longer be valid.
         """
-        # Add the label to the context, so that it can be used in queries
-        if session:
-            return session.run(query, context)
-        else:
-            # If no session was provided, create one for this query and close it when done
-            with self.open_session() as s:
-                result = s.run(query, context)
-            return result
-    
-    def delete_case(self, case_uri, session=None):
-        delete_case_relations_query =   """ Match (:Case {uri: $uri}) -[r*]-> ()
-                                            UNWIND r AS rs
-                                            DETACH DELETE rs
-                                        """
-        delete_detached_node_query = """Match (n)
-                                        Where not (n) -- ()
-                                        Delete n
-                                    """
-
-        close_session = False
-        if session is None:
-            close_session = True
-            session = self.open_session()
-        self.query(delete_case_relations_query, {"uri": case_uri}, session)
-        self.query(delete_detached_node_query, session=session)
-        if close_session:
-            self.close_session(session)
+        with self.feature_store.lock:
+            self.generation += 1
+        self.similarity_cache.invalidate(["get_similar_cases"])
         
     
+    @endpoint("/collect_garbage", ["POST"], "application/json")
+    def collect_garbage(self):
+        """
+        Deletes all nodes in the knowledge repository which are not related to any other node, and returns the number of deleted nodes.
+        Since all nodes of the repository are visited, this is intended to be scheduled at times when the service is not much used.
+        """
+        (count, cases_uri) = self.storage.collect_garbage()
+        for case_uri in cases_uri:
+            self.feature_store.remove(case_uri)
+        if count > 0:
+            self._repository_changed()
+        return count
+        
+        
     @endpoint("/export_case", ["GET"], "application/json")    
     def export_case(self, graph_description, format_):
         """
@@ -256,7 +277,7 @@ class KnowledgeRepositoryService(Microservice):
                                                 FILTER(isBlank(?s) || isBlank(?o))
                                             }
                                         """
-        query_result = list(case_graph.query(check_blank_node_absence_query))
+        query_result = list(sparql.query(case_graph, "KnowledgeRepositoryService.export_case.blank_nodes", check_blank_node_absence_query))
         if len(query_result) != 0:
             raise RuntimeError("Blank node are not handled when exporting data to the knowledge repository, but {0} were found."
                                .format(len(query_result)))
@@ -269,7 +290,7 @@ class KnowledgeRepositoryService(Microservice):
                                         GROUP BY ?s ?p
                                         HAVING (count(?o) > 1)
                                     """
-        query_result = list(case_graph.query(check_unique_literal_query))
+        query_result = list(sparql.query(case_graph, "KnowledgeRepositoryService.export_case.unique_literals", check_unique_literal_query))
         if len(query_result) != 0:
             subjet_uri = str(query_result[0][0].toPython())
             predicate = str(query_result[0][1].toPython())
@@ -281,109 +302,66 @@ class KnowledgeRepositoryService(Microservice):
             
         
         
-        with self.open_session() as session:
-            # The case is deleted from the knowledge repository to handle suppressed nodes from the database
-            case_uri = case_graph.query("SELECT ?case_uri WHERE {?case_uri a orion:Case.}", initNs={"orion": rdflib.Namespace(self.orion_ns)})
-            if len(case_uri) != 1:
-                raise RuntimeError("There must be exactly one case in the provided graph, but {0} were found.".format(len(case_uri)))
-            case_uri = list(case_uri)[0][0].toPython()
-            self.delete_case(case_uri, session)
-            
-            for s, p, o in case_graph:
-                if isinstance(s, rdflib.term.Literal):
-                    raise RuntimeError("A subject must not be a Literal")
-                
-                predicate_name = split_uri(p)[1]
-                if predicate_name == "uri":
-                    raise RuntimeError("Can not handle triplet whose predicate name is 'uri', as it is already used for the identifier " +
-                                       "property in neo4j. Triplet is :({0}, {1}, {2}).".format(s, p, o))
-                    
-                if predicate_name == "type":
-                    if not str(o).startswith(self.orion_ns):
-                        raise RuntimeError("The type of a node must be in the ontology namespace")
-                    label = str(o)[len(self.orion_ns):]
-                    # Can not use a parameter for label, as it is not supported in neo4j
-                    # TODO: Malicious code injection might be possible
-                    query = "MERGE (node {uri: $uri}) SET node :`" + label + "`"
-                    self.query(query, {"uri": str(s)}, session)
-                    continue
-                    
-                if isinstance(o, rdflib.term.Literal):
-                    # Can not use the name of the property as a parameter, as it is not supported in neo4j
-                    # TODO: Malicious code injection might be possible
-                    query = "MERGE (node {uri: $uri}) SET node.`" + predicate_name + "` = $value"
-                    self.query(query, {"uri": str(s), "value":o.toPython()}, session)
-                    continue
-                
-                # TODO: Malicious code injection might be possible
-                query = """ MERGE (subject_node {uri: $subject_uri}) 
-                            MERGE (object_node {uri: $object_uri})
-                            MERGE (subject_node) -[:`""" + predicate_name + """`]-> (object_node)
-                        """
-                self.query(query, {"subject_uri": str(s), "object_uri": str(o)}, session)
+        case_uri = sparql.query(case_graph, "KnowledgeRepositoryService.export_case.case_uri", "SELECT ?case_uri WHERE {?case_uri a orion:Case.}", initNs={"orion": rdflib.Namespace(self.orion_ns)})
+        if len(case_uri) != 1:
+            raise RuntimeError("There must be exactly one case in the provided graph, but {0} were found.".format(len(case_uri)))
+        case_uri = list(case_uri)[0][0].toPython()
+        
+        # The triples are grouped by the kind of write they need, so that each group can be written at once. The storage replaces
+        # the previous version of the case, to handle suppressed nodes from the database.
+        (nodes_uri, labels, properties, relations) = group_case_triples(case_graph, self.orion_ns)
+        self.storage.store_case(case_uri, nodes_uri, labels, properties, relations)
+        
+        # Once the feature store has a layout, it is kept up to date with the stored cases. Before that, it is filled by the first 
+        # similarity search.
+        with self.feature_store.lock:
+            if self.feature_store.layout is not None:
+                self.feature_store.put(case_uri, self._compute_feature_vector(case_uri, self.feature_store.layout))
+        self._repository_changed()
                 
         
     @endpoint("/get_cases", ["GET"], "application/json")
     def get_cases(self, user_id):
-        query = """ Match ({uri: $user_uri}) <-[:person]- (:Role) <-[:role]- (case:Case)
-                    Return case
-                """
-        user_uri = self.authentication_proxy.get_user_uri(user_id=user_id)
-        query_result = self.query(query, {"user_uri": user_uri})
-        result = [[e[0].properties["uri"], e[0].properties["title"]] for e in query_result]
-        return result
+        user_uri = self.token_verifier.user_uri(user_id)
+        return self.storage.get_user_cases(user_uri)
     
     @endpoint("/import_case", ["GET"], "application/json")
     def import_case(self, case_uri, format_):
-        query = """ MATCH (case:Case {uri:$case_uri}) -[r*]-> (n)
-                    RETURN n, case, r
-                """
-        query_result = self.query(query, {"case_uri": case_uri})
-        case_graph = self.get_graph_from_query_result(list(query_result))
-        
+        case_graph = rdflib.Graph()
+        case_graph.parse(data = "".join(self._get_case_triples(case_uri)), format = "nt")
         return case_graph.serialize(format=format_).decode("utf8")
+    
+    
+    @endpoint("/import_case_triples", ["GET"], "application/n-triples")
+    def import_case_triples(self, case_uri):
+        """
+        Returns all data stored for a case in N-Triples format. The triples are streamed to the client while they are read from 
+        the database, without building the whole description first.
+        """
+        return self._get_case_triples(case_uri)
+    
+    
+    def _get_case_triples(self, case_uri):
+        """
+        DESCRIPTION:
+            Generates the triples describing a case, i.e. the properties and types of the case node and of the nodes reachable from it, 
+            and the relations starting in these nodes. Properties are returned as plain literals.
+        INPUT:
+            case_uri: The uri of the case.
+        OUTPUT:
+            A generator of lines in N-Triples format, each one ending with a line break.
+        """
+        rdf_type = "<" + str(rdflib.RDF.type) + ">"
+        for (uri, properties, labels) in self.storage.get_case_nodes(case_uri):
+            subject = "<" + uri + ">"
+            for (key, value) in properties.items():
+                object_ = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+                yield '{0} <{1}> "{2}" .\n'.format(subject, self.orion_ns + key, object_)
+            for label in labels:
+                yield "{0} {1} <{2}> .\n".format(subject, rdf_type, self.orion_ns + label)
             
-    def get_graph_from_query_result(self, query_result_list):
-        graph_description = ""
-        id_to_uri = {}
-        
-        # Get the description of the case
-        graph_description += self.get_node_description(query_result_list[0][1], id_to_uri)
-        for entry in query_result_list:
-            graph_description += self.get_node_description(entry[0], id_to_uri)
-        
-        for entry in query_result_list:
-            relations_list = entry[2]
-            for relation in relations_list:
-                subject_uri = id_to_uri[relation.start]
-                object_uri = id_to_uri[relation.end]
-                predicate = self.orion_ns + relation.type
-                graph_description += "<{0}> <{1}> <{2}> .\n".format(subject_uri, predicate, object_uri)
-        
-        case_graph = rdflib.Graph()
-        case_graph.parse(data=graph_description, format="n3")
-        return case_graph
-    
-    def get_node_description(self, node, id_to_uri_dict):
-        node_uri = node.properties["uri"]
-        del node.properties["uri"]
-        if node.id in id_to_uri_dict:
-            return ""       
-        id_to_uri_dict[node.id] = node_uri
-        
-        result = ""
-        for key in node.properties:
-            subject = node_uri
-            predicate = self.orion_ns + key
-            object_ = str(node.properties[key]).replace("\n", "\\u000A").replace("\r", "\\u000D").replace('"', "\\u0022")
-            result += '<{0}> <{1}> "{2}" .\n'.format(subject, predicate, object_)
-        
-        try:
-            node_type = self.orion_ns + node.labels.pop()
-            result += "<" + node_uri + "> " + "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <" + node_type + "> .\n"
-        except KeyError:
-            pass
-        return result
+        for (subject_uri, predicate_name, object_uri) in self.storage.get_case_relations(case_uri):
+            yield "<{0}> <{1}> <{2}> .\n".format(subject_uri, self.orion_ns + predicate_name, object_uri)
     
     
     @endpoint("/get_similar_cases", ["GET"], "application/json")
@@ -393,6 +371,72 @@ class KnowledgeRepositoryService(Microservice):
         db_infos = {"user_id": user_id, "user_token": user_token, "case_id": case_uri}
            
         # Get all necessary data from the ontology
+        layout = self._get_feature_layout(case_db_proxy)
+             
+        # Compute vectors. Only the vectors of the current case are computed, those of the stored cases are in the feature store.
+        case_vectors = self._get_case_vectors(db_infos, case_db_proxy, layout["goal"], layout["stakeholders"], layout["context"],
+                                              layout["context_categories"], True)
+        self._update_feature_store(layout)
+        query_vector = case_vectors["goal"]["vector"] + case_vectors["stakeholders"]["vector"] + case_vectors["context"]["vector"]
+        if number_of_returned_case <= 0:
+            return []
+        
+        # The result is the same as long as the vector of the case, the parameters and the repository are the same. The generation 
+        # is read before the search, so that a result computed while a case is stored is never found in the cache.
+        cache_key = self.similarity_cache.key("get_similar_cases", 
+                                              {"vector": hashlib.sha256(json.dumps(query_vector).encode("utf8")).hexdigest(),
+                                               "case_uri": case_uri, "number_of_returned_case": number_of_returned_case, 
+                                               "number_ratio_threshold": number_ratio_threshold, "goal_weight": goal_weight, 
+                                               "context_weight": context_weight, "stakeholders_weight": stakeholders_weight,
+                                               "generation": self.generation})
+        (found, result) = self.similarity_cache.get(cache_key)
+        if found:
+            return result
+        
+        # Scoring phase: the similarity of the stored cases is computed from their feature vectors. Unless pruning is disabled, 
+        # only the cases sharing an informative component with the current case are scored, since the others have a similarity of 0.
+        # Only the number_of_returned_case most similar cases are kept. Between cases with the same similarity, those with the 
+        # largest titles are kept, so that only the titles of these cases are fetched to break the ties.
+        segments = self._get_similarity_segments(case_vectors, goal_weight, context_weight, stakeholders_weight)
+        cases_uri_list = self.feature_store.candidates(query_vector) if self.similarity_pruning else None
+        candidates = self._score_cases(query_vector, segments, number_ratio_threshold, number_of_returned_case, cases_uri_list, case_uri)
+        candidates = self._break_ties(candidates, number_of_returned_case)
+        
+        # Hydration phase: the details and estimations of the kept cases are fetched, with one query for all cases for each
+        cases_details = self._get_cases_details([current_case_uri for (_, current_case_uri) in candidates])
+        cases_properties = self._get_cases_properties_estimation_methods({current_case_uri: cases_details[current_case_uri][2] 
+                                                                          for (_, current_case_uri) in candidates})
+        
+        # result_heap either contains less than number_of_returned_case element, or contains the top number_of_returned_case cases
+        # according to their similarity
+        result_heap = []
+        for (current_similarity, current_case_uri) in candidates:
+            (current_case_title, selected_alternative, alternatives_name_list) = cases_details[current_case_uri]
+            if len(result_heap) == number_of_returned_case:
+                heapq.heappushpop(result_heap, (current_similarity, current_case_title, selected_alternative, alternatives_name_list, 
+                                   cases_properties[current_case_uri]))
+            else:
+                heapq.heappush(result_heap, (current_similarity, current_case_title, selected_alternative, alternatives_name_list,
+                   cases_properties[current_case_uri]))
+                
+        result_heap.sort()
+        result_heap.reverse()
+        self.similarity_cache.put(cache_key, result_heap, {"pure": True})
+        return result_heap
+        
+    
+    def _get_feature_layout(self, case_db_proxy):
+        """
+        DESCRIPTION:
+            Returns the layout of the case vectors, i.e. the ontology data used to compute them.
+        INPUT:
+            case_db_proxy: The proxy to access database. It can be omitted if the ontology has already been got from the database.
+        OUTPUT:
+            A dictionary with the keys "goal" and "stakeholders", containing the lists of goal and stakeholder uris in the ontology,
+            "context_categories", the list of context categories, and "context", a dictionary containing for each context category
+            the list of [grade_id, type, possible_values] of its entries in the ontology.
+            It only contains json serializable data, so that it can be stored in the feature store.
+        """
         goal_class_in_ontology = ["CustomerValue", "FinancialValue", "InternalBusinessValue", "InnovationAndLearningValue", "MarketValue"]
         goal_uri_from_ontology_list = self._get_ontology_instances(None, case_db_proxy, goal_class_in_ontology, [0])
              
@@ -405,53 +449,156 @@ class KnowledgeRepositoryService(Microservice):
         context_from_ontology = {}
         for (database_name, ontology_name) in zip(context_categories_in_database, context_categories_in_ontology):
             context_from_ontology[database_name] = self._get_ontology_instances(ontology_name, case_db_proxy, None, (1, 4, 5))
-             
-        # Compute vectors
-        case_vectors = self._get_case_vectors(db_infos, case_db_proxy, goal_uri_from_ontology_list, stakeholder_uri_from_ontology_list, 
-                                              context_from_ontology, context_categories_in_database, True)
-        
-        # result_heap either contains less than number_of_returned_case element, or contains the top number_of_returned_case cases
-        # according to their similarity
-        result_heap = []
-        cases_uri_list = [case_node[0].properties["uri"] for case_node in self.query("MATCH (case:Case) RETURN case")]
-         
-        for current_case_uri in cases_uri_list:
-            if current_case_uri == case_uri:
-                continue
-            
-            db_infos["case_id"] = current_case_uri
-            current_case_vectors = self._get_case_vectors(db_infos, case_db_proxy, goal_uri_from_ontology_list, 
-                                                          stakeholder_uri_from_ontology_list, context_from_ontology, 
-                                                          context_categories_in_database, False)
-             
-            similarity = self._compute_similarity(case_vectors, current_case_vectors, number_ratio_threshold, goal_weight, context_weight, 
-                                                  stakeholders_weight)
-            if similarity == 0:
-                continue
-            
-            current_case_node = list(self.query("MATCH (c:Case {uri: $uri}) RETURN c", {"uri": current_case_uri}))[0][0]
-            current_case_title = current_case_node.properties["title"]
-            alternatives_name_list = self._get_alternative(current_case_uri)
             
-            query_selected_alternative = """MATCH (:Case {uri :$uri}) -[:selected_alternative]-> (alt:Alternative)
-                                            RETURN alt.title"""
-            try:
-                selected_alternative = list(self.query(query_selected_alternative, {"uri": current_case_uri}))[0][0]
-            except IndexError:
-                selected_alternative = None               
-
-            if len(result_heap) == number_of_returned_case:
-                heapq.heappushpop(result_heap, (similarity, current_case_title, selected_alternative, alternatives_name_list, 
-                                   self._get_properties_estimation_methods(current_case_uri, alternatives_name_list)))
-            else:
-                heapq.heappush(result_heap, (similarity, current_case_title, selected_alternative, alternatives_name_list,
-                   self._get_properties_estimation_methods(current_case_uri, alternatives_name_list)))
-                
-        result_heap.sort()
-        result_heap.reverse()
-        return result_heap
+        return {"goal": goal_uri_from_ontology_list, "stakeholders": stakeholder_uri_from_ontology_list, 
+                "context_categories": context_categories_in_database, "context": context_from_ontology}
+    
+    
+    def _get_feature_columns(self, layout):
+        """
+        DESCRIPTION:
+            Returns the length of the feature vectors computed with layout, and the columns of their single select components.
+        INPUT:
+            layout: The layout of the case vectors, as returned by _get_feature_layout.
+        OUTPUT:
+            A pair (width, single_select_columns), where width is the sum of the lengths of the goal, stakeholder and context vectors.
+        """
+        width = len(layout["goal"]) + len(layout["stakeholders"])
+        single_select_columns = []
+        for category_name in layout["context_categories"]:
+            for (_, current_type, current_possible_values_list) in layout["context"][category_name]:
+                if current_type in ["integer", "float"]:
+                    width += 1
+                elif current_type == "single_select":
+                    single_select_columns.append(width)
+                    width += 1
+                elif current_type == "multi_select":
+                    width += len(current_possible_values_list)
+        return (width, single_select_columns)
+    
+    
+    def _compute_feature_vector(self, case_uri, layout):
+        """
+        DESCRIPTION:
+            Computes the feature vector of a case stored in the knowledge repository.
+        INPUT:
+            case_uri: The uri of the case.
+            layout: The layout of the case vectors, as returned by _get_feature_layout.
+        OUTPUT:
+            The concatenation of the goal, stakeholder and context vectors of the case.
+        """
+        case_vectors = self._get_case_vectors({"case_id": case_uri}, None, layout["goal"], layout["stakeholders"], layout["context"],
+                                              layout["context_categories"], False)
+        return case_vectors["goal"]["vector"] + case_vectors["stakeholders"]["vector"] + case_vectors["context"]["vector"]
+    
+    
+    def _get_similarity_segments(self, case_vectors, goal_weight, context_weight, stakeholders_weight):
+        """
+        DESCRIPTION:
+            Returns the segments of the feature vectors, in the format used by similarity.compute_similarities.
+        INPUT:
+            case_vectors: The vectors of a case, from which the lengths of the segments and the indexes of number and single 
+                select components are taken.
+            goal_weight, context_weight, stakeholders_weight: The weights of the segments in the similarity.
+        OUTPUT:
+            A list of tuples (start, end, types, weight) for the goal, context and stakeholder segments, where start and end are
+            the positions of the segment in the feature vectors.
+        """
+        start = 0
+        positions = {}
+        for name in ["goal", "stakeholders", "context"]:
+            positions[name] = (start, start + len(case_vectors[name]["vector"]))
+            start += len(case_vectors[name]["vector"])
         
+        result = []
+        for (name, weight) in [("goal", goal_weight), ("context", context_weight), ("stakeholders", stakeholders_weight)]:
+            (start, end) = positions[name]
+            types = similarity.column_types(end - start, case_vectors[name]["number_indexes"], case_vectors[name]["single_select_indexes"])
+            result.append((start, end, types, weight))
+        return result
+    
+    
+    def _score_cases(self, query_vector, segments, number_ratio_threshold, number_of_returned_case, cases_uri_list, excluded_case_uri):
+        """
+        DESCRIPTION:
+            Computes the similarity between a case and the cases of the feature store, and returns the most similar ones. 
+            The scoring is split in shards across the process pool if there are enough cases to score. Otherwise, it is done in the
+            current thread.
+        INPUT:
+            query_vector: The feature vector of the case.
+            segments: The segments of the feature vectors, as returned by _get_similarity_segments.
+            number_ratio_threshold: The ratio under which two numbers are considered as equal.
+            number_of_returned_case: The number of cases to keep.
+            cases_uri_list: The uris of the cases to score, or None to score all cases of the feature store.
+            excluded_case_uri: The uri of the case, which is not scored.
+        OUTPUT:
+            A list of pairs (similarity, case_uri) for the number_of_returned_case most similar cases, and the cases with the same 
+            similarity as the last one. Cases with a similarity of 0 are left out.
+        """
+        number_of_cases = len(self.feature_store.rows) if cases_uri_list is None else len(cases_uri_list)
+        if self.similarity_workers > 1 and number_of_cases >= self.similarity_parallel_threshold:
+            # The rows read by the workers are pinned rather than locked, so that the store can be changed meanwhile. The excluded case
+            # is left out of the results, so each shard returns one more case.
+            (case_uris_by_row, shards, shape) = self.feature_store.pin_shards(self.similarity_workers, cases_uri_list)
+            try:
+                futures = [self.similarity_pool.submit(similarity.score_shard, self.feature_store.matrix_path, shape, rows, 
+                                                       query_vector, segments, number_ratio_threshold, number_of_returned_case + 1)
+                           for rows in shards]
+                candidates = [(current_similarity, case_uris_by_row[row]) for future in futures 
+                              for (current_similarity, row) in future.result() if case_uris_by_row[row] != excluded_case_uri]
+            finally:
+                self.feature_store.unpin()
+            return similarity.top_candidates(candidates, number_of_returned_case)
+        (cases_uri_list, feature_matrix) = self.feature_store.snapshot(cases_uri_list)
+            
+        similarities = similarity.compute_similarities(query_vector, feature_matrix, segments, number_ratio_threshold)
+        candidates = [(current_similarity, current_case_uri) for (current_case_uri, current_similarity) 
+                      in zip(cases_uri_list, similarities.tolist()) if current_case_uri != excluded_case_uri and current_similarity != 0]
+        return similarity.top_candidates(candidates, number_of_returned_case)
     
+    
+    def _break_ties(self, candidates, number_of_returned_case):
+        """
+        DESCRIPTION:
+            Keeps number_of_returned_case cases among the candidates, which are the most similar cases and the cases with the same 
+            similarity as the last one. Between the cases with the similarity of the last one, those with the largest titles are 
+            kept, and then those with the largest uris.
+        INPUT:
+            candidates: A list of pairs (similarity, case_uri), as returned by _score_cases.
+            number_of_returned_case: The number of cases to keep.
+        OUTPUT:
+            A list of at most number_of_returned_case pairs (similarity, case_uri).
+        """
+        if len(candidates) <= number_of_returned_case:
+            return candidates
+        similarity_threshold = min(current_similarity for (current_similarity, _) in candidates)
+        kept = [candidate for candidate in candidates if candidate[0] > similarity_threshold]
+        tied_uri_list = [current_case_uri for (current_similarity, current_case_uri) in candidates 
+                         if current_similarity == similarity_threshold]
+        titles = self.storage.get_cases_titles(tied_uri_list)
+        tied_uri_list = heapq.nlargest(number_of_returned_case - len(kept), tied_uri_list,
+                                       key = lambda current_case_uri: (titles.get(current_case_uri) or "", current_case_uri))
+        return kept + [(similarity_threshold, current_case_uri) for current_case_uri in tied_uri_list]
+    
+    
+    def _update_feature_store(self, layout):
+        """
+        DESCRIPTION:
+            Recomputes the feature vectors of all cases in the knowledge repository if the feature store was filled with another 
+            layout, or has not been filled yet. Otherwise, the feature store is up to date, and nothing is done.
+        INPUT:
+            layout: The current layout of the case vectors, as returned by _get_feature_layout.
+        """
+        with self.feature_store.lock:
+            if self.feature_store.layout == layout:
+                return
+            cases_uri_list = self.storage.get_cases_uri()
+            vectors = {case_uri: self._compute_feature_vector(case_uri, layout) for case_uri in cases_uri_list}
+            (width, single_select_columns) = self._get_feature_columns(layout)
+            self.feature_store.reset(layout, width, single_select_columns, vectors)
+        self._repository_changed()
+        
+        
     def _get_case_vectors(self, db_infos, case_db_proxy, goal_uri_from_ontology_list, stakeholder_uri_from_ontology_list, 
                           context_from_ontology, context_categories_name, get_information_from_database):
         result = {}
@@ -474,11 +621,7 @@ class KnowledgeRepositoryService(Microservice):
     
     
     def _get_goal_from_knowledge_repository(self, case_uri):
-        query = """ MATCH (:Case {uri: $case_uri}) -[:goal]-> () --> (goal)
-                    RETURN goal.uri
-        """
-        query_result = self.query(query, {"case_uri": case_uri})
-        return [e[0] for e in query_result]
+        return self.storage.get_case_goals(case_uri)
     
     def _get_goal_from_database(self, db_infos, case_db_proxy):
         orion_ns = rdflib.Namespace(self.orion_ns)
@@ -499,20 +642,18 @@ class KnowledgeRepositoryService(Microservice):
     
     
     def _get_stakeholders_from_knowledge_repository(self, case_uri):
-        query = """ MATCH (:Case {uri :$case_uri}) -[:role]-> (:Role) --> (stakeholder_type)
-                    RETURN stakeholder_type.uri
-        """
-        query_result = self.query(query, {"case_uri": case_uri})
-        return [e[0] for e in query_result]
+        return self.storage.get_case_stakeholder_types(case_uri)
     
     def _get_stakeholders_from_database(self, db_infos, case_db_proxy):
         orion_ns = rdflib.Namespace(self.orion_ns)
         case_uri = db_infos["case_id"]
         roles_uri_list = case_db_proxy.get_objects(**db_infos, subject=case_uri, predicate=orion_ns.role)
         
+        with case_db_proxy.batch() as batch:
+            roles_predicate_objects = [batch.get_predicate_objects(**db_infos, subject=role_uri) for role_uri in roles_uri_list]
         result = []
-        for role_uri in roles_uri_list:
-            result += [object_ for (_, object_) in case_db_proxy.get_predicate_objects(**db_infos, subject=role_uri)]
+        for predicate_objects in roles_predicate_objects:
+            result += [object_ for (_, object_) in predicate_objects.value]
         return result
     
     def _get_stakeholder_components(self, db_infos, case_db_proxy, stakeholder_uri_from_ontology_list, get_stakeholders_from_database):
@@ -525,15 +666,7 @@ class KnowledgeRepositoryService(Microservice):
     
     
     def _get_context_from_knowledge_repository(self, case_uri, category_name):
-        # Cypher does not allow parameter for a relation's label, so string format is used instead.
-        query = """ MATCH (:Case {{uri: $case_uri}}) -[:context]-> () -[:{0}]-> () -[grade_id]-> (value)
-                    RETURN grade_id, value.value
-        """
-        query_result = self.query(query.format(category_name), {"case_uri": case_uri})
-        context_in_case = defaultdict(list)
-        for record in query_result:
-            context_in_case[record[0].type].append(record[1])
-        return context_in_case
+        return self.storage.get_case_context(case_uri, category_name)
         
         
     def _get_context_from_database(self, db_infos, case_db_proxy, category_name):
@@ -595,112 +728,50 @@ class KnowledgeRepositoryService(Microservice):
         return (result, number_indexes, single_select_indexes)
     
     
-    def _compute_similarity(self, vectors_dict_1, vectors_dict_2, number_ratio_threshold, goal_weight, context_weight, stakeholders_weight):
-        goal_vector_1 = vectors_dict_1["goal"]["vector"]
-        goal_vector_2 = vectors_dict_2["goal"]["vector"]
-        number_indexes = vectors_dict_1["goal"]["number_indexes"]
-        single_select_indexes = vectors_dict_1["goal"]["single_select_indexes"]
-        goal_information = self._do_compute_similarity(goal_vector_1, goal_vector_2, number_ratio_threshold, number_indexes, 
-                                                       single_select_indexes)
-        goal_similarity = goal_information[0]
-        goal_weight *= goal_information[1]
-        
-        context_vector_1 = vectors_dict_1["context"]["vector"]
-        context_vector_2 = vectors_dict_2["context"]["vector"]
-        number_indexes = vectors_dict_1["context"]["number_indexes"]
-        single_select_indexes = vectors_dict_1["context"]["single_select_indexes"]
-        context_information = self._do_compute_similarity(context_vector_1, context_vector_2, number_ratio_threshold, number_indexes, 
-                                                          single_select_indexes)
-        context_similarity = context_information[0]
-        context_weight *= context_information[1]
-        
-        stakeholders_vector_1 = vectors_dict_1["stakeholders"]["vector"]
-        stakeholders_vector_2 = vectors_dict_2["stakeholders"]["vector"]
-        number_indexes = vectors_dict_1["stakeholders"]["number_indexes"]
-        single_select_indexes = vectors_dict_1["stakeholders"]["single_select_indexes"]
-        stakeholders_information = self._do_compute_similarity(stakeholders_vector_1, stakeholders_vector_2, number_ratio_threshold,
-                                                                number_indexes, single_select_indexes)
-        stakeholders_similarity = stakeholders_information[0]
-        stakeholders_weight *= stakeholders_information[1]
-        
-        try:
-            return ((goal_similarity * goal_weight + context_similarity * context_weight + stakeholders_similarity * stakeholders_weight) /
-                    (goal_weight + context_weight + stakeholders_weight))
-        except ZeroDivisionError:
-            return 0
-    
-    
-    def _do_compute_similarity(self, case_vector_1, case_vector_2, number_ratio_threshold, number_indexes, single_select_indexes):
-        vector_length = len(case_vector_1)
-        if vector_length != len(case_vector_2):
-            raise RuntimeError("Both vectors must have the same length, but length are {0} and {1}."
-                               .format(vector_length, len(case_vector_2)))
-        
-        # Jaccard index is used to compute similarity
-        number_of_components_both_1 = 0 # Component are identical
-        number_of_components_both_0 = 0 # No information provided
-        # Components are different is computed by vector_lentgth - identical - no_information
-        
-        for i in range(vector_length):
-            value1 = abs(case_vector_1[i])
-            value2 = abs(case_vector_2[i])
-            value_min = min(value1, value2)
-            value_max = max(value1, value2)
-            
-            if i in single_select_indexes:
-                if value_max == 0:
-                    number_of_components_both_0 += 1
-                elif value_min == value_max:
-                    number_of_components_both_1 += 1
-                    
-            elif i in number_indexes:
-                if value_max == 0:
-                    number_of_components_both_0 += 1
-                elif value_min != 0 and value_max / value_min < number_ratio_threshold:
-                    number_of_components_both_1 += 1
-            
-            else:
-                if value_max > 1:
-                    raise RuntimeError("When the component is neither a number nor a single select, value in the cases' vector must be " +
-                                       "0 or 1, but it is {0} for index {1}.".format(value_max, i))
-                if value_max == 0:
-                    number_of_components_both_0 += 1
-                elif value_min == 1:
-                    number_of_components_both_1 += 1
-             
-        try:
-            number_of_meaningful_components = vector_length - number_of_components_both_0
-            return (number_of_components_both_1 / number_of_meaningful_components, number_of_meaningful_components)
-        except ZeroDivisionError:
-            return (0, 0)
-        
-    def _get_alternative(self, case_uri):
-        query = """ MATCH (:Case {uri: $uri}) -[:alternative]-> (alternative:Alternative)
-                    RETURN alternative.title
-                """
-        
-        result = [alt[0] for alt in self.query(query, {"uri": case_uri})]
-        return result
+    def _get_cases_details(self, cases_uri_list):
+        """
+        DESCRIPTION:
+            Returns the details of several cases, which are shown for similar cases.
+        INPUT:
+            cases_uri_list: The list of the uris of the cases.
+        OUTPUT:
+            A dictionary containing for each case uri a tuple (title, selected_alternative, alternatives_name_list), where
+            selected_alternative is the title of the selected alternative, or None if no alternative has been selected.
+        """
+        return self.storage.get_cases_details(cases_uri_list)
+    
     
     @endpoint("/_get_properties_estimation_methods", ["GET"], "application/json")
     def _get_properties_estimation_methods(self, case_uri, alternatives_name_list):
-        query = """ MATCH (case:Case {uri: $uri}) -[:property]-> (property:Property) -[:ontology_id]-> (prop_ontology_id)
-                    MATCH (property) <-[:belong_to_property]- (estimation:Estimation) -[:ontology_id]-> (estimation_ontology_id)
-                    MATCH (estimation) -[:belong_to_alternative]-> (alternative:Alternative)
-                    RETURN DISTINCT prop_ontology_id.uri, estimation_ontology_id.uri, estimation, alternative.title
-                """
-        query_result = self.query(query, {"uri": case_uri})
+        return self._get_cases_properties_estimation_methods({case_uri: alternatives_name_list})[case_uri]
+    
+    
+    def _get_cases_properties_estimation_methods(self, alternatives_name_lists):
+        """
+        DESCRIPTION:
+            Returns the estimations of the properties of several cases, with one query for all cases.
+        INPUT:
+            alternatives_name_lists: A dictionary containing for each case uri the list of the titles of its alternatives.
+        OUTPUT:
+            A dictionary containing for each case uri a list of dictionaries with the keys "property_name" and "estimation_methods".
+            The latter is a list of dictionaries with the keys "estimation_method_name" and "estimated_values", where estimated values
+            contains, for each alternative in the same order as in alternatives_name_lists, the value of the estimation.
+        """
+        estimations = self.storage.get_cases_estimations(list(alternatives_name_lists))
 
-        result = []
-        for record in query_result:
-            property_name = self._get_estimation_method_property_ontology_id_name(record[0], True, False)
+        results = {case_uri: [] for case_uri in alternatives_name_lists}
+        for record in estimations:
+            result = results[record[0]]
+            alternatives_name_list = alternatives_name_lists[record[0]]
+            
+            property_name = self._get_estimation_method_property_ontology_id_name(record[1], True, False)
             try:
                 property_dictionary = self._find_dictionary_in_list(result, "property_name", property_name) 
             except KeyError:
                 property_dictionary = {"property_name": property_name, "estimation_methods": []}
                 result.append(property_dictionary)
             
-            em_name = self._get_estimation_method_property_ontology_id_name(record[1], False, False)
+            em_name = self._get_estimation_method_property_ontology_id_name(record[2], False, False)
             try:
                 em_dictionary = self._find_dictionary_in_list(property_dictionary["estimation_methods"], "estimation_method_name", em_name)
             except KeyError:
@@ -708,14 +779,14 @@ class KnowledgeRepositoryService(Microservice):
                 em_dictionary = {"estimation_method_name": em_name, "estimated_values": estimated_values}
                 property_dictionary["estimation_methods"].append(em_dictionary)
             
-            alternative_name = record[3]
+            alternative_name = record[4]
             estimated_value = self._find_dictionary_in_list(em_dictionary["estimated_values"], "alternative_name", alternative_name)
 
-            estimation = record[2]
-            estimated_value["up_to_date"] = estimation.properties["up_to_date"]
-            estimated_value["value"] = estimation.properties["value"]
+            estimation_properties = record[3]
+            estimated_value["up_to_date"] = estimation_properties["up_to_date"]
+            estimated_value["value"] = estimation_properties["value"]
             
-        return result
+        return results
 
 if __name__ == "__main__":
     KnowledgeRepositoryService(sys.argv[1]).run()
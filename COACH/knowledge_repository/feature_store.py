@@ -0,0 +1,339 @@
+"""
+Created on 17 okt. 2026
+
+The module feature_store contains the storage of the case feature vectors used by the similarity search of the knowledge repository.
+
+The feature vector of a case is the concatenation of its goal, stakeholder and context vectors. The vectors of all cases are kept
+in a float32 matrix in a memory-mapped file, with one row per case, and an index file in json format, which maps case uris to rows.
+The index also contains the layout of the vectors, i.e. the ontology data from which they were computed. If the layout changes,
+the stored vectors are no longer valid, and the store is reset.
+
+Changes of the rows of cases are appended to a log file, one json line per change, after the row of the case has been written in
+the matrix, so that storing a case does not rewrite the whole index. The log is replayed over the index file when the store is
+opened. The index file is rewritten, and the log emptied, when the log becomes longer than the index.
+
+The store also maintains an inverted index in memory, from the informative components of the vectors to the cases having them.
+A component is informative if it is not 0, and the key of a single select component also includes its value. Two cases can only
+have a similarity above 0 if they have a common key, which allows the similarity search to skip all other cases.
+
+The worker processes of the similarity search read the rows of the matrix file without the lock of the store. While they do so,
+the rows are pinned: a case which is stored again is given a new row, and the rows of changed or removed cases are only reused
+once no rows are pinned. The store is not reset while rows are pinned.
+"""
+
+# Standard libraries
+from collections import defaultdict
+import json
+import os
+import threading
+
+# Numerical computation
+import numpy
+
+
+class FeatureStore():
+
+    """
+    A FeatureStore keeps one feature vector per case, and is updated incrementally when cases are stored in or deleted from the
+    knowledge repository. The object is shared by all request threads of the service.
+    """
+
+    def __init__(self, directory, initial_capacity = 64, minimum_log_length = 1024):
+        self.matrix_path = os.path.join(directory, "case_features.f32")
+        self.index_path = os.path.join(directory, "case_features.json")
+        self.log_path = os.path.join(directory, "case_features.log")
+        self.initial_capacity = initial_capacity
+        self.minimum_log_length = minimum_log_length
+        self.lock = threading.RLock()
+        self.unpinned = threading.Condition(self.lock)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # layout is None until the store has been filled for a layout. rows maps case uris to row numbers in the matrix,
+        # and free_rows is a stack of the unused rows, with the lowest row on top.
+        self.layout = None
+        self.width = 0
+        self.capacity = 0
+        self.rows = {}
+        self.free_rows = []
+        self.matrix = None
+        self.log_file = None
+        self.log_length = 0
+
+        # The number of searches having pinned rows, and the rows which are released once none has
+        self.pins = 0
+        self.pinned_free_rows = []
+        
+        # The columns of single select components, and the inverted index from keys to sets of case uris
+        self.single_select_columns = set()
+        self.inverted_index = defaultdict(set)
+
+        if os.path.isfile(self.index_path) and os.path.isfile(self.matrix_path):
+            with open(self.index_path, "r") as file:
+                index = json.load(file)
+            self.layout = index["layout"]
+            self.width = index["width"]
+            self.capacity = index["capacity"]
+            self.rows = index["rows"]
+            self.single_select_columns = set(index.get("single_select_columns", []))
+            if os.path.isfile(self.log_path):
+                self._replay_log()
+            used_rows = set(self.rows.values())
+            self.free_rows = [row for row in range(self.capacity - 1, -1, -1) if row not in used_rows]
+            self._open_matrix()
+            for (case_uri, row) in self.rows.items():
+                self._add_to_inverted_index(case_uri, self.matrix[row])
+            self._save_index()
+
+
+    def _open_matrix(self):
+        """
+        Maps the matrix file into memory, with the current capacity and width.
+        """
+        if self.capacity * self.width == 0:
+            self.matrix = numpy.zeros((self.capacity, self.width), dtype = numpy.float32)
+        else:
+            self.matrix = numpy.memmap(self.matrix_path, dtype = numpy.float32, mode = "r+", shape = (self.capacity, self.width))
+
+
+    def _resize_matrix(self, capacity):
+        """
+        Changes the number of rows of the matrix file to capacity. New rows are filled with zeros.
+        """
+        if isinstance(self.matrix, numpy.memmap):
+            self.matrix.flush()
+        self.matrix = None
+        with open(self.matrix_path, "ab") as file:
+            file.truncate(capacity * self.width * numpy.dtype(numpy.float32).itemsize)
+        self.capacity = capacity
+        self._open_matrix()
+
+
+    def keys(self, vector):
+        """
+        Returns the keys of the informative components of vector in the inverted index.
+        """
+        result = []
+        for column in numpy.flatnonzero(vector).tolist():
+            if column in self.single_select_columns:
+                result.append((column, abs(float(vector[column]))))
+            else:
+                result.append((column,))
+        return result
+
+
+    def _add_to_inverted_index(self, case_uri, vector):
+        """
+        Adds case_uri to the inverted index, under the keys of vector.
+        """
+        for key in self.keys(vector):
+            self.inverted_index[key].add(case_uri)
+
+
+    def _remove_from_inverted_index(self, case_uri, vector):
+        """
+        Removes case_uri from the inverted index, under the keys of vector.
+        """
+        for key in self.keys(vector):
+            self.inverted_index[key].discard(case_uri)
+            if not self.inverted_index[key]:
+                del self.inverted_index[key]
+
+
+    def _replay_log(self):
+        """
+        Applies the changes of the log file to rows. A last line which was not completely written is ignored.
+        """
+        with open(self.log_path, "r") as file:
+            for line in file:
+                try:
+                    (case_uri, row) = json.loads(line)
+                except ValueError:
+                    break
+                if row is None:
+                    self.rows.pop(case_uri, None)
+                else:
+                    self.rows[case_uri] = row
+
+
+    def _log(self, case_uri, row):
+        """
+        Appends the change of the row of case_uri to the log file, where a row of None means that the case has been removed.
+        When the log becomes longer than the index, the index file is rewritten instead.
+        """
+        self.log_length += 1
+        if self.log_length > max(self.minimum_log_length, len(self.rows)):
+            self._save_index()
+        else:
+            if self.log_file is None:
+                self.log_file = open(self.log_path, "a")
+            self.log_file.write(json.dumps([case_uri, row]) + "\n")
+            self.log_file.flush()
+
+
+    def _save_index(self):
+        """
+        Flushes the matrix, writes the index file, and empties the log. The index is replaced atomically, so that it never refers 
+        to unwritten rows. The log is emptied after that, since replaying it over the new index gives the same rows.
+        """
+        if isinstance(self.matrix, numpy.memmap):
+            self.matrix.flush()
+        index = {"layout": self.layout, "width": self.width, "capacity": self.capacity, "rows": self.rows,
+                 "single_select_columns": sorted(self.single_select_columns)}
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(index, file)
+        os.replace(temporary_path, self.index_path)
+        self._empty_log()
+
+
+    def _empty_log(self):
+        if self.log_file is not None:
+            self.log_file.close()
+        self.log_file = open(self.log_path, "w")
+        self.log_length = 0
+
+
+    def reset(self, layout, width, single_select_columns, vectors):
+        """
+        Empties the store, and fills it with vectors, a dictionary mapping case uris to feature vectors of length width,
+        computed with layout. single_select_columns are the columns of the single select components.
+        """
+        with self.lock:
+            self.unpinned.wait_for(lambda: self.pins == 0)
+            # The log refers to the previous rows, so it is emptied before anything else
+            self._empty_log()
+            self.layout = layout
+            self.width = width
+            self.single_select_columns = set(single_select_columns)
+            self.inverted_index = defaultdict(set)
+            self.rows = {case_uri: row for (row, case_uri) in enumerate(vectors)}
+            self.matrix = None
+            with open(self.matrix_path, "wb"):
+                pass
+            self._resize_matrix(max(self.initial_capacity, len(vectors)))
+            self.free_rows = list(range(self.capacity - 1, len(vectors) - 1, -1))
+            self.pinned_free_rows = []
+            for (case_uri, row) in self.rows.items():
+                self.matrix[row] = vectors[case_uri]
+                self._add_to_inverted_index(case_uri, self.matrix[row])
+            self._save_index()
+
+
+    def put(self, case_uri, vector):
+        """
+        Stores the feature vector of case_uri, replacing any previous one.
+        """
+        with self.lock:
+            if len(vector) != self.width:
+                raise RuntimeError("Feature vectors must have length {0}, but it is {1}.".format(self.width, len(vector)))
+            row = self.rows.get(case_uri)
+            if row is not None:
+                self._remove_from_inverted_index(case_uri, self.matrix[row])
+                if self.pins > 0:
+                    # The pinned row may be read by a search, so the case is given a new row
+                    self._release_row(row)
+                    row = None
+            if row is None:
+                if not self.free_rows:
+                    # The capacity is doubled, so that the index file is rewritten for it a logarithmic number of times
+                    capacity = max(self.initial_capacity, 2 * self.capacity)
+                    self.free_rows = list(range(capacity - 1, self.capacity - 1, -1))
+                    self._resize_matrix(capacity)
+                    self._save_index()
+                row = self.free_rows.pop()
+                self.rows[case_uri] = row
+            self.matrix[row] = vector
+            self._add_to_inverted_index(case_uri, self.matrix[row])
+            self._log(case_uri, row)
+
+
+    def remove(self, case_uri):
+        """
+        Removes the feature vector of case_uri, if there is one.
+        """
+        with self.lock:
+            row = self.rows.pop(case_uri, None)
+            if row is not None:
+                self._remove_from_inverted_index(case_uri, self.matrix[row])
+                self._release_row(row)
+                self._log(case_uri, None)
+
+
+    def _release_row(self, row):
+        """
+        Makes row free, once no rows are pinned.
+        """
+        if self.pins > 0:
+            self.pinned_free_rows.append(row)
+        else:
+            self.matrix[row] = 0
+            self.free_rows.append(row)
+
+
+    def close(self):
+        """
+        Flushes the matrix, and closes the log file.
+        """
+        with self.lock:
+            if isinstance(self.matrix, numpy.memmap):
+                self.matrix.flush()
+            if self.log_file is not None:
+                self.log_file.close()
+                self.log_file = None
+
+
+    def candidates(self, vector):
+        """
+        Returns the set of the uris of the cases having at least one informative component in common with vector.
+        """
+        with self.lock:
+            result = set()
+            for key in self.keys(vector):
+                result |= self.inverted_index.get(key, set())
+            return result
+
+
+    def snapshot(self, case_uris = None):
+        """
+        Returns a pair (case_uris, matrix), where matrix is a copy of the feature vectors, with one row for each case in case_uris.
+        If case_uris is not provided, all cases are returned. Otherwise, the uris which are not in the store are left out.
+        """
+        with self.lock:
+            if case_uris is None:
+                case_uris = list(self.rows)
+            else:
+                case_uris = [case_uri for case_uri in case_uris if case_uri in self.rows]
+            return (case_uris, numpy.array(self.matrix[[self.rows[case_uri] for case_uri in case_uris]], dtype = numpy.float32))
+
+
+    def pin_shards(self, number_of_shards, case_uris = None):
+        """
+        Returns a triple (case_uris_by_row, shards, shape), where shards is a list of at most number_of_shards lists of sorted rows of 
+        the matrix file, one for each case in case_uris, or for all cases if case_uris is not provided, case_uris_by_row maps these
+        rows to case uris, and shape is the shape of the matrix file. The rows are pinned until unpin is called, so that they can be
+        read from the matrix file without the lock in the meantime.
+        """
+        with self.lock:
+            if case_uris is None:
+                case_uris = self.rows
+            case_uris_by_row = {self.rows[case_uri]: case_uri for case_uri in case_uris if case_uri in self.rows}
+            rows = sorted(case_uris_by_row)
+            shard_size = -(-len(rows) // max(1, number_of_shards))
+            self.pins += 1
+            return (case_uris_by_row, [rows[start:start + shard_size] for start in range(0, len(rows), max(1, shard_size))],
+                    (self.capacity, self.width))
+
+
+    def unpin(self):
+        """
+        Ends a pin_shards. When no rows are pinned any longer, the rows released meanwhile are made free.
+        """
+        with self.lock:
+            self.pins -= 1
+            if self.pins == 0:
+                for row in self.pinned_free_rows:
+                    self.matrix[row] = 0
+                    self.free_rows.append(row)
+                self.pinned_free_rows = []
+                self.unpinned.notify_all()
@@ -0,0 +1,238 @@
+"""
+Created on 17 okt. 2026
+
+The module neo4j_storage contains the storage of the knowledge repository in a Neo4j server, accessed with the bolt protocol.
+"""
+
+# Database connection
+from neo4j.v1 import GraphDatabase, basic_auth
+
+from COACH.knowledge_repository.storage import KnowledgeRepositoryStorage
+
+
+class Neo4jStorage(KnowledgeRepositoryStorage):
+
+    """
+    Stores the cases in a Neo4j server. Sessions are created for each operation by the driver, which is thread safe.
+    """
+
+    # All nodes stored by the knowledge repository have this label, in addition to the label of their type in the ontology.
+    # It allows a uniqueness constraint, and thereby an index, on their uri. Queries matching nodes on their uri must therefore
+    # match this label, e.g. (case:Resource:Case {uri: $uri}), for the index to be used.
+    node_label = "Resource"
+
+
+    def __init__(self, url, user_name, password):
+        self._db = GraphDatabase.driver(url, auth = basic_auth(user_name, password))
+
+        # Create the uniqueness constraint on the node uris, which is also used as an index by the queries matching nodes on their uri
+        self._create_constraints()
+
+
+    def _create_constraints(self):
+        """
+        Creates the uniqueness constraint on the uri of nodes, if it does not already exist. Nodes stored before the node label
+        was introduced are given the label first. Raises a RuntimeError if the constraint can not be created.
+        """
+        try:
+            with self.open_session() as session:
+                self.query("MATCH (node) WHERE exists(node.uri) AND NOT node:" + self.node_label + " SET node:" + self.node_label,
+                           session = session)
+                self.query("CREATE CONSTRAINT ON (node:" + self.node_label + ") ASSERT node.uri IS UNIQUE", session = session)
+        except Exception as e:
+            # Without the constraint, every query matching nodes on their uri would scan all nodes
+            raise RuntimeError("Could not create the uniqueness constraint on node uris: " + str(e)) from e
+
+
+    def open_session(self):
+        """
+        Creates a database session and returns it.
+        """
+        return self._db.session()
+
+    def close_session(self, s):
+        """
+        Closes a database session.
+        """
+        s.close()
+
+    def query(self, query, context = {}, session = None):
+        """
+        Function encapsulating the query interface to the database.
+        q is the query string, and context is an optional dictionary containing variables to be substituted into q.
+        If a session is provided, the query is executed in that session. Otherwise, a session is created, used
+        for the query, and then closed again.
+        """
+        if session:
+            return session.run(query, context)
+        else:
+            # If no session was provided, create one for this query and close it when done
+            with self.open_session() as s:
+                result = s.run(query, context)
+            return result
+
+
+    def close(self):
+        self._db.close()
+
+
+    def store_case(self, case_uri, nodes_uri, labels, properties, relations):
+        with self.open_session() as session:
+            # The case is deleted first to handle nodes suppressed from the database
+            self.delete_case(case_uri, session)
+
+            query = "UNWIND $uris AS uri MERGE (node:" + self.node_label + " {uri: uri})"
+            self.query(query, {"uris": list(nodes_uri)}, session)
+
+            # Labels, property names and relation types can not be parameters, as it is not supported in neo4j
+            # TODO: Malicious code injection might be possible
+            for (label, uris) in labels.items():
+                query = "UNWIND $uris AS uri MATCH (node:" + self.node_label + " {uri: uri}) SET node :`" + label + "`"
+                self.query(query, {"uris": uris}, session)
+
+            for (predicate_name, pairs) in properties.items():
+                query = "UNWIND $rows AS row MATCH (node:" + self.node_label + " {uri: row.uri}) SET node.`" + predicate_name + "` = row.value"
+                self.query(query, {"rows": [{"uri": uri, "value": value} for (uri, value) in pairs]}, session)
+
+            for (predicate_name, pairs) in relations.items():
+                query = """ UNWIND $rows AS row
+                            MATCH (subject_node:""" + self.node_label + """ {uri: row.subject_uri})
+                            MATCH (object_node:""" + self.node_label + """ {uri: row.object_uri})
+                            MERGE (subject_node) -[:`""" + predicate_name + """`]-> (object_node)
+                        """
+                self.query(query, {"rows": [{"subject_uri": subject_uri, "object_uri": object_uri}
+                                            for (subject_uri, object_uri) in pairs]}, session)
+
+
+    def delete_case(self, case_uri, session = None):
+        """
+        Only the nodes of the case are visited, so the cost does not depend on the size of the knowledge repository.
+        If a session is provided, the case is deleted in that session.
+        """
+        case_nodes_query = """  MATCH (case:""" + self.node_label + """:Case {uri: $uri})
+                                OPTIONAL MATCH (case) -[*]-> (n)
+                                RETURN id(case), collect(DISTINCT id(n))
+                            """
+        delete_case_relations_query =   """ Match (:""" + self.node_label + """:Case {uri: $uri}) -[r*]-> ()
+                                            UNWIND r AS rs
+                                            DETACH DELETE rs
+                                        """
+        delete_detached_node_query = """UNWIND $ids AS node_id
+                                        MATCH (n)
+                                        WHERE id(n) = node_id AND NOT (n) -- ()
+                                        DELETE n
+                                    """
+
+        close_session = False
+        if session is None:
+            close_session = True
+            session = self.open_session()
+        nodes_id = []
+        for record in self.query(case_nodes_query, {"uri": case_uri}, session):
+            nodes_id += [record[0]] + list(record[1])
+        self.query(delete_case_relations_query, {"uri": case_uri}, session)
+        self.query(delete_detached_node_query, {"ids": nodes_id}, session)
+        if close_session:
+            self.close_session(session)
+
+
+    def collect_garbage(self):
+        query = """ MATCH (n)
+                    WHERE NOT (n) -- ()
+                    WITH n, CASE WHEN n:Case THEN n.uri END AS case_uri
+                    DELETE n
+                    RETURN count(*), collect(case_uri)
+                """
+        record = list(self.query(query))[0]
+        return (record[0], list(record[1]))
+
+
+    def get_cases_uri(self):
+        return [record[0] for record in self.query("MATCH (case:Case) RETURN case.uri")]
+
+
+    def get_user_cases(self, user_uri):
+        query = """ Match (:""" + self.node_label + """ {uri: $user_uri}) <-[:person]- (:Role) <-[:role]- (case:Case)
+                    Return case
+                """
+        query_result = self.query(query, {"user_uri": user_uri})
+        return [[e[0].properties["uri"], e[0].properties["title"]] for e in query_result]
+
+
+    def get_case_nodes(self, case_uri):
+        query = """ MATCH (case:""" + self.node_label + """:Case {uri: $case_uri})
+                    OPTIONAL MATCH (case) -[*]-> (n)
+                    WITH [case] + collect(DISTINCT n) AS nodes
+                    UNWIND nodes AS node
+                    RETURN DISTINCT node
+                """
+        with self.open_session() as session:
+            for (node,) in self.query(query, {"case_uri": case_uri}, session):
+                properties = {key: value for (key, value) in node.properties.items() if key != "uri"}
+                yield (node.properties["uri"], properties, [label for label in node.labels if label != self.node_label])
+
+
+    def get_case_relations(self, case_uri):
+        query = """ MATCH (:""" + self.node_label + """:Case {uri: $case_uri}) -[*0..]-> (subject_node) -[r]-> (object_node)
+                    RETURN DISTINCT subject_node.uri, type(r), object_node.uri
+                """
+        with self.open_session() as session:
+            for record in self.query(query, {"case_uri": case_uri}, session):
+                yield (record[0], record[1], record[2])
+
+
+    def get_case_goals(self, case_uri):
+        query = """ MATCH (:""" + self.node_label + """:Case {uri: $case_uri}) -[:goal]-> () --> (goal)
+                    RETURN goal.uri
+        """
+        return [e[0] for e in self.query(query, {"case_uri": case_uri})]
+
+
+    def get_case_stakeholder_types(self, case_uri):
+        query = """ MATCH (:""" + self.node_label + """:Case {uri :$case_uri}) -[:role]-> (:Role) --> (stakeholder_type)
+                    RETURN stakeholder_type.uri
+        """
+        return [e[0] for e in self.query(query, {"case_uri": case_uri})]
+
+
+    def get_case_context(self, case_uri, category_name):
+        # Cypher does not allow parameter for a relation's label, so string format is used instead.
+        query = """ MATCH (:""" + self.node_label + """:Case {{uri: $case_uri}}) -[:context]-> () -[:{0}]-> () -[grade_id]-> (value)
+                    RETURN type(grade_id), value.value
+        """
+        context_in_case = {}
+        for record in self.query(query.format(category_name), {"case_uri": case_uri}):
+            context_in_case.setdefault(record[0], []).append(record[1])
+        return context_in_case
+
+
+    def get_cases_titles(self, cases_uri_list):
+        query = """ UNWIND $uris AS uri
+                    MATCH (case:""" + self.node_label + """:Case {uri: uri})
+                    RETURN case.uri, case.title
+                """
+        return {record[0]: record[1] for record in self.query(query, {"uris": list(cases_uri_list)})}
+
+
+    def get_cases_details(self, cases_uri_list):
+        query = """ UNWIND $uris AS uri
+                    MATCH (case:""" + self.node_label + """:Case {uri: uri})
+                    OPTIONAL MATCH (case) -[:alternative]-> (alternative:Alternative)
+                    WITH case, collect(alternative.title) AS alternatives
+                    OPTIONAL MATCH (case) -[:selected_alternative]-> (selected_alternative:Alternative)
+                    RETURN case.uri, case.title, head(collect(selected_alternative.title)), alternatives
+                """
+        query_result = self.query(query, {"uris": cases_uri_list})
+        return {record[0]: (record[1], record[2], list(record[3])) for record in query_result}
+
+
+    def get_cases_estimations(self, cases_uri_list):
+        query = """ UNWIND $uris AS uri
+                    MATCH (case:""" + self.node_label + """:Case {uri: uri}) -[:property]-> (property:Property)
+                    MATCH (property) -[:ontology_id]-> (prop_ontology_id)
+                    MATCH (property) <-[:belong_to_property]- (estimation:Estimation) -[:ontology_id]-> (estimation_ontology_id)
+                    MATCH (estimation) -[:belong_to_alternative]-> (alternative:Alternative)
+                    RETURN DISTINCT case.uri, prop_ontology_id.uri, estimation_ontology_id.uri, estimation, alternative.title
+                """
+        query_result = self.query(query, {"uris": list(cases_uri_list)})
+        return [(record[0], record[1], record[2], dict(record[3].properties), record[4]) for record in query_result]
@@ -0,0 +1,123 @@
+"""
+Created on 17 okt. 2026
+
+The module similarity contains the computation of the similarity between a case and the cases of the knowledge repository.
+
+Case vectors are made of segments (goal, context and stakeholders), and each component of a segment is either binary, a number,
+or the index of a single select value. The similarity of a segment is a Jaccard index: the number of components which are equal
+in both cases, divided by the number of components which are not 0 in both cases. The similarity of two cases is the mean of the
+segment similarities, weighted by the given segment weights and by the number of meaningful components of each segment.
+
+The similarities of all the candidate cases are computed at once, from a matrix with one row per candidate. For very large knowledge
+repositories, the candidates can be split in shards scored by a pool of processes, each one mapping the feature matrix file of the
+feature store read-only and returning its local top cases, which are then merged.
+"""
+
+# Standard libraries
+import heapq
+
+# Numerical computation
+import numpy
+
+
+# The types of vector components
+BINARY = 0
+NUMBER = 1
+SINGLE_SELECT = 2
+
+
+def column_types(length, number_indexes, single_select_indexes):
+    """
+    Returns an array with the type of each component of a segment of the given length, where number_indexes and single_select_indexes
+    are the indexes of the number and single select components. All other components are binary.
+    """
+    result = numpy.full(length, BINARY, dtype = numpy.int8)
+    result[list(number_indexes)] = NUMBER
+    result[list(single_select_indexes)] = SINGLE_SELECT
+    return result
+
+
+def segment_similarities(query_vector, matrix, types, number_ratio_threshold):
+    """
+    Returns a pair (similarities, meaningful_components) of arrays, containing for each row of matrix its similarity with query_vector,
+    and the number of components which are not 0 in both. types is the array of component types, as returned by column_types.
+    Two numbers are equal if the ratio of the largest to the smallest is less than number_ratio_threshold.
+    Raises a RuntimeError if the vectors have different lengths, or if a binary component is not 0 or 1.
+    """
+    query_vector = numpy.abs(numpy.asarray(query_vector, dtype = numpy.float64))
+    matrix = numpy.abs(numpy.asarray(matrix, dtype = numpy.float64))
+    vector_length = len(query_vector)
+    if vector_length != matrix.shape[1]:
+        raise RuntimeError("Both vectors must have the same length, but length are {0} and {1}."
+                           .format(vector_length, matrix.shape[1]))
+
+    value_min = numpy.minimum(matrix, query_vector)
+    value_max = numpy.maximum(matrix, query_vector)
+    binary = types == BINARY
+
+    invalid = binary & (value_max > 1)
+    if invalid.any():
+        (row, i) = numpy.argwhere(invalid)[0]
+        raise RuntimeError("When the component is neither a number nor a single select, value in the cases' vector must be " +
+                           "0 or 1, but it is {0} for index {1}.".format(value_max[row, i], i))
+
+    # Jaccard index is used to compute similarity
+    # both_0 tells where no information is provided, and both_1 where components are identical
+    both_0 = value_max == 0
+    ratio = numpy.divide(value_max, value_min, out = numpy.full_like(value_max, numpy.inf), where = value_min != 0)
+    both_1 = numpy.where(binary, value_min == 1,
+                         numpy.where(types == SINGLE_SELECT, ~both_0 & (value_min == value_max), ratio < number_ratio_threshold))
+
+    meaningful_components = vector_length - both_0.sum(axis = 1)
+    similarities = numpy.divide(both_1.sum(axis = 1), meaningful_components, out = numpy.zeros(len(matrix)),
+                                where = meaningful_components != 0)
+    return (similarities, meaningful_components)
+
+
+def compute_similarities(query_vector, matrix, segments, number_ratio_threshold):
+    """
+    Returns an array with the similarity between query_vector and each row of matrix.
+    segments is a list of tuples (start, end, types, weight), where start and end delimit a segment in the vectors, types are the
+    types of its components, and weight its weight in the similarity. Cases without meaningful components have a similarity of 0.
+    """
+    query_vector = numpy.asarray(query_vector, dtype = numpy.float64)
+    matrix = numpy.asarray(matrix)
+    if len(query_vector) != matrix.shape[1]:
+        raise RuntimeError("Both vectors must have the same length, but length are {0} and {1}."
+                           .format(len(query_vector), matrix.shape[1]))
+
+    numerator = numpy.zeros(len(matrix))
+    denominator = numpy.zeros(len(matrix))
+    for (start, end, types, weight) in segments:
+        (similarities, meaningful_components) = segment_similarities(query_vector[start:end], matrix[:, start:end], types,
+                                                                     number_ratio_threshold)
+        segment_weights = weight * meaningful_components
+        numerator += similarities * segment_weights
+        denominator += segment_weights
+    return numpy.divide(numerator, denominator, out = numpy.zeros(len(matrix)), where = denominator != 0)
+
+
+def top_candidates(candidates, number):
+    """
+    Returns the candidates, which are tuples (similarity, key), having one of the number largest similarities. The candidates with the
+    same similarity as the last kept one are kept as well, so that merging the top candidates of several shards gives the same result
+    as taking the top candidates of all shards at once.
+    """
+    if number <= 0:
+        return []
+    if len(candidates) > number:
+        similarity_threshold = heapq.nlargest(number, candidates)[-1][0]
+        candidates = [candidate for candidate in candidates if candidate[0] >= similarity_threshold]
+    return candidates
+
+
+def score_shard(matrix_path, shape, rows, query_vector, segments, number_ratio_threshold, number):
+    """
+    Computes the similarity between query_vector and the given rows of the feature matrix file at matrix_path, whose shape is
+    (capacity, width), and returns the top candidates (similarity, row) among those with a similarity above 0.
+    This function is run in the worker processes of the similarity search, and only reads the file.
+    """
+    matrix = numpy.memmap(matrix_path, dtype = numpy.float32, mode = "r", shape = shape)
+    similarities = compute_similarities(query_vector, matrix[rows], segments, number_ratio_threshold)
+    candidates = [(current_similarity, row) for (row, current_similarity) in zip(rows, similarities.tolist()) if current_similarity != 0]
+    return top_candidates(candidates, number)
@@ -0,0 +1,281 @@
+"""
+Created on 17 okt. 2026
+
+The module sqlite_storage contains the storage of the knowledge repository in an embedded SQLite database file. It needs no
+database server, and queries run in the process of the service.
+
+The graph of the cases is kept in adjacency tables: nodes maps uris to integer ids, labels and properties hold the labels and
+the properties of the nodes, and relations holds one row per relation, indexed both from the subject and from the object.
+Property values are stored in json format, so that numbers and booleans are returned with their type. The nodes reachable from
+a case are found with a recursive query.
+"""
+
+# Standard libraries
+import json
+import sqlite3
+import threading
+
+from COACH.knowledge_repository.storage import KnowledgeRepositoryStorage
+
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, uri TEXT NOT NULL UNIQUE);
+    CREATE TABLE IF NOT EXISTS labels (node_id INTEGER NOT NULL, label TEXT NOT NULL, PRIMARY KEY (node_id, label)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS labels_label ON labels (label, node_id);
+    CREATE TABLE IF NOT EXISTS properties (node_id INTEGER NOT NULL, name TEXT NOT NULL, value TEXT,
+                                           PRIMARY KEY (node_id, name)) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS relations (subject_id INTEGER NOT NULL, type TEXT NOT NULL, object_id INTEGER NOT NULL,
+                                          PRIMARY KEY (subject_id, type, object_id)) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS relations_object ON relations (object_id, type);
+"""
+
+# The ids of the case node and of all nodes reachable from it. The uri of the case is the only parameter.
+REACHABLE_NODES = """
+    WITH RECURSIVE reachable (id) AS (
+        SELECT nodes.id FROM nodes JOIN labels ON labels.node_id = nodes.id AND labels.label = 'Case' WHERE nodes.uri = ?
+        UNION
+        SELECT relations.object_id FROM relations JOIN reachable ON relations.subject_id = reachable.id
+    )
+"""
+
+# The node of a case. The uri of the case is the only parameter.
+CASE_NODE = "SELECT nodes.id FROM nodes JOIN labels ON labels.node_id = nodes.id AND labels.label = 'Case' WHERE nodes.uri = ?"
+
+
+class SQLiteStorage(KnowledgeRepositoryStorage):
+
+    """
+    Stores the cases in an SQLite database file. The connection is shared by all request threads, and used under a lock.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+            # The ids of the nodes to delete are gathered in this table
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS deleted_nodes (id INTEGER PRIMARY KEY)")
+
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+    def _delete_nodes(self):
+        """
+        Deletes the nodes in the table deleted_nodes, with their labels and properties, and returns the uris of the deleted cases.
+        """
+        cases_uri = [row[0] for row in self.connection.execute(
+            """ SELECT nodes.uri FROM deleted_nodes JOIN nodes ON nodes.id = deleted_nodes.id
+                JOIN labels ON labels.node_id = nodes.id AND labels.label = 'Case'
+            """)]
+        self.connection.execute("DELETE FROM labels WHERE node_id IN (SELECT id FROM deleted_nodes)")
+        self.connection.execute("DELETE FROM properties WHERE node_id IN (SELECT id FROM deleted_nodes)")
+        self.connection.execute("DELETE FROM nodes WHERE id IN (SELECT id FROM deleted_nodes)")
+        self.connection.execute("DELETE FROM deleted_nodes")
+        return cases_uri
+
+
+    def _delete_case(self, case_uri):
+        """
+        Deletes a case within the current transaction. Only the nodes of the case are visited.
+        """
+        self.connection.execute("DELETE FROM deleted_nodes")
+        self.connection.execute(REACHABLE_NODES + "INSERT INTO deleted_nodes SELECT id FROM reachable", (case_uri,))
+        self.connection.execute("DELETE FROM relations WHERE subject_id IN (SELECT id FROM deleted_nodes)")
+        self.connection.execute(""" DELETE FROM deleted_nodes
+                                    WHERE EXISTS (SELECT 1 FROM relations WHERE relations.subject_id = deleted_nodes.id)
+                                       OR EXISTS (SELECT 1 FROM relations WHERE relations.object_id = deleted_nodes.id)
+                                """)
+        self._delete_nodes()
+
+
+    def store_case(self, case_uri, nodes_uri, labels, properties, relations):
+        with self.lock, self.connection:
+            # The case is deleted first to handle nodes suppressed from the database
+            self._delete_case(case_uri)
+
+            self.connection.executemany("INSERT OR IGNORE INTO nodes (uri) VALUES (?)", [(uri,) for uri in nodes_uri])
+            self.connection.executemany("INSERT OR IGNORE INTO labels (node_id, label) SELECT id, ? FROM nodes WHERE uri = ?",
+                                        [(label, uri) for (label, uris) in labels.items() for uri in uris])
+            self.connection.executemany("""INSERT OR REPLACE INTO properties (node_id, name, value)
+                                           SELECT id, ?, ? FROM nodes WHERE uri = ?""",
+                                        [(name, json.dumps(value, default = str), uri)
+                                         for (name, pairs) in properties.items() for (uri, value) in pairs])
+            self.connection.executemany(""" INSERT OR IGNORE INTO relations (subject_id, type, object_id)
+                                            SELECT subject_node.id, ?, object_node.id FROM nodes AS subject_node, nodes AS object_node
+                                            WHERE subject_node.uri = ? AND object_node.uri = ?
+                                        """,
+                                        [(name, subject_uri, object_uri)
+                                         for (name, pairs) in relations.items() for (subject_uri, object_uri) in pairs])
+
+
+    def delete_case(self, case_uri):
+        with self.lock, self.connection:
+            self._delete_case(case_uri)
+
+
+    def collect_garbage(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM deleted_nodes")
+            count = self.connection.execute(
+                """ INSERT INTO deleted_nodes
+                    SELECT id FROM nodes
+                    WHERE NOT EXISTS (SELECT 1 FROM relations WHERE relations.subject_id = nodes.id)
+                      AND NOT EXISTS (SELECT 1 FROM relations WHERE relations.object_id = nodes.id)
+                """).rowcount
+            return (count, self._delete_nodes())
+
+
+    def _query(self, query, parameters = ()):
+        """
+        Runs a query, and returns the list of its rows.
+        """
+        with self.lock:
+            return self.connection.execute(query, parameters).fetchall()
+
+
+    def get_cases_uri(self):
+        return [row[0] for row in self._query("SELECT nodes.uri FROM nodes JOIN labels ON labels.node_id = nodes.id AND labels.label = 'Case'")]
+
+
+    def get_user_cases(self, user_uri):
+        query = """ SELECT case_node.uri, title.value FROM nodes AS user_node
+                    JOIN relations AS person ON person.object_id = user_node.id AND person.type = 'person'
+                    JOIN labels AS role_label ON role_label.node_id = person.subject_id AND role_label.label = 'Role'
+                    JOIN relations AS role ON role.object_id = person.subject_id AND role.type = 'role'
+                    JOIN labels AS case_label ON case_label.node_id = role.subject_id AND case_label.label = 'Case'
+                    JOIN nodes AS case_node ON case_node.id = role.subject_id
+                    LEFT JOIN properties AS title ON title.node_id = case_node.id AND title.name = 'title'
+                    WHERE user_node.uri = ?
+                """
+        return [[uri, json.loads(title) if title is not None else None] for (uri, title) in self._query(query, (user_uri,))]
+
+
+    def get_case_nodes(self, case_uri):
+        with self.lock:
+            nodes = self.connection.execute(REACHABLE_NODES + "SELECT nodes.id, nodes.uri FROM reachable JOIN nodes ON nodes.id = reachable.id",
+                                            (case_uri,)).fetchall()
+            properties = self.connection.execute(REACHABLE_NODES + """ SELECT node_id, name, value FROM properties
+                                                                        WHERE node_id IN (SELECT id FROM reachable)""",
+                                                 (case_uri,)).fetchall()
+            labels = self.connection.execute(REACHABLE_NODES + "SELECT node_id, label FROM labels WHERE node_id IN (SELECT id FROM reachable)",
+                                             (case_uri,)).fetchall()
+        nodes_properties = {node_id: {} for (node_id, _) in nodes}
+        for (node_id, name, value) in properties:
+            nodes_properties[node_id][name] = json.loads(value)
+        nodes_labels = {node_id: [] for (node_id, _) in nodes}
+        for (node_id, label) in labels:
+            nodes_labels[node_id].append(label)
+        return [(uri, nodes_properties[node_id], nodes_labels[node_id]) for (node_id, uri) in nodes]
+
+
+    def get_case_relations(self, case_uri):
+        query = REACHABLE_NODES + """   SELECT subject_node.uri, relations.type, object_node.uri FROM reachable
+                                        JOIN relations ON relations.subject_id = reachable.id
+                                        JOIN nodes AS subject_node ON subject_node.id = relations.subject_id
+                                        JOIN nodes AS object_node ON object_node.id = relations.object_id
+                                    """
+        return self._query(query, (case_uri,))
+
+
+    def get_case_goals(self, case_uri):
+        query = """ SELECT goal.uri FROM (""" + CASE_NODE + """) AS case_node
+                    JOIN relations AS goal_relation ON goal_relation.subject_id = case_node.id AND goal_relation.type = 'goal'
+                    JOIN relations ON relations.subject_id = goal_relation.object_id
+                    JOIN nodes AS goal ON goal.id = relations.object_id
+                """
+        return [row[0] for row in self._query(query, (case_uri,))]
+
+
+    def get_case_stakeholder_types(self, case_uri):
+        query = """ SELECT stakeholder_type.uri FROM (""" + CASE_NODE + """) AS case_node
+                    JOIN relations AS role ON role.subject_id = case_node.id AND role.type = 'role'
+                    JOIN labels ON labels.node_id = role.object_id AND labels.label = 'Role'
+                    JOIN relations ON relations.subject_id = role.object_id
+                    JOIN nodes AS stakeholder_type ON stakeholder_type.id = relations.object_id
+                """
+        return [row[0] for row in self._query(query, (case_uri,))]
+
+
+    def get_case_context(self, case_uri, category_name):
+        query = """ SELECT grade_id.type, value.value FROM (""" + CASE_NODE + """) AS case_node
+                    JOIN relations AS context ON context.subject_id = case_node.id AND context.type = 'context'
+                    JOIN relations AS category ON category.subject_id = context.object_id AND category.type = ?
+                    JOIN relations AS grade_id ON grade_id.subject_id = category.object_id
+                    LEFT JOIN properties AS value ON value.node_id = grade_id.object_id AND value.name = 'value'
+                """
+        context_in_case = {}
+        for (grade_id, value) in self._query(query, (case_uri, category_name)):
+            context_in_case.setdefault(grade_id, []).append(json.loads(value) if value is not None else None)
+        return context_in_case
+
+
+    def get_cases_titles(self, cases_uri_list):
+        query = """ SELECT title.value FROM (""" + CASE_NODE + """) AS case_node
+                    LEFT JOIN properties AS title ON title.node_id = case_node.id AND title.name = 'title'
+                """
+        result = {}
+        with self.lock:
+            for case_uri in cases_uri_list:
+                title = self.connection.execute(query, (case_uri,)).fetchall()
+                if title:
+                    result[case_uri] = json.loads(title[0][0]) if title[0][0] is not None else None
+        return result
+
+
+    def get_cases_details(self, cases_uri_list):
+        alternatives_query = """SELECT title.value FROM (""" + CASE_NODE + """) AS case_node
+                                JOIN relations ON relations.subject_id = case_node.id AND relations.type = ?
+                                JOIN labels ON labels.node_id = relations.object_id AND labels.label = 'Alternative'
+                                LEFT JOIN properties AS title ON title.node_id = relations.object_id AND title.name = 'title'
+                             """
+        title_query = """   SELECT title.value FROM (""" + CASE_NODE + """) AS case_node
+                            LEFT JOIN properties AS title ON title.node_id = case_node.id AND title.name = 'title'
+                      """
+        decode = lambda value: json.loads(value) if value is not None else None
+        result = {}
+        with self.lock:
+            for case_uri in cases_uri_list:
+                title = self.connection.execute(title_query, (case_uri,)).fetchall()
+                if not title:
+                    continue
+                alternatives = self.connection.execute(alternatives_query, (case_uri, "alternative")).fetchall()
+                selected_alternative = self.connection.execute(alternatives_query, (case_uri, "selected_alternative")).fetchall()
+                result[case_uri] = (decode(title[0][0]), decode(selected_alternative[0][0]) if selected_alternative else None,
+                                    [decode(row[0]) for row in alternatives if row[0] is not None])
+        return result
+
+
+    def get_cases_estimations(self, cases_uri_list):
+        query = """ SELECT DISTINCT property_ontology_id.uri, estimation_ontology_id.uri, estimation_relation.subject_id,
+                                    alternative_title.value
+                    FROM (""" + CASE_NODE + """) AS case_node
+                    JOIN relations AS property ON property.subject_id = case_node.id AND property.type = 'property'
+                    JOIN labels AS property_label ON property_label.node_id = property.object_id AND property_label.label = 'Property'
+                    JOIN relations AS property_ontology_relation
+                        ON property_ontology_relation.subject_id = property.object_id AND property_ontology_relation.type = 'ontology_id'
+                    JOIN nodes AS property_ontology_id ON property_ontology_id.id = property_ontology_relation.object_id
+                    JOIN relations AS estimation_relation
+                        ON estimation_relation.object_id = property.object_id AND estimation_relation.type = 'belong_to_property'
+                    JOIN labels AS estimation_label
+                        ON estimation_label.node_id = estimation_relation.subject_id AND estimation_label.label = 'Estimation'
+                    JOIN relations AS estimation_ontology_relation
+                        ON estimation_ontology_relation.subject_id = estimation_relation.subject_id
+                        AND estimation_ontology_relation.type = 'ontology_id'
+                    JOIN nodes AS estimation_ontology_id ON estimation_ontology_id.id = estimation_ontology_relation.object_id
+                    JOIN relations AS alternative
+                        ON alternative.subject_id = estimation_relation.subject_id AND alternative.type = 'belong_to_alternative'
+                    JOIN labels AS alternative_label ON alternative_label.node_id = alternative.object_id AND alternative_label.label = 'Alternative'
+                    LEFT JOIN properties AS alternative_title ON alternative_title.node_id = alternative.object_id AND alternative_title.name = 'title'
+                """
+        properties_query = "SELECT name, value FROM properties WHERE node_id = ?"
+        result = []
+        with self.lock:
+            for case_uri in cases_uri_list:
+                for (property_uri, estimation_method_uri, estimation_id, alternative_title) in self.connection.execute(query, (case_uri,)).fetchall():
+                    estimation_properties = {name: json.loads(value) for (name, value) in self.connection.execute(properties_query, (estimation_id,))}
+                    result.append((case_uri, property_uri, estimation_method_uri, estimation_properties,
+                                   json.loads(alternative_title) if alternative_title is not None else None))
+        return result
@@ -0,0 +1,173 @@
+"""
+Created on 17 okt. 2026
+
+The module storage contains the interface between the knowledge repository and the database where cases are stored.
+
+A case is stored as a graph: each resource of the case description is a node identified by its uri, with the types of the resource
+as labels and its literals as properties, and each other triple is a relation between two nodes. Nodes may be shared by several
+cases, e.g. the ontology entries a case refers to.
+
+The KnowledgeRepositoryService only accesses the database through a KnowledgeRepositoryStorage, which allows storing cases either
+in a Neo4j server (neo4j_storage) or in an embedded SQLite database file, without any server (sqlite_storage).
+"""
+
+# Standard libraries
+from collections import defaultdict
+
+# Semantic web framework
+import rdflib
+from rdflib.namespace import split_uri
+
+
+def group_case_triples(case_graph, orion_ns):
+    """
+    DESCRIPTION:
+        Groups the triples of a case graph by the kind of write they need, so that each group can be written at once.
+    INPUT:
+        case_graph: The rdflib graph describing the case, without blank nodes.
+        orion_ns: The ontology namespace, as a string. Types, properties and relations are named after their local name in it.
+    OUTPUT:
+        A tuple (nodes_uri, labels, properties, relations), where nodes_uri is the set of the uris of all nodes, labels is a
+        dictionary containing for each label the list of the uris of its nodes, properties is a dictionary containing for each
+        property name a list of pairs (uri, value), and relations is a dictionary containing for each relation type a list of
+        pairs (subject_uri, object_uri).
+    ERROR:
+        Raise a RuntimeError if a subject is a literal, if a predicate is named 'uri' or if a type is not in the ontology namespace.
+    """
+    nodes_uri = set()
+    labels = defaultdict(list)
+    properties = defaultdict(list)
+    relations = defaultdict(list)
+    for s, p, o in case_graph:
+        if isinstance(s, rdflib.term.Literal):
+            raise RuntimeError("A subject must not be a Literal")
+
+        predicate_name = split_uri(p)[1]
+        if predicate_name == "uri":
+            raise RuntimeError("Can not handle triplet whose predicate name is 'uri', as it is already used for the identifier " +
+                               "property in the database. Triplet is :({0}, {1}, {2}).".format(s, p, o))
+
+        nodes_uri.add(str(s))
+        if predicate_name == "type":
+            if not str(o).startswith(orion_ns):
+                raise RuntimeError("The type of a node must be in the ontology namespace")
+            labels[str(o)[len(orion_ns):]].append(str(s))
+        elif isinstance(o, rdflib.term.Literal):
+            properties[predicate_name].append((str(s), o.toPython()))
+        else:
+            nodes_uri.add(str(o))
+            relations[predicate_name].append((str(s), str(o)))
+    return (nodes_uri, labels, properties, relations)
+
+
+
+class KnowledgeRepositoryStorage():
+
+    """
+    Base class of the storage backends of the knowledge repository. Backends are shared by all request threads of the service,
+    and must therefore be thread safe.
+    """
+
+    def store_case(self, case_uri, nodes_uri, labels, properties, relations):
+        """
+        Stores a case, as grouped by group_case_triples, replacing the previously stored version of the case if there is one.
+        """
+        raise NotImplementedError()
+
+
+    def delete_case(self, case_uri):
+        """
+        Deletes the relations of the case, and the nodes reachable from it which are not related to other nodes after that.
+        Nodes which are shared with other cases are kept.
+        """
+        raise NotImplementedError()
+
+
+    def collect_garbage(self):
+        """
+        Deletes all nodes which are not related to any other node. Returns a pair (count, cases_uri), where count is the number of
+        deleted nodes, and cases_uri is the list of the uris of the deleted case nodes.
+        """
+        raise NotImplementedError()
+
+
+    def get_cases_uri(self):
+        """
+        Returns the list of the uris of all stored cases.
+        """
+        raise NotImplementedError()
+
+
+    def get_user_cases(self, user_uri):
+        """
+        Returns a list of pairs [case_uri, title], one for each role of the user in a stored case.
+        """
+        raise NotImplementedError()
+
+
+    def get_case_nodes(self, case_uri):
+        """
+        Returns an iterable of tuples (uri, properties, labels), one for the case node and for each node reachable from it,
+        where properties is a dictionary of the node properties except the uri, and labels the list of the node labels.
+        """
+        raise NotImplementedError()
+
+
+    def get_case_relations(self, case_uri):
+        """
+        Returns an iterable of tuples (subject_uri, relation_type, object_uri), for all the relations starting in the case node
+        or in a node reachable from it.
+        """
+        raise NotImplementedError()
+
+
+    def get_case_goals(self, case_uri):
+        """
+        Returns the list of the uris of the goals of a case.
+        """
+        raise NotImplementedError()
+
+
+    def get_case_stakeholder_types(self, case_uri):
+        """
+        Returns the list of the uris of the stakeholder types of the roles of a case.
+        """
+        raise NotImplementedError()
+
+
+    def get_case_context(self, case_uri, category_name):
+        """
+        Returns a dictionary containing, for each grade id of the given context category of a case, the list of its values.
+        """
+        raise NotImplementedError()
+
+
+    def get_cases_titles(self, cases_uri_list):
+        """
+        Returns a dictionary containing the title of each stored case in cases_uri_list.
+        """
+        raise NotImplementedError()
+
+
+    def get_cases_details(self, cases_uri_list):
+        """
+        Returns a dictionary containing for each stored case in cases_uri_list a tuple (title, selected_alternative,
+        alternatives_name_list), where selected_alternative is the title of the selected alternative, or None.
+        """
+        raise NotImplementedError()
+
+
+    def get_cases_estimations(self, cases_uri_list):
+        """
+        Returns the list of the estimations of the cases in cases_uri_list, as tuples (case_uri, property_ontology_uri,
+        estimation_method_ontology_uri, estimation_properties, alternative_title), where estimation_properties is a dictionary
+        containing the properties of the estimation node.
+        """
+        raise NotImplementedError()
+
+
+    def close(self):
+        """
+        Releases the connections to the database.
+        """
+        pass
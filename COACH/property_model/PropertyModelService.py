@@ -15,6 +15,7 @@ sys.path.append(os.path.join(os.curdir, os.pardir, os.pardir, os.pardir))
 # Coach framework
 from COACH.framework import coach
 from COACH.framework.coach import endpoint
+from COACH.framework import sparql
 
 # Web server framework
 from flask.templating import render_template
@@ -76,14 +77,16 @@ class PropertyModelService(coach.Microservice):
         # Get all alternatives previously added by the user for the current case
         alternatives_list = self._get_alternatives(db_infos)
         alternatives_name_list = alternatives_list[0]
-        alternatives_uri_list = alternatives_list[1]
+        
+        # Get all the estimations of the case at once, and build the overview from them
+        estimation_matrix = case_db_proxy.get_estimation_matrix(user_id = user_id, token = user_token, case_id = case_id)
         properties_estimations = []
         for property_name in properties_name_list:
             estimations_methods_names = self._get_estimation_methods_name(property_name)
             estimation_methods = []
             for estimation_method_name in estimations_methods_names:
                 estimation_method_ontology_id = self._get_estimation_method_ontology_id_name(estimation_method_name)
-                estimated_values = self._get_estimated_value_list(db_infos, alternatives_uri_list, property_name, 
+                estimated_values = self._get_estimated_value_list(estimation_matrix, alternatives_list, property_name, 
                                                                   estimation_method_ontology_id)
                 
                 estimation_methods.append({
@@ -467,8 +470,8 @@ class PropertyModelService(coach.Microservice):
             ?instance_ontology_uri orion:description ?description .
         }
         """
-        result = self._get_ontology(db_infos).query(q, initNs = { "orion": orion_ns }, 
-                                                    initBindings = { "?class_name": class_name })
+        result = sparql.query(self._get_ontology(db_infos), "PropertyModelService.get_ontology_instances", q, initNs = { "orion": orion_ns }, 
+                              initBindings = { "?class_name": class_name })
         return list(result)
     
     def _get_property_ontology_id_name(self, property_attribute, is_property_attribute_name = True):
@@ -540,8 +543,8 @@ class PropertyModelService(coach.Microservice):
                         ?property_ontology_uri orion:type ?property_type .
                     }
         """
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, 
-                                                  initBindings = {"property_name": rdflib.Literal(property_name)})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_property_type", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"property_name": rdflib.Literal(property_name)})
         result = [t.toPython() for (t,) in query_result]
         if len(result) != 1:
             raise RuntimeError("The property " + property_name + " must have exactly 1 type, but " + str(len(result)) + " were found.")
@@ -552,12 +555,14 @@ class PropertyModelService(coach.Microservice):
                                + ", ".join(allowed_types) + ".")
         return result[0]
 
-    def _get_estimated_value_list(self, db_infos, alternatives_uri_list, property_name, estimation_method_ontology_id):
+    def _get_estimated_value_list(self, estimation_matrix, alternatives_list, property_name, estimation_method_ontology_id):
         """
         DESCRIPTION:
-            Returns a list with the value of a given estimation method and property for all alternatives in alternatives_uri_list.
+            Returns a list with the value of a given estimation method and property for all alternatives in alternatives_list.
         INPUT: 
-            alternatives_uri_list: A list with the uri of all the alternatives for which we want the value of the estimation.
+            estimation_matrix: All the estimations of the case, as returned by the get_estimation_matrix endpoint of the database.
+            alternatives_list: A tuple containing the list of name and the list of uri of the alternatives for which we want the
+                value of the estimation, as returned by _get_alternatives.
             property_name: The name of the property on which we want the estimated value.
             estimation_method_ontology_id: The id of the estimation method in the ontology for which the value will be retrieved
         OUTPUT:
@@ -570,29 +575,18 @@ class PropertyModelService(coach.Microservice):
                     but no value has been computed yet.
               - The value which has been computed.
         """
-        user_id = db_infos["user_id"]
-        user_token = db_infos["user_token"]
-        case_id = db_infos["case_id"]
-        case_db_proxy = db_infos["case_db_proxy"]
-
-        property_ontology_id = self._get_property_ontology_id_name(property_name)        
-        linked_alternatives_list_uri = case_db_proxy.get_alternative_from_property_ontology_id(user_id=user_id, token=user_token, 
-                                                                                               case_id=case_id, 
-                                                                                               property_ontology_id=property_ontology_id)
+        property_ontology_id = self._get_property_ontology_id_name(property_name)
+        property_estimations = estimation_matrix.get(property_ontology_id, {"alternatives": [], "estimations": {}})
         
-        property_uri = self._get_property_uri_from_name(db_infos, property_name)
         result = []
-        for alternative_uri in alternatives_uri_list:
-            if alternative_uri in linked_alternatives_list_uri:
-                db_result = case_db_proxy.get_estimation_value(user_id=user_id, token=user_token, case_id=case_id, 
-                                                               alternative_uri=alternative_uri, property_uri=property_uri, 
-                                                               estimation_method_ontology_id=estimation_method_ontology_id)
+        for (alternative_name, alternative_uri) in zip(*alternatives_list):
+            if alternative_uri in property_estimations["alternatives"]:
+                db_result = property_estimations["estimations"].get(alternative_uri, {}).get(estimation_method_ontology_id)
                 if db_result is None:
                     db_result = {"value": self.PROPERTY_VALUE_NOT_COMPUTED_STRING, "up_to_date": True}
             else:
                 db_result = {"value": self.PROPERTY_NOT_ADDED_STRING, "up_to_date": True}
             
-            alternative_name = self._get_alternative_name_from_uri(db_infos, alternative_uri)
             result.append({"alternative_name": alternative_name, "value": db_result["value"], "up_to_date": db_result["up_to_date"]})
         
         return result
@@ -703,8 +697,8 @@ class PropertyModelService(coach.Microservice):
                     }
         """
         
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns},
-                                                  initBindings = {"estimation_method_name": rdflib.Literal(estimation_method_name)})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_estimation_method_microservice_name", query, initNs = {"orion": orion_ns},
+                                    initBindings = {"estimation_method_name": rdflib.Literal(estimation_method_name)})
         result = [e.toPython() for (e,) in query_result]
         if len(result) != 1:
             raise RuntimeError("There should be exactly one microservice name for the estimation method " + estimation_method_name 
@@ -734,8 +728,8 @@ class PropertyModelService(coach.Microservice):
                     }
         """
         
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, 
-                                                  initBindings = {"property_ontology_uri": rdflib.URIRef(property_ontology_id)})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_estimation_methods_name", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"property_ontology_uri": rdflib.URIRef(property_ontology_id)})
         
         result = [e.toPython() for (e,) in query_result]
         property_type = self._get_property_type(property_name)
@@ -883,8 +877,8 @@ class PropertyModelService(coach.Microservice):
                     ORDER BY ?estimation_method_parameter_category_rank ?estimation_method_parameter_rank ?parameter_name
                 """
                 
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, 
-                                                  initBindings = {"estimation_method_name": rdflib.Literal(estimation_method_name)})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_estimation_method_parameters_from_ontology", query, initNs = {"orion": orion_ns}, 
+                                    initBindings = {"estimation_method_name": rdflib.Literal(estimation_method_name)})
         
         previous_parameter_category_name = None
         result = [{"category_name": None, "parameters":[]}]
@@ -933,7 +927,7 @@ class PropertyModelService(coach.Microservice):
                     }
         """
 
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, initBindings = {"parameter_name": parameter_name})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_estimation_method_parameter_possible_value", query, initNs = {"orion": orion_ns}, initBindings = {"parameter_name": parameter_name})
 
         return [e.toPython() for (e,) in query_result]
 
@@ -1024,8 +1018,8 @@ class PropertyModelService(coach.Microservice):
                     }
         """
         
-        query_result = self._get_ontology().query(query, initNs = {"orion": orion_ns}, 
-                                                  initBindings={"estimation_method_name": rdflib.Literal(estimation_method_name)})
+        query_result = sparql.query(self._get_ontology(), "PropertyModelService.get_estimation_method_used_properties_name", query, initNs = {"orion": orion_ns}, 
+                                    initBindings={"estimation_method_name": rdflib.Literal(estimation_method_name)})
         
         return [e.toPython() for (e,) in query_result]
     
@@ -0,0 +1,163 @@
+"""
+Created on 17 okt. 2026
+
+Concurrency benchmark of the store of the case database (COACH.framework.case_store).
+
+It fills a store in a temporary SQLite file with case graphs, and measures the read throughput, in requests per second, for an
+increasing number of reader threads. Each read request reads all the triples of a case from the store, in the connection of the
+request, like the case database does when a case is not in its case graph cache. Each measure is made without writes, and with a
+writer thread which runs write requests, each adding triples to a case and committing them, during the whole measure.
+
+It then measures the write throughput of several writer threads, for an increasing number of shards (see
+COACH.framework.case_catalog), with the cases placed in the shards by the hash of their uris.
+
+Usage: python benchmark_case_store.py [number_of_cases [seconds_per_measure]]
+"""
+
+# Set python import path to include COACH top directory
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import rdflib
+
+from COACH.framework.case_store import CaseStore, open_case_store
+from COACH.framework.case_catalog import hash_shard, shard_file_name
+
+
+ORION_NS = rdflib.Namespace("http://www.orion-research.se/ontology#")
+DATA_NS = rdflib.Namespace("http://localhost:5003/data#")
+
+
+def case_triples(number, size = 200):
+    """
+    Returns the triples of a case graph with size triples.
+    """
+    case_id = DATA_NS["case" + str(number)]
+    triples = [(case_id, rdflib.RDF.type, ORION_NS.Case), (case_id, ORION_NS.title, rdflib.Literal("Case " + str(number)))]
+    for n in range(size - len(triples)):
+        triples.append((DATA_NS["case" + str(number) + "_" + str(n // 5)], ORION_NS["p" + str(n % 5)], rdflib.Literal(n)))
+    return (case_id, triples)
+
+
+def run_measure(store, graph, case_ids, number_of_readers, seconds, with_writer):
+    """
+    Returns the number of read requests per second made by number_of_readers threads during seconds.
+    """
+    stop = threading.Event()
+    counts = [0] * number_of_readers
+
+    def reader(index):
+        rng = random.Random(index)
+        while not stop.is_set():
+            store.begin_request()
+            try:
+                len(list(graph.get_context(rng.choice(case_ids)).triples((None, None, None))))
+            finally:
+                store.end_request(True)
+            counts[index] += 1
+
+    def writer():
+        rng = random.Random()
+        n = 0
+        while not stop.is_set():
+            store.begin_request()
+            try:
+                case_graph = graph.get_context(rng.choice(case_ids))
+                case_graph.addN((DATA_NS["written" + str(n)], ORION_NS.value, rdflib.Literal(i), case_graph) for i in range(10))
+                case_graph.commit()
+            finally:
+                store.end_request(True)
+            n += 1
+
+    threads = [threading.Thread(target = reader, args = (index,)) for index in range(number_of_readers)]
+    if with_writer:
+        threads.append(threading.Thread(target = writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / seconds
+
+
+def run_write_measure(directory, number_of_shards, number_of_writers, seconds):
+    """
+    Returns the number of write requests per second made by number_of_writers threads during seconds, on number_of_shards 
+    store files in directory. Like in the case database, each request has a connection to every shard.
+    """
+    stores = [open_case_store(os.path.join(directory, str(number_of_shards) + "_" + shard_file_name(shard)))
+              for shard in range(number_of_shards)]
+    case_ids = [DATA_NS["case" + str(number)] for number in range(100)]
+    stop = threading.Event()
+    counts = [0] * number_of_writers
+
+    def writer(index):
+        rng = random.Random(index)
+        n = 0
+        while not stop.is_set():
+            case_id = rng.choice(case_ids)
+            (_, graph) = stores[hash_shard(case_id, number_of_shards)]
+            for (shard_store, _) in stores:
+                shard_store.begin_request()
+            try:
+                case_graph = graph.get_context(case_id)
+                case_graph.addN((DATA_NS["written" + str(index) + "_" + str(n)], ORION_NS.value, rdflib.Literal(i), case_graph) 
+                                for i in range(10))
+                case_graph.commit()
+            finally:
+                for (shard_store, _) in stores:
+                    shard_store.end_request(True)
+            counts[index] += 1
+            n += 1
+
+    threads = [threading.Thread(target = writer, args = (index,)) for index in range(number_of_writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for (store, _) in stores:
+        store.close()
+    return sum(counts) / seconds
+
+
+def run(number_of_cases, seconds):
+    directory = tempfile.mkdtemp()
+    try:
+        identifier = rdflib.URIRef("coach_case_db")
+        store = CaseStore(identifier = identifier)
+        graph = rdflib.ConjunctiveGraph(store = store, identifier = identifier)
+        store.open(rdflib.Literal("sqlite:///" + os.path.join(directory, "coach_case_db.db")), create = True)
+        case_ids = []
+        for number in range(number_of_cases):
+            (case_id, triples) = case_triples(number)
+            case_graph = graph.get_context(case_id)
+            case_graph.addN((s, p, o, case_graph) for (s, p, o) in triples)
+            case_ids.append(case_id)
+
+        print("{0:<8} {1:>18} {2:>18}".format("readers", "reads/s", "reads/s (writer)"))
+        for number_of_readers in [1, 2, 4, 8]:
+            print("{0:<8} {1:>18.1f} {2:>18.1f}".format(number_of_readers,
+                                                        run_measure(store, graph, case_ids, number_of_readers, seconds, False),
+                                                        run_measure(store, graph, case_ids, number_of_readers, seconds, True)))
+        store.close()
+
+        print()
+        print("{0:<8} {1:>18}".format("shards", "writes/s (4 writers)"))
+        for number_of_shards in [1, 2, 4]:
+            print("{0:<8} {1:>18.1f}".format(number_of_shards, run_write_measure(directory, number_of_shards, 4, seconds)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100, float(sys.argv[2]) if len(sys.argv) > 2 else 2.0)
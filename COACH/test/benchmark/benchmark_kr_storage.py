@@ -0,0 +1,159 @@
+"""
+Created on 17 okt. 2026
+
+Benchmark of the storage backends of the knowledge repository (COACH.knowledge_repository.storage).
+
+It builds case graphs shaped like the ones exported by the case database, and times the three workloads of the knowledge repository
+for each backend: export (storing a case), import (reading the nodes and relations of a case), and similarity (reading the goals,
+stakeholders and context of all cases to compute their feature vectors, and the details and estimations of the most similar ones).
+
+The SQLite backend is always measured, in a temporary file. The Neo4j backend is measured if the neo4j driver is installed and
+credentials are given; the cases are stored in the database of the server, and deleted afterwards.
+
+Usage: python benchmark_kr_storage.py [number_of_cases [neo4j_user_name neo4j_password]]
+"""
+
+# Set python import path to include COACH top directory
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+
+import shutil
+import tempfile
+import timeit
+
+import rdflib
+
+from COACH.knowledge_repository.storage import group_case_triples
+from COACH.knowledge_repository.sqlite_storage import SQLiteStorage
+
+
+ORION_NS = rdflib.Namespace("http://www.orion-research.se/ontology#")
+DATA_NS = rdflib.Namespace("http://localhost:5003/data#")
+
+CONTEXT_CATEGORIES = ["organization", "product", "stakeholder", "method", "business"]
+
+
+def build_case_graph(number, alternatives = 3, properties = 5, estimation_methods = 2, context_entries = 10):
+    """
+    Returns the graph of a case, with goals, roles, context entries, alternatives and estimations. Ontology entries are shared
+    by all cases, like in the knowledge repository.
+    """
+    graph = rdflib.Graph()
+    prefix = "case" + str(number) + "_"
+    node = lambda name: DATA_NS[prefix + name]
+    case_id = node("case")
+    graph.add((case_id, rdflib.RDF.type, ORION_NS.Case))
+    graph.add((case_id, ORION_NS.title, rdflib.Literal("Case " + str(number))))
+
+    graph.add((case_id, ORION_NS.goal, node("goal")))
+    for g in range(3):
+        graph.add((node("goal"), ORION_NS.customer_value, ORION_NS["CustomerValue" + str((number + g) % 7)]))
+
+    graph.add((case_id, ORION_NS.role, node("role")))
+    graph.add((node("role"), rdflib.RDF.type, ORION_NS.Role))
+    graph.add((node("role"), ORION_NS.person, DATA_NS["user" + str(number % 10)]))
+    graph.add((node("role"), ORION_NS.role_type, ORION_NS["RoleType" + str(number % 4)]))
+
+    graph.add((case_id, ORION_NS.context, node("context")))
+    for category in CONTEXT_CATEGORIES:
+        graph.add((node("context"), ORION_NS[category], node(category)))
+        for e in range(context_entries):
+            entry = node(category + str(e))
+            graph.add((node(category), ORION_NS[category[0].upper() + str(e).zfill(2)], entry))
+            graph.add((entry, ORION_NS.value, rdflib.Literal(str((number * e) % 5))))
+
+    for a in range(alternatives):
+        alternative = node("alternative" + str(a))
+        graph.add((case_id, ORION_NS.alternative, alternative))
+        graph.add((alternative, rdflib.RDF.type, ORION_NS.Alternative))
+        graph.add((alternative, ORION_NS.title, rdflib.Literal("Alternative " + str(a))))
+    graph.add((case_id, ORION_NS.selected_alternative, node("alternative0")))
+
+    for p in range(properties):
+        prop = node("property" + str(p))
+        graph.add((case_id, ORION_NS.property, prop))
+        graph.add((prop, rdflib.RDF.type, ORION_NS.Property))
+        graph.add((prop, ORION_NS.ontology_id, ORION_NS["property" + str(p)]))
+        for m in range(estimation_methods):
+            for a in range(alternatives):
+                estimation = node("estimation" + str(p) + "_" + str(m) + "_" + str(a))
+                graph.add((case_id, ORION_NS.estimation, estimation))
+                graph.add((estimation, rdflib.RDF.type, ORION_NS.Estimation))
+                graph.add((estimation, ORION_NS.belong_to_property, prop))
+                graph.add((estimation, ORION_NS.belong_to_alternative, node("alternative" + str(a))))
+                graph.add((estimation, ORION_NS.ontology_id, ORION_NS["method" + str(m)]))
+                graph.add((estimation, ORION_NS.value, rdflib.Literal(str(p * m + a))))
+                graph.add((estimation, ORION_NS.up_to_date, rdflib.Literal(True)))
+    return (str(case_id), graph)
+
+
+def run_workloads(storage, cases):
+    """
+    Returns the times in ms of the export, import and similarity workloads on storage, per case for the two first.
+    """
+    grouped_cases = [(case_uri, group_case_triples(graph, str(ORION_NS))) for (case_uri, graph) in cases]
+    cases_uri = [case_uri for (case_uri, _) in cases]
+
+    def export():
+        for (case_uri, (nodes_uri, labels, properties, relations)) in grouped_cases:
+            storage.store_case(case_uri, nodes_uri, labels, properties, relations)
+
+    def import_():
+        for case_uri in cases_uri:
+            list(storage.get_case_nodes(case_uri))
+            list(storage.get_case_relations(case_uri))
+
+    def similarity():
+        for case_uri in storage.get_cases_uri():
+            storage.get_case_goals(case_uri)
+            storage.get_case_stakeholder_types(case_uri)
+            for category in CONTEXT_CATEGORIES:
+                storage.get_case_context(case_uri, category)
+        storage.get_cases_details(cases_uri[:10])
+        storage.get_cases_estimations(cases_uri[:10])
+
+    # The cases are exported twice, so that the second export also measures the replacement of the stored version
+    export()
+    export_time = timeit.timeit(export, number = 1) / len(cases) * 1000
+    import_time = timeit.timeit(import_, number = 1) / len(cases) * 1000
+    similarity_time = timeit.timeit(similarity, number = 1) * 1000
+
+    # All the nodes of a case are reachable from the case node
+    (case_uri, (nodes_uri, _, _, relations)) = grouped_cases[0]
+    assert {node[0] for node in storage.get_case_nodes(case_uri)} == nodes_uri
+    assert len(list(storage.get_case_relations(case_uri))) == sum(len(pairs) for pairs in relations.values())
+
+    for case_uri in cases_uri:
+        storage.delete_case(case_uri)
+    storage.collect_garbage()
+    return (export_time, import_time, similarity_time)
+
+
+def run(number, neo4j_credentials = None):
+    cases = [build_case_graph(n) for n in range(number)]
+    print("{0:<10} {1:>16} {2:>16} {3:>16}".format("backend", "export (ms/case)", "import (ms/case)", "similarity (ms)"))
+
+    directory = tempfile.mkdtemp()
+    try:
+        storage = SQLiteStorage(os.path.join(directory, "knowledge_repository.db"))
+        print("{0:<10} {1:>16.3f} {2:>16.3f} {3:>16.3f}".format("sqlite", *run_workloads(storage, cases)))
+        storage.close()
+    finally:
+        shutil.rmtree(directory)
+
+    if neo4j_credentials is None:
+        print("neo4j      skipped, no credentials given")
+        return
+    try:
+        from COACH.knowledge_repository.neo4j_storage import Neo4jStorage
+    except ImportError:
+        print("neo4j      skipped, the neo4j driver is not installed")
+        return
+    storage = Neo4jStorage("bolt://localhost", *neo4j_credentials)
+    print("{0:<10} {1:>16.3f} {2:>16.3f} {3:>16.3f}".format("neo4j", *run_workloads(storage, cases)))
+    storage.close()
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100, sys.argv[2:4] if len(sys.argv) > 3 else None)
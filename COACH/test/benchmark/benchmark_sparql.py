@@ -0,0 +1,108 @@
+"""
+Created on 17 okt. 2026
+
+Micro-benchmark of the prepared query registry (COACH.framework.sparql).
+
+It builds an in-memory case graph shaped like the ones of the case database, and times the queries of the endpoints 
+get_estimation_uri (used by get_estimation_value) and get_context, once passing the query string to graph.query as before,
+and once through the registry. The difference is the parsing and translation cost removed from each call.
+
+Usage: python benchmark_sparql.py [number_of_calls]
+"""
+
+# Set python import path to include COACH top directory
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+
+import timeit
+
+import rdflib
+
+from COACH.framework import sparql
+
+
+ORION_NS = rdflib.Namespace("http://www.orion-research.se/ontology#")
+DATA_NS = rdflib.Namespace("http://localhost:5003/data#")
+
+# The queries are the ones of CaseDatabase.get_estimation_uri and CaseDatabase.get_context
+ESTIMATION_URI_QUERY = """SELECT ?estimation 
+                        WHERE {
+                            ?case_id orion:estimation ?estimation .
+                            ?estimation orion:belong_to_alternative ?alternative_uri .
+                            ?estimation orion:belong_to_property ?property .
+                            ?estimation orion:ontology_id ?estimation_method_ontology_id
+                        } 
+                    """
+
+CONTEXT_QUERY = """ SELECT ?entry_id ?entry_value
+                        WHERE {
+                            ?case_id orion:context ?general_context_uri .
+                            ?general_context_uri ?context_predicate ?context_uri .
+                            ?context_uri ?entry_id ?entry_uri .
+                            ?entry_uri orion:value ?entry_value .
+                        }
+            """
+
+
+def build_case_graph(alternatives = 5, properties = 10, estimation_methods = 3, context_entries = 20):
+    """
+    Returns a graph with one case, and the bindings used to query its first estimation and its organization context.
+    """
+    graph = rdflib.Graph()
+    case_id = DATA_NS["1"]
+    graph.add((case_id, rdflib.RDF.type, ORION_NS.Case))
+    counter = 2
+    for a in range(alternatives):
+        alternative = DATA_NS[str(counter)]
+        counter += 1
+        graph.add((case_id, ORION_NS.alternative, alternative))
+        for p in range(properties):
+            prop = DATA_NS["property" + str(p)]
+            graph.add((prop, ORION_NS.belong_to, alternative))
+            for m in range(estimation_methods):
+                estimation = DATA_NS[str(counter)]
+                counter += 1
+                graph.add((case_id, ORION_NS.estimation, estimation))
+                graph.add((estimation, ORION_NS.belong_to_alternative, alternative))
+                graph.add((estimation, ORION_NS.belong_to_property, prop))
+                graph.add((estimation, ORION_NS.ontology_id, ORION_NS["method" + str(m)]))
+                graph.add((estimation, ORION_NS.value, rdflib.Literal(float(counter))))
+
+    general_context = DATA_NS["general_context"]
+    organization_context = DATA_NS["organization_context"]
+    graph.add((case_id, ORION_NS.context, general_context))
+    graph.add((general_context, ORION_NS.organization_context, organization_context))
+    for e in range(context_entries):
+        entry = DATA_NS["entry" + str(e)]
+        graph.add((organization_context, ORION_NS["O" + str(e).zfill(2)], entry))
+        graph.add((entry, ORION_NS.value, rdflib.Literal("value " + str(e))))
+
+    estimation_bindings = {"case_id": case_id, "alternative_uri": DATA_NS["2"], "property": DATA_NS["property0"],
+                           "estimation_method_ontology_id": ORION_NS.method0}
+    context_bindings = {"case_id": case_id, "context_predicate": ORION_NS.organization_context}
+    return (graph, estimation_bindings, context_bindings)
+
+
+def run(number):
+    (graph, estimation_bindings, context_bindings) = build_case_graph()
+    init_ns = {"orion": ORION_NS}
+    benchmarks = [("get_estimation_uri", ESTIMATION_URI_QUERY, estimation_bindings),
+                  ("get_context", CONTEXT_QUERY, context_bindings)]
+
+    print("{0:<20} {1:>16} {2:>18} {3:>8}".format("query", "string (ms/call)", "prepared (ms/call)", "speedup"))
+    for (name, query, bindings) in benchmarks:
+        def string_query():
+            return list(graph.query(query, initNs = init_ns, initBindings = bindings))
+        def prepared_query():
+            return list(sparql.query(graph, "benchmark." + name, query, initNs = init_ns, initBindings = bindings))
+
+        # Both variants must give the same answer
+        assert sorted(string_query()) == sorted(prepared_query())
+        string_time = timeit.timeit(string_query, number = number) / number * 1000
+        prepared_time = timeit.timeit(prepared_query, number = number) / number * 1000
+        print("{0:<20} {1:>16.3f} {2:>18.3f} {3:>7.1f}x".format(name, string_time, prepared_time, string_time / prepared_time))
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
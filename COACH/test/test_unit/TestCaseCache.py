@@ -0,0 +1,161 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the case graph cache (COACH.framework.case_cache), on an in-memory triple store.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+import rdflib
+from COACH.framework.case_cache import CaseGraphCache, InternedStore
+
+
+NS = rdflib.Namespace("http://www.orion-research.se/ontology#")
+CASE = "http://localhost:5003/data#case1"
+
+
+class TestInternedStore(unittest.TestCase):
+
+    def test_triples(self):
+        store = InternedStore()
+        store.add((NS.a, NS.p, rdflib.Literal(1)), None)
+        store.add((NS.a, NS.p, rdflib.Literal(1)), None)
+        store.add((NS.a, NS.q, NS.b), None)
+        self.assertEqual(len(store), 2)
+        self.assertEqual({t for (t, _) in store.triples((None, NS.q, None))}, {(NS.a, NS.q, NS.b)})
+        self.assertEqual(len(list(store.triples((NS.a, None, None)))), 2)
+        self.assertEqual(list(store.triples((NS.c, None, None))), [])
+
+
+    def test_terms_are_released(self):
+        store = InternedStore()
+        for n in range(100):
+            store.add((NS.a, NS.p, rdflib.Literal(n)), None)
+            store.remove((NS.a, NS.p, rdflib.Literal(n)))
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.ids, {})
+        # Released ids are reused
+        self.assertLessEqual(len(store.terms), 3)
+        store.add((NS.a, NS.p, NS.b), None)
+        store.add((NS.b, NS.p, NS.a), None)
+        store.remove((NS.a, None, None))
+        self.assertEqual(set(store.ids), {NS.a, NS.b, NS.p})
+        self.assertEqual([t for (t, _) in store.triples((None, None, None))], [(NS.b, NS.p, NS.a)])
+
+
+    def test_copy(self):
+        store = InternedStore()
+        store.add((NS.a, NS.p, NS.b), None)
+        copy = store.copy()
+        copy.add((NS.a, NS.p, NS.c), None)
+        copy.remove((NS.a, NS.p, NS.b))
+        self.assertEqual([t for (t, _) in store.triples((None, None, None))], [(NS.a, NS.p, NS.b)])
+        self.assertEqual([t for (t, _) in copy.triples((None, None, None))], [(NS.a, NS.p, NS.c)])
+
+
+
+class TestCaseGraphCache(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = rdflib.ConjunctiveGraph()
+        self.cache = CaseGraphCache(lambda identifier: self.graph.get_context(identifier), 1000)
+
+
+    def in_thread(self, function):
+        """
+        Returns the result of function, called in another thread.
+        """
+        result = []
+        thread = threading.Thread(target = lambda: result.append(function()))
+        thread.start()
+        thread.join()
+        return result[0]
+
+
+    def test_write_through(self):
+        case_graph = self.cache.get(CASE)
+        case_graph.add((NS.a, NS.p, rdflib.Literal(1)))
+        case_graph.addN((NS.a, NS.q, rdflib.Literal(n), case_graph) for n in range(5))
+        case_graph.set((NS.a, NS.p, rdflib.Literal(2)))
+        self.assertEqual(set(case_graph), set(self.graph.get_context(rdflib.URIRef(CASE))))
+        self.assertEqual(case_graph.value(NS.a, NS.p), rdflib.Literal(2))
+        query = "SELECT ?o WHERE { ?s orion:q ?o }"
+        self.assertEqual(len(list(case_graph.query(query, initNs = {"orion": NS}))), 5)
+        case_graph.remove((NS.a, NS.q, None))
+        self.assertEqual(len(self.graph), 1)
+        self.assertEqual(set(self.cache.get(CASE)), {(NS.a, NS.p, rdflib.Literal(2))})
+
+
+    def test_uncommitted_writes_are_not_shared(self):
+        self.cache.get(CASE).add((NS.a, NS.p, NS.b))
+        self.cache.begin_request()
+        case_graph = self.cache.get(CASE)
+        self.assertIs(self.cache.get(CASE), case_graph)
+        case_graph.add((NS.a, NS.p, NS.c))
+        self.assertEqual(len(case_graph), 2)
+        # Another request only sees the published case until this request ends
+        self.assertEqual(self.in_thread(lambda: len(self.cache.get(CASE))), 1)
+        self.assertEqual(self.cache.end_request(False), [CASE])
+        self.assertEqual(self.in_thread(lambda: len(self.cache.get(CASE))), 2)
+
+
+    def test_rolled_back_writes_are_discarded(self):
+        self.cache.get(CASE).add((NS.a, NS.p, NS.b))
+        self.cache.begin_request()
+        self.cache.get(CASE).add((NS.a, NS.p, NS.c))
+        self.graph.get_context(rdflib.URIRef(CASE)).remove((NS.a, NS.p, NS.c))
+        self.assertEqual(self.cache.end_request(True), [CASE])
+        self.assertEqual(set(self.cache.get(CASE)), {(NS.a, NS.p, NS.b)})
+
+
+    def test_stale_writer_drops_case(self):
+        self.cache.get(CASE).add((NS.a, NS.p, NS.b))
+        self.cache.begin_request()
+        case_graph = self.cache.get(CASE)
+
+        def other_request():
+            self.cache.begin_request()
+            self.cache.get(CASE).add((NS.a, NS.p, NS.c))
+            self.cache.end_request(False)
+        self.in_thread(other_request)
+        # This request read the case before the other one published its change, so its copy is not published
+        case_graph.add((NS.a, NS.p, NS.d))
+        self.cache.end_request(False)
+        self.assertNotIn(rdflib.URIRef(CASE), self.cache.stores)
+        self.assertEqual(len(self.cache.get(CASE)), 3)
+
+
+    def test_invalidate(self):
+        self.cache.get(CASE).add((NS.a, NS.p, NS.b))
+        self.cache.begin_request()
+        self.cache.get(CASE)
+        self.graph.get_context(rdflib.URIRef(CASE)).add((NS.a, NS.p, NS.c))
+        self.cache.invalidate(CASE)
+        self.assertEqual(len(self.cache.get(CASE)), 2)
+        self.assertEqual(self.cache.end_request(False), [CASE])
+        self.assertNotIn(rdflib.URIRef(CASE), self.cache.stores)
+        self.assertEqual(len(self.cache.get(CASE)), 2)
+
+
+    def test_eviction(self):
+        cache = CaseGraphCache(lambda identifier: self.graph.get_context(identifier), 30)
+        for n in range(5):
+            case_graph = cache.get(CASE + str(n))
+            case_graph.addN((NS.a, NS.p, rdflib.Literal(i), case_graph) for i in range(10))
+        self.assertEqual(list(cache.stores), [rdflib.URIRef(CASE + str(n)) for n in range(2, 5)])
+        self.assertEqual(len(cache.get(CASE + "0")), 10)
+
+
+    def test_disabled(self):
+        cache = CaseGraphCache(lambda identifier: self.graph.get_context(identifier), 0)
+        self.assertIs(cache.get(CASE).store, self.graph.store)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the case catalog and the placement of cases in shards (COACH.framework.case_catalog), in an in-memory database.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+import rdflib
+from COACH.framework.case_catalog import CaseCatalog, hash_shard, shard_file_name, find_cases
+
+
+ORION_NS = "http://www.orion-research.se/ontology#"
+O = rdflib.Namespace(ORION_NS)
+D = rdflib.Namespace("http://localhost:5003/data#")
+
+
+def case_graph(case_id, title, users, closed = False):
+    graph = rdflib.Graph(identifier = case_id)
+    graph.add((case_id, rdflib.RDF.type, O.Case))
+    graph.add((case_id, O.title, rdflib.Literal(title)))
+    for user_uri in users:
+        role = D[str(case_id).split("#")[1] + "_" + str(user_uri).split("#")[1]]
+        graph.add((case_id, O.role, role))
+        graph.add((role, O.person, user_uri))
+    if closed:
+        graph.add((case_id, O.close, rdflib.Literal(True)))
+    return graph
+
+
+
+class TestCaseCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.catalog = CaseCatalog(":memory:", ORION_NS)
+        self.addCleanup(self.catalog.close)
+
+
+    def test_shards(self):
+        shards = [hash_shard(D["case" + str(n)], 4) for n in range(100)]
+        self.assertEqual(shards, [hash_shard(str(D["case" + str(n)]), 4) for n in range(100)])
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+        self.assertEqual([hash_shard(D.case1, 1), shard_file_name(0), shard_file_name(2)],
+                         [0, "coach_case_db.db", "coach_case_db_2.db"])
+
+
+    def test_find_cases(self):
+        graph = rdflib.ConjunctiveGraph()
+        for n in range(3):
+            context = graph.get_context(D["case" + str(n)])
+            context.addN((s, p, o, context) for (s, p, o) in case_graph(D["case" + str(n)], "Case", [D.alice]))
+        # A case typed in the context of another case is not a case of the store
+        graph.get_context(D.case0).add((D.other, rdflib.RDF.type, O.Case))
+        self.assertEqual(find_cases(graph, ORION_NS), [str(D["case" + str(n)]) for n in range(3)])
+
+
+    def test_update(self):
+        self.assertTrue(self.catalog.is_empty())
+        self.assertEqual(self.catalog.largest_shard(), -1)
+        self.catalog.update(D.case1, 0, case_graph(D.case1, "Case 1", [D.alice, D.bob]))
+        self.catalog.update(D.case2, 2, case_graph(D.case2, "Case 2", [D.alice], closed = True))
+        self.assertFalse(self.catalog.is_empty())
+        self.assertEqual((self.catalog.shard(D.case2), self.catalog.shard(D.case3)), (2, None))
+        self.assertTrue(self.catalog.contains(str(D.case1)))
+        self.assertEqual(self.catalog.largest_shard(), 2)
+        self.assertEqual(sorted(self.catalog.user_cases(D.alice)), [(str(D.case1), "Case 1", False), (str(D.case2), "Case 2", True)])
+        self.assertEqual(self.catalog.user_cases(D.bob), [(str(D.case1), "Case 1", False)])
+
+        # Updating a case replaces its title, shard and stakeholders
+        self.catalog.update(D.case1, 1, case_graph(D.case1, "New title", [D.alice]))
+        self.assertEqual(self.catalog.user_cases(D.bob), [])
+        self.assertEqual(self.catalog.cases(), [(str(D.case1), 1), (str(D.case2), 2)])
+        self.assertIn((str(D.case1), "New title", False), self.catalog.user_cases(D.alice))
+
+
+    def test_remove(self):
+        self.catalog.update(D.case1, 0, case_graph(D.case1, "Case 1", [D.alice]))
+        self.catalog.update(D.case2, 0, case_graph(D.case2, "Case 2", [D.alice]))
+        self.catalog.remove(D.case1)
+        self.assertEqual(self.catalog.user_cases(D.alice), [(str(D.case2), "Case 2", False)])
+        # A graph which no longer describes a case removes the case
+        self.catalog.update(D.case2, 0, rdflib.Graph())
+        self.assertTrue(self.catalog.is_empty())
+        self.assertEqual(self.catalog.user_cases(D.alice), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the triple store of the case database (COACH.framework.case_store), and of the reservation of resource ids in the
+case catalog (COACH.framework.case_catalog), on SQLite files in a temporary directory.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+import rdflib
+from COACH.framework.case_catalog import CaseCatalog, IdAllocator
+from COACH.framework.case_store import open_case_store
+
+
+NS = rdflib.Namespace("http://www.orion-research.se/ontology#")
+CASE = rdflib.URIRef("http://localhost:5003/data#case1")
+
+
+class TestCaseStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        (self.store, self.graph) = open_case_store(os.path.join(self.directory, "coach_case_db.db"))
+        self.addCleanup(self.store.close)
+        self.catalog = CaseCatalog(os.path.join(self.directory, "coach_case_catalog.db"), str(NS))
+        self.addCleanup(self.catalog.close)
+
+
+    def title(self, graph = None):
+        return (graph or self.graph).value(CASE, NS.title)
+
+
+    def in_thread(self, function):
+        """
+        Runs function in another thread, and returns its result, or None if it has not returned within a second.
+        """
+        result = []
+        thread = threading.Thread(target = lambda: result.append(function()), daemon = True)
+        thread.start()
+        thread.join(1)
+        return result[0] if result else None
+
+
+    def test_commit(self):
+        self.store.begin_request()
+        self.graph.get_context(CASE).add((CASE, NS.title, rdflib.Literal("Case 1")))
+        # Committing a graph does not end the transaction of the request, and other connections do not see its writes
+        self.graph.get_context(CASE).commit()
+        self.assertEqual(self.title(), rdflib.Literal("Case 1"))
+        self.assertEqual(self.in_thread(lambda: self.title() is None), True)
+        self.assertFalse(self.store.end_request(True))
+        self.assertFalse(self.store.in_request())
+        self.assertEqual(self.in_thread(self.title), rdflib.Literal("Case 1"))
+
+
+    def test_rollback(self):
+        self.graph.get_context(CASE).add((CASE, NS.title, rdflib.Literal("Case 1")))
+        self.store.begin_request()
+        self.graph.get_context(CASE).set((CASE, NS.title, rdflib.Literal("New title")))
+        self.assertTrue(self.store.end_request(False))
+        self.assertEqual(self.title(), rdflib.Literal("Case 1"))
+        # A request without writes has nothing to roll back
+        self.store.begin_request()
+        self.assertEqual(self.title(), rdflib.Literal("Case 1"))
+        self.assertFalse(self.store.end_request(False))
+
+
+    def test_write_lock(self):
+        self.store.begin_request()
+        self.graph.get_context(CASE).add((CASE, NS.title, rdflib.Literal("Case 1")))
+        # The write lock is held by the request from its first write until it ends
+        self.assertEqual(self.in_thread(lambda: self.store.write_lock.acquire(blocking = False)), False)
+        writing = threading.Thread(target = lambda: self.graph.get_context(CASE).add((CASE, NS.closed, rdflib.Literal(True))))
+        writing.start()
+        writing.join(0.2)
+        self.assertTrue(writing.is_alive())
+        self.store.end_request(True)
+        writing.join(5)
+        self.assertFalse(writing.is_alive())
+        self.assertEqual(len(self.graph), 2)
+
+
+    def test_reservation_during_write(self):
+        ids = IdAllocator(self.catalog, 2)
+        self.store.begin_request()
+        self.graph.get_context(CASE).add((CASE, NS.title, rdflib.Literal("Case 1")))
+        # Blocks are reserved while the request holds the write lock of the store, both in its thread and in others
+        self.assertEqual([ids.new_id() for _ in range(3)], [0, 1, 2])
+        self.assertEqual(self.in_thread(ids.new_id), 3)
+        self.assertEqual(self.in_thread(ids.new_id), 4)
+        self.store.end_request(True)
+
+
+    def test_rolled_back_reservation(self):
+        ids = IdAllocator(self.catalog, 3)
+        self.store.begin_request()
+        self.graph.get_context(CASE).add((CASE, NS.title, rdflib.Literal("Case 1")))
+        self.assertEqual(ids.new_id(), 0)
+        self.assertTrue(self.store.end_request(False))
+        self.assertEqual(len(self.graph), 0)
+        # The block of the rolled back request is still reserved, so the next block follows it
+        self.assertEqual([ids.new_id() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(IdAllocator(self.catalog, 3).new_id(), 6)
+
+
+    def test_initial_id_counter(self):
+        self.assertEqual(IdAllocator(self.catalog, 10, 42).new_id(), 42)
+        self.assertEqual(IdAllocator(self.catalog, 10, 5).new_id(), 52)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the feature store of the knowledge repository (COACH.knowledge_repository.feature_store), in a temporary directory.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+from COACH.knowledge_repository.feature_store import FeatureStore
+
+
+LAYOUT = {"goal": ["g"]}
+
+
+class TestFeatureStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Cleanups are run in reverse order, so the directory is removed after the stores are closed
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def open_store(self, **kwargs):
+        store = FeatureStore(self.directory, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+
+    def vector(self, n):
+        return [float(n), 0.0, 1.0]
+
+
+    def assert_same_store(self, store, other):
+        self.assertEqual(store.rows, other.rows)
+        self.assertEqual(sorted(store.free_rows), sorted(other.free_rows))
+        self.assertEqual(store.inverted_index, other.inverted_index)
+        for (case_uri, row) in store.rows.items():
+            self.assertEqual(store.matrix[row].tolist(), other.matrix[row].tolist())
+
+
+    def test_reopen(self):
+        store = self.open_store(initial_capacity = 4, minimum_log_length = 5)
+        store.reset(LAYOUT, 3, [], {"case0": self.vector(0)})
+        for n in range(1, 12):
+            store.put("case" + str(n), self.vector(n))
+            if n % 3 == 0:
+                store.remove("case" + str(n - 1))
+        store.put("case1", self.vector(100))
+        self.assertLessEqual(store.log_length, max(5, len(store.rows)))
+        self.assert_same_store(store, self.open_store())
+
+
+    def test_rows_are_reused(self):
+        store = self.open_store(initial_capacity = 4)
+        store.reset(LAYOUT, 3, [], {})
+        for n in range(4):
+            store.put("case" + str(n), self.vector(n + 1))
+        store.remove("case1")
+        store.remove("case2")
+        store.put("case4", self.vector(5))
+        # The last released row is reused first
+        self.assertEqual(store.rows["case4"], 2)
+        self.assertEqual(store.capacity, 4)
+        self.assertEqual(store.matrix[1].tolist(), [0.0, 0.0, 0.0])
+        self.assertEqual(store.candidates([0.0, 0.0, 1.0]), {"case0", "case3", "case4"})
+
+
+    def test_pinned_rows(self):
+        store = self.open_store(initial_capacity = 4)
+        store.reset(LAYOUT, 3, [], {"case" + str(n): self.vector(n + 1) for n in range(3)})
+        (case_uris_by_row, shards, shape) = store.pin_shards(2)
+        self.assertEqual((case_uris_by_row, shards, shape), ({0: "case0", 1: "case1", 2: "case2"}, [[0, 1], [2]], (4, 3)))
+        # While the rows are pinned, their vectors are not changed, and their rows are not reused
+        store.put("case0", self.vector(10))
+        store.remove("case1")
+        store.put("case3", self.vector(4))
+        self.assertEqual(store.matrix[[0, 1]].tolist(), [self.vector(1), self.vector(2)])
+        self.assertNotIn(store.rows["case3"], (0, 1))
+        self.assertEqual(store.matrix[store.rows["case0"]].tolist(), self.vector(10))
+        resetting = threading.Thread(target = lambda: store.reset(LAYOUT, 3, [], {}))
+        resetting.start()
+        resetting.join(0.2)
+        self.assertTrue(resetting.is_alive())
+        store.unpin()
+        resetting.join(5)
+        self.assertFalse(resetting.is_alive())
+        self.assertEqual(store.rows, {})
+
+
+    def test_rows_released_after_unpin(self):
+        store = self.open_store(initial_capacity = 4)
+        store.reset(LAYOUT, 3, [], {"case0": self.vector(1), "case1": self.vector(2)})
+        store.pin_shards(1)
+        store.remove("case0")
+        self.assertEqual(store.free_rows, [3, 2])
+        store.unpin()
+        self.assertEqual(store.free_rows, [3, 2, 0])
+        self.assertEqual(store.matrix[0].tolist(), [0.0, 0.0, 0.0])
+        self.assertEqual(store.candidates(self.vector(1)), {"case1"})
+
+
+    def test_partial_log_line(self):
+        store = self.open_store()
+        store.reset(LAYOUT, 3, [], {"case0": self.vector(1)})
+        store.put("case1", self.vector(2))
+        store.log_file.write('["case2", ')
+        store.log_file.flush()
+        reopened = self.open_store()
+        self.assertEqual(reopened.rows, {"case0": 0, "case1": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the SQLite storage of the knowledge repository (COACH.knowledge_repository.sqlite_storage), in an in-memory database.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+import rdflib
+from COACH.knowledge_repository.sqlite_storage import SQLiteStorage
+from COACH.knowledge_repository.storage import group_case_triples
+
+
+ORION_NS = "http://www.orion-research.se/ontology#"
+O = rdflib.Namespace(ORION_NS)
+D = rdflib.Namespace("http://localhost:5003/data#")
+
+
+def case_graph(number, alternatives = ("A", "B")):
+    """
+    Returns the graph of a case with the given alternative titles. All cases have the same stakeholder, goal and stakeholder type.
+    """
+    case = D["case" + str(number)]
+    prefix = "c" + str(number) + "_"
+    graph = rdflib.Graph()
+    graph.add((case, rdflib.RDF.type, O.Case))
+    graph.add((case, O.title, rdflib.Literal("Case " + str(number))))
+    for title in alternatives:
+        graph.add((case, O.alternative, D[prefix + title]))
+        graph.add((D[prefix + title], rdflib.RDF.type, O.Alternative))
+        graph.add((D[prefix + title], O.title, rdflib.Literal(title)))
+    graph.add((case, O.selected_alternative, D[prefix + alternatives[0]]))
+
+    graph.add((case, O.role, D[prefix + "role"]))
+    graph.add((D[prefix + "role"], rdflib.RDF.type, O.Role))
+    graph.add((D[prefix + "role"], O.person, D.user))
+    graph.add((D[prefix + "role"], O.role_type, O.Manager))
+    graph.add((case, O.goal, D[prefix + "goal"]))
+    graph.add((D[prefix + "goal"], O.customer_value, O.Quality))
+
+    graph.add((case, O.context, D[prefix + "context"]))
+    graph.add((D[prefix + "context"], O.organization, D[prefix + "organization"]))
+    graph.add((D[prefix + "organization"], O.size, D[prefix + "size"]))
+    graph.add((D[prefix + "size"], O.value, rdflib.Literal(10)))
+
+    graph.add((case, O.property, D[prefix + "property"]))
+    graph.add((D[prefix + "property"], rdflib.RDF.type, O.Property))
+    graph.add((D[prefix + "property"], O.ontology_id, O.Cost))
+    graph.add((case, O.estimation, D[prefix + "estimation"]))
+    graph.add((D[prefix + "estimation"], rdflib.RDF.type, O.Estimation))
+    graph.add((D[prefix + "estimation"], O.belong_to_property, D[prefix + "property"]))
+    graph.add((D[prefix + "estimation"], O.ontology_id, O.Expert))
+    graph.add((D[prefix + "estimation"], O.belong_to_alternative, D[prefix + alternatives[0]]))
+    graph.add((D[prefix + "estimation"], O.value, rdflib.Literal(5)))
+    graph.add((D[prefix + "estimation"], O.up_to_date, rdflib.Literal(True)))
+    return graph
+
+
+
+class TestSQLiteStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = SQLiteStorage(":memory:")
+        self.addCleanup(self.storage.close)
+
+
+    def store(self, number, graph):
+        self.storage.store_case(str(D["case" + str(number)]), *group_case_triples(graph, ORION_NS))
+
+
+    def node_exists(self, uri):
+        return bool(self.storage._query("SELECT 1 FROM nodes WHERE uri = ?", (str(uri),)))
+
+
+    def stored_triples(self, number):
+        """
+        Returns the set of the triples of a case, as read from the storage with get_case_nodes and get_case_relations.
+        """
+        case_uri = str(D["case" + str(number)])
+        result = set()
+        for (uri, properties, labels) in self.storage.get_case_nodes(case_uri):
+            for (name, value) in properties.items():
+                result.add((rdflib.URIRef(uri), O[name], rdflib.Literal(value)))
+            for label in labels:
+                result.add((rdflib.URIRef(uri), rdflib.RDF.type, O[label]))
+        for (subject_uri, predicate_name, object_uri) in self.storage.get_case_relations(case_uri):
+            result.add((rdflib.URIRef(subject_uri), O[predicate_name], rdflib.URIRef(object_uri)))
+        return result
+
+
+    def test_store(self):
+        graph = case_graph(1)
+        self.store(1, graph)
+        self.assertEqual(self.stored_triples(1), set(graph))
+        self.assertEqual(self.storage.get_cases_uri(), [str(D.case1)])
+
+
+    def test_queries(self):
+        self.store(1, case_graph(1))
+        self.store(2, case_graph(2, ("C",)))
+        case_uri = str(D.case1)
+        self.assertEqual(sorted(self.storage.get_user_cases(str(D.user))), [[str(D.case1), "Case 1"], [str(D.case2), "Case 2"]])
+        self.assertEqual(self.storage.get_case_goals(case_uri), [str(O.Quality)])
+        self.assertEqual(set(self.storage.get_case_stakeholder_types(case_uri)), {str(D.user), str(O.Manager)})
+        self.assertEqual(self.storage.get_case_context(case_uri, "organization"), {"size": [10]})
+        self.assertEqual(self.storage.get_case_context(case_uri, "product"), {})
+        details = self.storage.get_cases_details([case_uri, str(D.case2), str(D.unknown)])
+        self.assertEqual(set(details), {case_uri, str(D.case2)})
+        (title, selected_alternative, alternatives) = details[case_uri]
+        self.assertEqual((title, selected_alternative, sorted(alternatives)), ("Case 1", "A", ["A", "B"]))
+        self.assertEqual(self.storage.get_cases_titles([case_uri, str(D.unknown)]), {case_uri: "Case 1"})
+        self.assertEqual(self.storage.get_cases_estimations([case_uri]),
+                         [(case_uri, str(O.Cost), str(O.Expert), {"value": 5, "up_to_date": True}, "A")])
+
+
+    def test_store_again(self):
+        self.store(1, case_graph(1))
+        graph = case_graph(1, ("B",))
+        self.store(1, graph)
+        self.assertEqual(self.stored_triples(1), set(graph))
+        self.assertFalse(self.node_exists(D.c1_A))
+        self.assertEqual(self.storage.get_cases_details([str(D.case1)])[str(D.case1)], ("Case 1", "B", ["B"]))
+
+
+    def test_delete_with_shared_nodes(self):
+        self.store(1, case_graph(1))
+        graph = case_graph(2)
+        self.store(2, graph)
+        self.storage.delete_case(str(D.case1))
+        self.assertEqual(self.storage.get_cases_uri(), [str(D.case2)])
+        self.assertFalse(self.node_exists(D.case1))
+        self.assertFalse(self.node_exists(D.c1_role))
+        # The nodes shared with the other case are kept
+        for uri in [D.user, O.Manager, O.Quality, O.Cost, O.Expert]:
+            self.assertTrue(self.node_exists(uri))
+        self.assertEqual(self.stored_triples(2), set(graph))
+        self.storage.delete_case(str(D.case2))
+        self.assertEqual(self.storage._query("SELECT count(*) FROM nodes"), [(0,)])
+
+
+    def test_collect_garbage(self):
+        graph = case_graph(1)
+        # A node without relations is not reachable from the case, and is therefore left when the case is deleted
+        graph.add((D.orphan, O.title, rdflib.Literal("Orphan")))
+        self.store(1, graph)
+        self.store(2, case_graph(2))
+        self.storage.delete_case(str(D.case1))
+        self.assertTrue(self.node_exists(D.orphan))
+        self.assertEqual(self.storage.collect_garbage(), (1, []))
+        self.assertFalse(self.node_exists(D.orphan))
+        self.assertEqual(self.storage.collect_garbage(), (0, []))
+        self.assertEqual(self.storage.get_cases_uri(), [str(D.case2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the similarity computation of the knowledge repository (COACH.knowledge_repository.similarity), against the former
+algorithm computing the similarity of two cases component by component, which is kept here as the reference. They also check that
+the candidate pruning of the feature store only leaves out cases whose similarity is 0.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+import numpy
+from COACH.knowledge_repository import similarity
+from COACH.knowledge_repository.feature_store import FeatureStore
+
+
+def legacy_segment_similarity(case_vector_1, case_vector_2, number_ratio_threshold, number_indexes, single_select_indexes):
+    """
+    Returns a pair (similarity, number_of_meaningful_components) for a segment of two case vectors, one component at a time.
+    """
+    vector_length = len(case_vector_1)
+    number_of_components_both_1 = 0
+    number_of_components_both_0 = 0
+    for i in range(vector_length):
+        value1 = abs(case_vector_1[i])
+        value2 = abs(case_vector_2[i])
+        value_min = min(value1, value2)
+        value_max = max(value1, value2)
+        if i in single_select_indexes:
+            if value_max == 0:
+                number_of_components_both_0 += 1
+            elif value_min == value_max:
+                number_of_components_both_1 += 1
+        elif i in number_indexes:
+            if value_max == 0:
+                number_of_components_both_0 += 1
+            elif value_min != 0 and value_max / value_min < number_ratio_threshold:
+                number_of_components_both_1 += 1
+        else:
+            if value_max == 0:
+                number_of_components_both_0 += 1
+            elif value_min == 1:
+                number_of_components_both_1 += 1
+    try:
+        number_of_meaningful_components = vector_length - number_of_components_both_0
+        return (number_of_components_both_1 / number_of_meaningful_components, number_of_meaningful_components)
+    except ZeroDivisionError:
+        return (0, 0)
+
+
+def legacy_similarity(vectors_1, vectors_2, number_ratio_threshold, weights):
+    """
+    Returns the similarity of two cases, given as dictionaries with a tuple (vector, number_indexes, single_select_indexes) for each
+    segment name, and weights, a dictionary with the weight of each segment.
+    """
+    numerator = 0
+    denominator = 0
+    for (name, weight) in weights.items():
+        (vector_1, number_indexes, single_select_indexes) = vectors_1[name]
+        (segment_similarity, meaningful_components) = legacy_segment_similarity(vector_1, vectors_2[name][0], number_ratio_threshold,
+                                                                                number_indexes, single_select_indexes)
+        numerator += segment_similarity * weight * meaningful_components
+        denominator += weight * meaningful_components
+    try:
+        return numerator / denominator
+    except ZeroDivisionError:
+        return 0
+
+
+
+class TestSimilarityComputation(unittest.TestCase):
+
+    # The segments, in the order of the feature vectors, with their lengths, number indexes and single select indexes
+    SEGMENTS = [("goal", 6, [], []), ("stakeholders", 5, [], []), ("context", 8, [1, 4], [0, 3, 6])]
+
+    def setUp(self):
+        self.rng = random.Random(17)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+
+    def random_case(self, density):
+        """
+        Returns a random case, as a dictionary with a tuple (vector, number_indexes, single_select_indexes) for each segment name.
+        Components are 0 with the probability 1 - density.
+        """
+        case = {}
+        for (name, length, number_indexes, single_select_indexes) in self.SEGMENTS:
+            vector = []
+            for i in range(length):
+                if self.rng.random() >= density:
+                    vector.append(0)
+                elif i in number_indexes:
+                    vector.append(self.rng.choice([1, 2, 2.5, 3, 10, -4]))
+                elif i in single_select_indexes:
+                    vector.append(self.rng.choice([1, 2, 3, -2]))
+                else:
+                    vector.append(1)
+            case[name] = (vector, number_indexes, single_select_indexes)
+        return case
+
+
+    def feature_vector(self, case):
+        return [value for (name, _, _, _) in self.SEGMENTS for value in case[name][0]]
+
+
+    def segments(self, weights):
+        result = []
+        start = 0
+        for (name, length, number_indexes, single_select_indexes) in self.SEGMENTS:
+            result.append((start, start + length, similarity.column_types(length, number_indexes, single_select_indexes), weights[name]))
+            start += length
+        return result
+
+
+    def single_select_columns(self):
+        result = []
+        start = 0
+        for (_, length, _, single_select_indexes) in self.SEGMENTS:
+            result.extend(start + i for i in single_select_indexes)
+            start += length
+        return result
+
+
+    def test_same_as_legacy(self):
+        for (density, weights, number_ratio_threshold) in [(0.5, {"goal": 1, "stakeholders": 1, "context": 1}, 1.5),
+                                                           (0.2, {"goal": 2, "stakeholders": 0.5, "context": 1}, 3),
+                                                           (0.05, {"goal": 0, "stakeholders": 1, "context": 3}, 1.1)]:
+            query = self.random_case(density)
+            cases = [self.random_case(density) for _ in range(200)]
+            matrix = numpy.array([self.feature_vector(case) for case in cases], dtype = numpy.float32)
+            similarities = similarity.compute_similarities(self.feature_vector(query), matrix, self.segments(weights),
+                                                           number_ratio_threshold)
+            for (case, computed) in zip(cases, similarities.tolist()):
+                self.assertAlmostEqual(computed, legacy_similarity(query, case, number_ratio_threshold, weights))
+
+
+    def test_pruning_keeps_similar_cases(self):
+        weights = {"goal": 1, "stakeholders": 1, "context": 1}
+        store = FeatureStore(self.directory)
+        self.addCleanup(store.close)
+        cases = {"case" + str(n): self.random_case(0.1) for n in range(300)}
+        store.reset({}, len(self.feature_vector(cases["case0"])), self.single_select_columns(),
+                    {case_uri: self.feature_vector(case) for (case_uri, case) in cases.items()})
+        for _ in range(10):
+            query = self.random_case(0.1)
+            candidates = store.candidates(self.feature_vector(query))
+            similar = {case_uri for (case_uri, case) in cases.items() if legacy_similarity(query, case, 1.5, weights) != 0}
+            self.assertTrue(similar <= candidates)
+            # The pruning leaves out some cases
+            self.assertLess(len(candidates), len(cases))
+
+
+    def test_top_candidates_of_shards(self):
+        query = self.random_case(0.3)
+        cases = [self.random_case(0.3) for _ in range(100)]
+        weights = {"goal": 1, "stakeholders": 1, "context": 1}
+        candidates = [(legacy_similarity(query, case, 1.5, weights), n) for (n, case) in enumerate(cases)]
+        top = similarity.top_candidates(candidates, 10)
+        merged = similarity.top_candidates([candidate for shard in range(4)
+                                            for candidate in similarity.top_candidates(candidates[shard::4], 10)], 10)
+        self.assertEqual(sorted(merged), sorted(top))
+        self.assertEqual(sorted(top)[-10:], sorted(candidates)[-10:])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Created on 17 okt. 2026
+
+Unit tests of the module tokens (COACH.framework.tokens). They need no running services.
+
+Usage: python -m unittest discover -s COACH/test/test_unit -p "Test*.py" (from the top directory)
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, os.pardir))
+from COACH.framework import tokens
+
+
+SECRET_KEY = "secret"
+
+
+class AuthenticationServiceStub():
+
+    """
+    Stands for the proxy of the AuthenticationService. revoked is the list of revoked tokens it returns, and error, if not None,
+    is raised instead. Each call waits until release is set.
+    """
+
+    def __init__(self):
+        self.revoked = []
+        self.error = None
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_revoked_tokens(self):
+        self.calls += 1
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.revoked
+
+    def get_user_namespace(self):
+        return "http://users#"
+
+
+
+class TestTokens(unittest.TestCase):
+
+    def test_issue_and_decode(self):
+        (token, claims) = tokens.issue_token(SECRET_KEY, "alice", "delegate", 60, "http://cases#1")
+        self.assertEqual(tokens.decode_token(SECRET_KEY, token), claims)
+        self.assertEqual(claims["case"], "http://cases#1")
+
+
+    def test_invalid_tokens(self):
+        (token, _) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        self.assertIsNone(tokens.decode_token("other secret", token))
+        self.assertIsNone(tokens.decode_token(SECRET_KEY, token[:-2]))
+        self.assertIsNone(tokens.decode_token(SECRET_KEY, "not a token"))
+        self.assertIsNone(tokens.decode_token(SECRET_KEY, None))
+        (expired, _) = tokens.issue_token(SECRET_KEY, "alice", "user", -1)
+        self.assertIsNone(tokens.decode_token(SECRET_KEY, expired))
+
+
+    def test_check_tokens(self):
+        verifier = tokens.TokenVerifier(SECRET_KEY, AuthenticationServiceStub())
+        (user_token, _) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        (delegate_token, _) = tokens.issue_token(SECRET_KEY, "alice", "delegate", 60, "http://cases#1")
+        self.assertTrue(verifier.check_user_token("alice", user_token))
+        self.assertFalse(verifier.check_user_token("bob", user_token))
+        self.assertFalse(verifier.check_user_token("alice", delegate_token))
+        self.assertTrue(verifier.check_delegate_token("alice", delegate_token, "http://cases#1"))
+        self.assertFalse(verifier.check_delegate_token("alice", delegate_token, "http://cases#2"))
+        self.assertTrue(verifier.check_token("alice", user_token, "http://cases#2"))
+        self.assertEqual(verifier.user_uri("alice"), "http://users#alice")
+
+
+    def test_revocation(self):
+        service = AuthenticationServiceStub()
+        verifier = tokens.TokenVerifier(SECRET_KEY, service, revocation_poll_interval = 1000)
+        (token, claims) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        self.assertTrue(verifier.check_user_token("alice", token))
+        # The list is not fetched again before the poll interval
+        service.revoked = [(claims["jti"], claims["exp"])]
+        self.assertTrue(verifier.check_user_token("alice", token))
+        self.assertEqual(service.calls, 1)
+        verifier.refresh_revocations(force = True)
+        self.assertFalse(verifier.check_user_token("alice", token))
+
+
+    def test_failed_fetch_keeps_list(self):
+        service = AuthenticationServiceStub()
+        verifier = tokens.TokenVerifier(SECRET_KEY, service, revocation_poll_interval = 1000)
+        (token, claims) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        service.revoked = [(claims["jti"], claims["exp"])]
+        verifier.refresh_revocations()
+        service.error = RuntimeError("AuthenticationService is down")
+        with self.assertLogs(tokens.logger, "ERROR"):
+            verifier.refresh_revocations(force = True)
+        self.assertFalse(verifier.check_user_token("alice", token))
+
+
+    def test_failed_fetch_is_retried(self):
+        service = AuthenticationServiceStub()
+        service.error = RuntimeError("AuthenticationService is down")
+        verifier = tokens.TokenVerifier(SECRET_KEY, service, revocation_poll_interval = 1000)
+        (token, claims) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        with self.assertLogs(tokens.logger, "ERROR"):
+            self.assertTrue(verifier.check_user_token("alice", token))
+        # The poll time is not advanced by a failed fetch, so the next call tries again
+        service.error = None
+        service.revoked = [(claims["jti"], claims["exp"])]
+        self.assertFalse(verifier.check_user_token("alice", token))
+        self.assertEqual(service.calls, 2)
+
+
+    def test_slow_fetch_does_not_block(self):
+        service = AuthenticationServiceStub()
+        verifier = tokens.TokenVerifier(SECRET_KEY, service, revocation_poll_interval = 0)
+        (token, _) = tokens.issue_token(SECRET_KEY, "alice", "user", 60)
+        service.release.clear()
+        fetching = threading.Thread(target = verifier.refresh_revocations)
+        fetching.start()
+        while service.calls == 0:
+            time.sleep(0.01)
+        # While a fetch is in progress, the other threads use the current list
+        start = time.time()
+        self.assertTrue(verifier.check_user_token("alice", token))
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(service.calls, 1)
+        service.release.set()
+        fetching.join()
+
+
+if __name__ == '__main__':
+    unittest.main()